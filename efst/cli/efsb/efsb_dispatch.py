@@ -12,8 +12,9 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
+import os, sys, time, hashlib
 from efst.cli.efst.efst_dispatch import EFSTDispatcher
-from efst.encfs.encfs_handler import EncFSHandler
+from efst.cli.efst.checks.chk_encfs import check_encfs_installed
 from efst.cli.efsb.efsb_options import EFSBOptionsParser, EFSBCommands
 from efst.config.efst_config import config_handler, EntryTypes
 from efst.utils.efst_utils import PasswordHandler, get_last_digit
@@ -32,11 +33,25 @@ class EFSBDispatcher(EFSTDispatcher):
             args = self.option_parser.parse_options()
 
             if args['sub_cmd'] == EFSBCommands.SHOW:
+                check_encfs_installed()
                 self.show_info(args)
             elif args['sub_cmd'] == EFSBCommands.ENCODE:
+                check_encfs_installed()
                 self.encode(args)
             elif args['sub_cmd'] == EFSBCommands.DECODE:
+                check_encfs_installed()
                 self.decode(args)
+            elif args['sub_cmd'] == EFSBCommands.LS:
+                check_encfs_installed()
+                self.list_backend(args)
+            elif args['sub_cmd'] == EFSBCommands.INDEX:
+                check_encfs_installed()
+                self.index_backend(args)
+            elif args['sub_cmd'] == EFSBCommands.LOCATE:
+                self.locate(args)
+            elif args['sub_cmd'] == EFSBCommands.CRUFT:
+                check_encfs_installed()
+                self.scan_cruft(args)
             else:
                 print('Nothing to dispatch')
                 return False
@@ -45,6 +60,7 @@ class EFSBDispatcher(EFSTDispatcher):
 
     # Dispatched methods
     def show_info(self, args):
+        from efst.encfs.encfs_handler import EncFSHandler
         entry = config_handler.entry(args['entry_name'])
         if entry:
             if entry.entry_type == EntryTypes.CipherText:
@@ -95,7 +111,8 @@ class EFSBDispatcher(EFSTDispatcher):
                     cruft_info = EncFSHandler.cruft_info(encfs_dir_path = entry.encfs_dir_path,
                                                                 pwd = pwd,
                                                                 enc_cfg_path = entry.encfs_config_path,
-                                                                target_cruft_path = args['cruft_file'])
+                                                                target_cruft_path = args['cruft_file'],
+                                                                state_path = self._cruft_scan_path(entry, 'state'))
                     if cruft_info:
                         if new_pwd:
                             # pwd confirmed, offer to store in keychain
@@ -113,9 +130,15 @@ class EFSBDispatcher(EFSTDispatcher):
                             print('\tUse the <-cf, --cruft-file> parameter to store detailed cruft info to a file')
 
     def encode(self, args):
+        from efst.encfs.encfs_handler import EncFSHandler
         entry = config_handler.entry(args['entry_name'])
         if entry:
-            pwd, new_pwd = PasswordHandler.get_pwd(entry.pwd_entry)
+            pwd, new_pwd = self._get_pwd(entry)
+            if args['input_file']:
+                self._translate_names(EncFSHandler.encode_many, entry, pwd, new_pwd, args['input_file'])
+                self._print_cache_stats(args)
+                return
+
             encoded = EncFSHandler.encode(encfs_dir_path = entry.encfs_dir_path,
                                                         enc_cfg_path = entry.encfs_config_path,
                                                                 filename = args['file_entry_name'], pwd = pwd)
@@ -125,12 +148,19 @@ class EFSBDispatcher(EFSTDispatcher):
 
                 # Print the encoded name
                 print('Encoded: {}'.format(encoded))
+            self._print_cache_stats(args)
 
 
     def decode(self, args):
+        from efst.encfs.encfs_handler import EncFSHandler
         entry = config_handler.entry(args['entry_name'])
         if entry:
-            pwd, new_pwd = PasswordHandler.get_pwd(entry.pwd_entry)
+            pwd, new_pwd = self._get_pwd(entry)
+            if args['input_file']:
+                self._translate_names(EncFSHandler.decode_many, entry, pwd, new_pwd, args['input_file'])
+                self._print_cache_stats(args)
+                return
+
             decoded = EncFSHandler.decode(encfs_dir_path = entry.encfs_dir_path,
                                                         enc_cfg_path = entry.encfs_config_path,
                                                                 filename = args['file_entry_name'], pwd = pwd)
@@ -140,6 +170,189 @@ class EFSBDispatcher(EFSTDispatcher):
 
                 # Print the decoded name
                 print('Decoded: {}'.format(decoded))
+            self._print_cache_stats(args)
+
+    def list_backend(self, args):
+        from efst.encfs.encfs_handler import EncFSHandler
+        from efst.encfs.encfs_codec import EncFSCodecError
+        entry = config_handler.entry(args['entry_name'])
+        if entry:
+            pwd, new_pwd = self._get_pwd(entry)
+            entries_cnt = failed_cnt = 0
+            try:
+                for backend_path, translated_path, is_dir in EncFSHandler.backend_tree(
+                                                            encfs_dir_path = entry.encfs_dir_path,
+                                                            enc_cfg_path = entry.encfs_config_path,
+                                                            pwd = pwd, workers = args['workers'],
+                                                            reverse = entry.entry_type == EntryTypes.ReversedCipherText):
+                    entries_cnt += 1
+                    dir_tr = lambda path: '{}{}'.format(path, os.sep) if is_dir else path
+                    if translated_path:
+                        print('{0}\t{1}'.format(dir_tr(backend_path), dir_tr(translated_path)), flush = True)
+                    else:
+                        failed_cnt += 1
+                        print('Could not translate: {}'.format(dir_tr(backend_path)), flush = True)
+            except EncFSCodecError as e:
+                print('Error while listing the backend: {}'.format(e.args[0]))
+                return
+
+            print('Listed {0} entries, {1} un-translatable'.format(entries_cnt, failed_cnt))
+            self._print_cache_stats(args)
+            if new_pwd and entries_cnt > failed_cnt:
+                # pwd confirmed, offer to store in keychain
+                self._store_pwd(pwd, entry.pwd_entry)
+
+    def index_backend(self, args):
+        entry = config_handler.entry(args['entry_name'])
+        if entry:
+            pwd, new_pwd = self._get_pwd(entry)
+            stats = self._entry_index(entry).refresh(pwd = pwd, full = args['full_rebuild'],
+                                                                        workers = args['workers'])
+            if stats:
+                print('Indexed {0} entries ({1} added, {2} removed)'.format(stats.entries, stats.added, stats.removed))
+                print('Scanned {0} of {1} directories in {2:.2f}s'.format(stats.scanned_dirs,
+                                                                        stats.total_dirs, stats.elapsed))
+                if new_pwd and stats.added:
+                    # pwd confirmed, offer to store in keychain
+                    self._store_pwd(pwd, entry.pwd_entry)
+
+    def locate(self, args):
+        entry = config_handler.entry(args['entry_name'])
+        if entry:
+            entry_index = self._entry_index(entry)
+            if not entry_index.exists:
+                print('No index found for "{0}", use "efsb {1}" to build one'.format(args['entry_name'],
+                                                                                        EFSBCommands.INDEX))
+                return
+            for index_entry in entry_index.locate(args['pattern'], ignore_case = args['ignore_case'],
+                                                                                limit = args['limit']):
+                dir_tr = lambda path: '{}{}'.format(path, os.sep) if index_entry.is_dir else path
+                if args['cipher_paths']:
+                    print('{0}\t{1}'.format(dir_tr(index_entry.plain_path), dir_tr(index_entry.cipher_path)))
+                else:
+                    print(dir_tr(index_entry.plain_path))
+
+    def scan_cruft(self, args):
+        from efst.encfs.encfs_handler import EncFSHandler
+        from efst.encfs.encfs_codec import EncFSCodecError
+        entry = config_handler.entry(args['entry_name'])
+        if entry:
+            pwd, new_pwd = self._get_pwd(entry)
+            checkpoint_path = self._cruft_scan_path(entry, 'checkpoint')
+            if args['restart'] and os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+            resuming = os.path.exists(checkpoint_path)
+            state_path = self._cruft_scan_path(entry, 'state')
+            if args['full_scan'] and os.path.exists(state_path):
+                os.remove(state_path)
+
+            # progress goes to stderr, so that the cruft list could be piped on
+            show_progress = sys.stderr.isatty()
+            last_progress, last_scan, progress_tr = 0, None, lambda progress: \
+                        '\rScanned {0} directories ({1} unchanged, {2} pending), {3} entries, {4} un-decodable'.format(
+                                progress.resumed_dirs + progress.unchanged_dirs + progress.scanned_dirs,
+                                    progress.unchanged_dirs, progress.pending_dirs,
+                                                            progress.scanned_entries, progress.cruft_entries)
+            def report_progress(progress):
+                nonlocal last_progress, last_scan
+                last_scan = progress
+                if show_progress and time.time() - last_progress > 0.2:
+                    last_progress = time.time()
+                    print(progress_tr(progress), end = '', file = sys.stderr, flush = True)
+
+            cruft_cnt = 0
+            cruft_file = open(args['cruft_file'], 'a' if resuming else 'w',
+                                                encoding = 'utf-8') if args['cruft_file'] else None
+            try:
+                if resuming:
+                    print('Resuming an interrupted scan', file = sys.stderr)
+                for cruft_path, is_dir in EncFSHandler.scan_cruft(
+                                                        encfs_dir_path = entry.encfs_dir_path,
+                                                        enc_cfg_path = entry.encfs_config_path,
+                                                        pwd = pwd, workers = args['workers'],
+                                                        reverse = entry.entry_type == EntryTypes.ReversedCipherText,
+                                                        checkpoint_path = checkpoint_path,
+                                                        state_path = state_path,
+                                                        progress = report_progress):
+                    cruft_cnt += 1
+                    cruft_path = '{}{}'.format(cruft_path, os.sep) if is_dir else cruft_path
+                    if show_progress:
+                        # clear the progress line
+                        print('\r\033[K', end = '', file = sys.stderr, flush = True)
+                    print(cruft_path, flush = True)
+                    if cruft_file:
+                        cruft_file.write('{}\n'.format(cruft_path))
+                        cruft_file.flush()
+            except EncFSCodecError as e:
+                print('Error while scanning for cruft: {}'.format(e.args[0]))
+                return
+            except KeyboardInterrupt:
+                print('\nInterrupted, run the same command again to resume', file = sys.stderr)
+                return
+            finally:
+                if cruft_file:
+                    cruft_file.close()
+
+            if show_progress:
+                print('\r\033[K', end = '', file = sys.stderr, flush = True)
+            print('Found {0} un-decodable entries{1}'.format(cruft_cnt, ' since resuming' if resuming else ''))
+            if last_scan and last_scan.unchanged_dirs:
+                print('Re-scanned {0} changed directories, {1} unchanged ones skipped'.format(
+                                                                last_scan.scanned_dirs, last_scan.unchanged_dirs))
+            if args['cruft_file'] and cruft_cnt:
+                print('Cruft info stored to {}'.format(args['cruft_file']))
+            if new_pwd and last_scan and last_scan.scanned_entries > last_scan.cruft_entries:
+                # pwd confirmed, offer to store in keychain
+                self._store_pwd(pwd, entry.pwd_entry)
+
+    # Internal helpers
+    @staticmethod
+    def _cruft_scan_path(entry, kind):
+        ''' Per-entry cruft scan checkpoint / state path
+        '''
+        backend_digest = hashlib.sha256(os.path.realpath(entry.encfs_dir_path).encode('utf-8')).hexdigest()
+        return os.path.join(config_handler.os_config.efst_cache_dir_path,
+                                                    'cruft-{0}.{1}'.format(backend_digest[:32], kind))
+
+    @staticmethod
+    def _entry_index(entry):
+        from efst.encfs.encfs_index import EncFSIndex
+        return EncFSIndex(config_handler.os_config.efst_index_dir_path,
+                            encfs_dir_path = entry.encfs_dir_path, enc_cfg_path = entry.encfs_config_path,
+                                            reverse = entry.entry_type == EntryTypes.ReversedCipherText)
+
+    @staticmethod
+    def _print_cache_stats(args):
+        from efst.encfs.encfs_handler import EncFSHandler
+        if args['cache_stats']:
+            stats = EncFSHandler.name_cache_stats()
+            if stats:
+                print('Name cache: {0} hits, {1} misses, {2} / {3} entries'.format(*stats))
+            else:
+                print('Name cache: not used')
+
+    def _translate_names(self, translate_many, entry, pwd, new_pwd, input_file):
+        ''' Streams names from an input file (or stdin) through a batch encode / decode,
+            printing tab-separated source / translated name pairs
+        '''
+        from_stdin = (input_file == EFSBOptionsParser.STDIN_SYMBOL)
+        with (open(sys.stdin.fileno(), encoding = 'utf-8', closefd = False) if from_stdin
+                                                    else open(input_file, encoding = 'utf-8')) as names_file:
+            names = (line.rstrip('\r\n') for line in names_file if line.strip())
+            translated_cnt = 0
+            for name, translated in translate_many(encfs_dir_path = entry.encfs_dir_path,
+                                                        enc_cfg_path = entry.encfs_config_path,
+                                                                filenames = names, pwd = pwd):
+                if translated:
+                    translated_cnt += 1
+                    print('{0}\t{1}'.format(name, translated), flush = True)
+                else:
+                    print('Could not translate: {}'.format(name), flush = True)
+
+        # pwd confirmed, offer to store in keychain
+        # (not possible when the names were piped in via stdin)
+        if translated_cnt and new_pwd and not from_stdin:
+            self._store_pwd(pwd, entry.pwd_entry)
 
 
 def main():
@@ -12,7 +12,7 @@
 ## GNU General Public License for more details.
 
 import os
-from efst.cli.efst.efst_options import EFSTOptionsParser, EFSTHelpFormatter, EFSTCommands
+from efst.cli.efst.efst_options import EFSTOptionsParser, EFSTCommandParser, EFSTHelpFormatter, EFSTCommands
 from efst.encfs.encfs_cfg import EncFSCFG
 from efst.encfs.encfs_cfg import EncFSCipherAlg, EncFSNameAlg
 from efst.config.efst_config import config_handler
@@ -21,19 +21,29 @@ from efst.utils.efst_utils import UniquePartialMatchList, FSHelper
 class EFSBCommands(EFSTCommands):
     ENCODE = 'encode'
     DECODE = 'decode'
+    LS = 'ls'
+    INDEX = 'index'
+    LOCATE = 'locate'
+    CRUFT = 'cruft'
 
     @classmethod
     def commands_meta(cls):
         return ''.join(('{',
                         '{},'.format(cls.SHOW),
                         ' {},'.format(cls.ENCODE),
-                        ' {}'.format(cls.DECODE),
+                        ' {},'.format(cls.DECODE),
+                        ' {},'.format(cls.LS),
+                        ' {},'.format(cls.INDEX),
+                        ' {},'.format(cls.LOCATE),
+                        ' {}'.format(cls.CRUFT),
                         '}'))
 
 
 class EFSBOptionsParser(EFSTOptionsParser):
     ''' EFSB Options Parser
     '''
+    STDIN_SYMBOL = '-'
+
     def __init__(self):
         self._script_name = 'EFSB'
         self._description = \
@@ -52,14 +62,61 @@ class EFSBOptionsParser(EFSTOptionsParser):
         ''' Commands parsing
         '''
         subparsers = parser.add_subparsers(dest = 'sub_cmd', title = 'EFSB commands',
-                                                                            metavar = EFSBCommands.commands_meta())
+                                                                            metavar = EFSBCommands.commands_meta(),
+                                                                                parser_class = EFSTCommandParser)
         self._add_version(subparsers)
         self._add_info(subparsers)
 
         # Show
-        show_parser = subparsers.add_parser(EFSBCommands.SHOW,
+        subparsers.add_parser(EFSBCommands.SHOW,
                                    description = 'Shows info about a registered EncFS entry backend store',
-                                             formatter_class=EFSTHelpFormatter)
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_show_args)
+
+        # Decode
+        subparsers.add_parser(EFSBCommands.DECODE,
+                                   description = 'Decodes a file entry name to its PlainText version',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_decode_args)
+
+        # Encode
+        subparsers.add_parser(EFSBCommands.ENCODE,
+                                   description = 'Encodes a file entry name to its CipherText version',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_encode_args)
+
+        # Ls
+        subparsers.add_parser(EFSBCommands.LS,
+                                   description = 'Lists a registered EncFS entry backend store, ' \
+                                                 'showing the translated names of all its file entries',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_ls_args)
+
+        # Index
+        subparsers.add_parser(EFSBCommands.INDEX,
+                                   description = 'Builds or incrementally refreshes a searchable index ' \
+                                                 'of a registered EncFS entry backend store paths',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_index_args)
+
+        # Locate
+        subparsers.add_parser(EFSBCommands.LOCATE,
+                                   description = 'Finds PlainText paths in a registered EncFS entry backend store, ' \
+                                                 'using its index built with the "{}" command'.format(EFSBCommands.INDEX),
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_locate_args)
+
+        # Cruft
+        subparsers.add_parser(EFSBCommands.CRUFT,
+                                   description = 'Scans a registered EncFS entry backend store for un-decodable ' \
+                                                 'file entry names, showing them as they are found. ' \
+                                                 'Only directories changed since the previous scan are re-scanned, ' \
+                                                 'and an interrupted scan resumes from where it stopped',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_cruft_args)
+
+    # Commands arguments
+    def _add_show_args(self, show_parser):
         required_args_group = show_parser.add_argument_group('Required Arguments')
         self._add_entry_name(required_args_group, registered_only = True, help = "Name of a registered EFST entry")
 
@@ -74,22 +131,81 @@ class EFSBOptionsParser(EFSTOptionsParser):
                     type = lambda fpath: FSHelper.full_path(fpath, check_parent_path = True),
                     help = 'Stores detailed cruft info into a file at specified path')
 
-        # Decode
-        decode_parser = subparsers.add_parser(EFSBCommands.DECODE,
-                                   description = 'Decodes a file entry name to its PlainText version',
-                                             formatter_class=EFSTHelpFormatter)
+    def _add_decode_args(self, decode_parser):
         required_args_group = decode_parser.add_argument_group('Required Arguments')
         self._add_entry_name(required_args_group, registered_only = True, help = "Name of a registered EFST entry")
-        self._add_file_entry_name(required_args_group, help = '(File entry) name to decode')
+        self._add_file_entry_name(required_args_group, help = '(File entry) name to decode',
+                                        input_file_help = 'Path to a file with names to decode, one per line. '
+                                                'Use "-" to read the names from stdin')
 
-        # Encode
-        encode_parser = subparsers.add_parser(EFSBCommands.ENCODE,
-                                   description = 'Encodes a file entry name to its CipherText version',
-                                             formatter_class=EFSTHelpFormatter)
+        advanced_args_group = decode_parser.add_argument_group('Advanced Arguments')
+        self._add_cache_stats(advanced_args_group)
+
+    def _add_encode_args(self, encode_parser):
         required_args_group = encode_parser.add_argument_group('Required Arguments')
         self._add_entry_name(required_args_group, registered_only = True, help = "Name of a registered EFST entry")
-        self._add_file_entry_name(required_args_group, help = '(File entry) name to encode')
+        self._add_file_entry_name(required_args_group, help = '(File entry) name to encode',
+                                        input_file_help = 'Path to a file with names to encode, one per line. '
+                                                'Use "-" to read the names from stdin')
+
+        advanced_args_group = encode_parser.add_argument_group('Advanced Arguments')
+        self._add_cache_stats(advanced_args_group)
+
+    def _add_ls_args(self, ls_parser):
+        required_args_group = ls_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True, help = "Name of a registered EFST entry")
+
+        advanced_args_group = ls_parser.add_argument_group('Advanced Arguments')
+        self._add_workers(advanced_args_group, help = 'Number of directories processed in parallel, ' \
+                                                            'defaults to the number of CPUs')
+        self._add_cache_stats(advanced_args_group)
+
+    def _add_index_args(self, index_parser):
+        required_args_group = index_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True, help = "Name of a registered EFST entry")
+
+        advanced_args_group = index_parser.add_argument_group('Advanced Arguments')
+        self._add_workers(advanced_args_group, help = 'Number of directories processed in parallel, ' \
+                                                            'defaults to the number of CPUs')
+        advanced_args_group.add_argument('-fr', '--full-rebuild', dest = 'full_rebuild',
+                    help = 'Re-builds the index from scratch, instead of only re-scanning changed directories',
+                    action = 'store_true')
+
+    def _add_locate_args(self, locate_parser):
+        locate_parser.add_argument('pattern',
+                    type = str,
+                    help = 'A part of the path to find, or a shell-style pattern (e.g. "*/photos/*.jpg")')
+        required_args_group = locate_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True, help = "Name of a registered EFST entry")
+
+        advanced_args_group = locate_parser.add_argument_group('Advanced Arguments')
+        advanced_args_group.add_argument('-ic', '--ignore-case', dest = 'ignore_case',
+                    help = 'Case-insensitive matching',
+                    action = 'store_true')
+        advanced_args_group.add_argument('-cp', '--cipher-paths', dest = 'cipher_paths',
+                    help = 'Also shows the matching CipherText paths',
+                    action = 'store_true')
+        advanced_args_group.add_argument('-lm', '--limit', dest = 'limit',
+                    type = int,
+                    default = None,
+                    help = 'Maximum number of paths to show')
+
+    def _add_cruft_args(self, cruft_parser):
+        required_args_group = cruft_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True, help = "Name of a registered EFST entry")
 
+        advanced_args_group = cruft_parser.add_argument_group('Advanced Arguments')
+        advanced_args_group.add_argument("-cf", "--cruft-file", dest='cruft_file',
+                    type = lambda fpath: FSHelper.full_path(fpath, check_parent_path = True),
+                    help = 'Also stores the un-decodable file entry names into a file at specified path')
+        self._add_workers(advanced_args_group, help = 'Number of directories processed in parallel, ' \
+                                                            'defaults to the number of CPUs')
+        advanced_args_group.add_argument('-rs', '--restart', dest = 'restart',
+                    help = 'Starts the scan over, ignoring any previously interrupted one',
+                    action = 'store_true')
+        advanced_args_group.add_argument('-fs', '--full-scan', dest = 'full_scan',
+                    help = 'Re-scans all directories, instead of only the ones changed since the previous scan',
+                    action = 'store_true')
 
     # Options checking
     def _check_cmd_args(self, args, parser):
@@ -98,10 +214,16 @@ class EFSBOptionsParser(EFSTOptionsParser):
         super()._check_cmd_args(args, parser)
 
         # Registered Entry name could be a partial match, need to expand
-        if args['sub_cmd'] in (EFSBCommands.SHOW, EFSBCommands.ENCODE, EFSBCommands.DECODE):
+        if args['sub_cmd'] in (EFSBCommands.SHOW, EFSBCommands.ENCODE, EFSBCommands.DECODE, EFSBCommands.LS,
+                                                            EFSBCommands.INDEX, EFSBCommands.LOCATE, EFSBCommands.CRUFT):
             args['entry_name'] = UniquePartialMatchList(
                                     config_handler.registered_entries()).find(args['entry_name'])
 
+        if args['sub_cmd'] in (EFSBCommands.ENCODE, EFSBCommands.DECODE):
+            # names input file
+            if args['input_file'] and args['input_file'] != self.STDIN_SYMBOL:
+                self._is_valid_file_path(parser, args['input_file'])
+
     @property
     def _default_command(self):
         ''' Default to showing help
@@ -109,9 +231,18 @@ class EFSBOptionsParser(EFSTOptionsParser):
         return None
 
     # Helpers
-    @staticmethod
-    def _add_file_entry_name(parser, help = 'Name of file entry'):
-        parser.add_argument('-fn', '--file-entry-name', dest = 'file_entry_name',
+    @classmethod
+    def _add_file_entry_name(cls, parser, help = 'Name of file entry', input_file_help = 'Path to file with names'):
+        names_group = parser.add_mutually_exclusive_group(required = True)
+        names_group.add_argument('-fn', '--file-entry-name', dest = 'file_entry_name',
                         type = str,
-                        required = True,
                         help = help)
+        names_group.add_argument('-if', '--input-file', dest = 'input_file',
+                        type = lambda fpath: fpath if fpath == cls.STDIN_SYMBOL else FSHelper.full_path(fpath),
+                        help = input_file_help)
+
+    @staticmethod
+    def _add_cache_stats(parser):
+        parser.add_argument('-ns', '--cache-stats', dest = 'cache_stats',
+                        help = 'Shows the names cache statistics',
+                        action = 'store_true')
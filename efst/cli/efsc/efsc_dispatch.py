@@ -12,10 +12,14 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
+import json
+from collections import OrderedDict
 from efst.cli.efst.efst_dispatch import EFSTDispatcher
+from efst.cli.efst.checks.chk_encfs import check_encfs_installed
 from efst.cli.efsc.efsc_options import EFSCOptionsParser, EFSCCommands
 from efst.config.efst_config import config_handler
 from efst.encfs.encfs_cfg import EncFSCipherAlg, EncFSNameAlg, EncFSCFG
+from efst.utils.efst_utils import CmdProcessingError, temp_dir
 
 
 class EFSCDispatcher(EFSTDispatcher):
@@ -30,6 +34,7 @@ class EFSCDispatcher(EFSTDispatcher):
             args = self.option_parser.parse_options()
 
             if args['sub_cmd'] == EFSCCommands.CREATE_KEY:
+                check_encfs_installed()
                 self.create_key(args)
 
             elif args['sub_cmd'] == EFSCCommands.SHOW:
@@ -41,6 +46,16 @@ class EFSCDispatcher(EFSTDispatcher):
             elif args['sub_cmd'] == EFSCCommands.UNREGISTER:
                 self.unregister_cfg_entry(args)
 
+            elif args['sub_cmd'] == EFSCCommands.CALIBRATE:
+                self.calibrate_cfg_entry(args)
+
+            elif args['sub_cmd'] == EFSCCommands.BENCH:
+                check_encfs_installed()
+                self.bench_cfg_entries(args)
+
+            elif args['sub_cmd'] == EFSCCommands.ADVISE:
+                self.advise_cfg_entry(args)
+
             else:
                 print('Nothing to dispatch')
                 return False
@@ -49,6 +64,7 @@ class EFSCDispatcher(EFSTDispatcher):
 
     # Dispatched methods
     def show_cfg_entry(self, args):
+        from efst.encfs.encfs_keygen import EncFSKeyGenerator
         entry = config_handler.encfs_cfg_entry(args['config_entry'])
         enable_tr = lambda letter: 'Enabled' if letter.lower() == 'y' else 'Disabled'
         print('Entry name: {}'.format(args['config_entry']))
@@ -61,6 +77,10 @@ class EFSCDispatcher(EFSTDispatcher):
         print('   Block authentication code headers: {}'.format(enable_tr(entry.blockMACBytes)))
         print('   Add random bytes to each block header: {}'.format(entry.blockMACRandBytes))
         print('   File-hole pass-through: {}'.format(enable_tr(entry.allowHoles)))
+        if entry.kdfIterations:
+            print('   Key derivation: {0} PBKDF2 iterations (~{1} ms)'.format(entry.kdfIterations, entry.kdfDuration))
+        else:
+            print('   Key derivation: calibrated on key creation (~{} ms)'.format(EncFSKeyGenerator.DEFAULT_KDF_DURATION))
 
     def register_cfg_entry(self, args):
         entry_tr = lambda bool_value: 'y' if bool_value else 'n'
@@ -78,11 +98,147 @@ class EFSCDispatcher(EFSTDispatcher):
         config_handler.register_encfs_cfg_entry(args['config_entry'], entry_conf)
 
 
+    def calibrate_cfg_entry(self, args):
+        from efst.encfs.encfs_keygen import EncFSKeyGenerator
+        from efst.encfs.encfs_codec import EncFSCodecNotSupported
+        entry = config_handler.encfs_cfg_entry(args['config_entry'])
+        print('Benchmarking PBKDF2 key derivation for: {}'.format(args['config_entry']))
+        try:
+            calibration = EncFSKeyGenerator.calibrate_kdf(entry, args['target_latency'])
+        except EncFSCodecNotSupported as e:
+            print(e.args[0])
+            return
+        print('   Rate: {:,.0f} iterations/s'.format(calibration.rate))
+        print('   Target unlock latency: {} ms'.format(calibration.kdf_duration))
+        print('   Proposed: {:,} PBKDF2 iterations'.format(calibration.kdf_iterations))
+        if entry.kdfIterations:
+            print('   Currently stored: {:,} PBKDF2 iterations'.format(int(entry.kdfIterations)))
+
+        if not args['dry_run']:
+            config_handler.set_encfs_cfg_entry_kdf(args['config_entry'],
+                                                        calibration.kdf_iterations, calibration.kdf_duration)
+
+    def bench_cfg_entries(self, args):
+        from efst.encfs.encfs_handler import EncFSHandler
+        from efst.utils.efst_bench import FSBenchmark
+        bench = lambda dir_path: FSBenchmark(dir_path, file_size_mb = args['file_size'],
+                                        small_files = args['file_count'], random_reads = args['random_reads']).run()
+        results = OrderedDict()
+        if args['baseline']:
+            print('Benchmarking: plain folder', flush = True)
+            with temp_dir(dir = args['work_dir']) as plain_dir:
+                results[self.BENCH_BASELINE] = bench(plain_dir)
+        for cfg_entry_name in args['config_entries']:
+            print('Benchmarking: {}'.format(cfg_entry_name), flush = True)
+            try:
+                with EncFSHandler.throwaway_volume(config_handler.encfs_cfg_entry(cfg_entry_name),
+                                            work_dir = args['work_dir'], timeout = args['timeout']) as mount_dir:
+                    results[cfg_entry_name] = bench(mount_dir)
+            except (CmdProcessingError, OSError) as e:
+                print('   {}'.format(e))
+        if not results:
+            return
+
+        metrics = OrderedDict((name, OrderedDict((result.workload, FSBenchmark.metrics(result))
+                                                        for result in workload_results))
+                                                                for name, workload_results in results.items())
+        print()
+        self._print_bench_table(metrics)
+
+        if args['output']:
+            report = OrderedDict([('params', OrderedDict([('file_size_mb', args['file_size']),
+                                                        ('file_count', args['file_count']),
+                                                        ('random_reads', args['random_reads']),
+                                                        ('read_size', FSBenchmark.READ_SIZE)])),
+                                  ('config_entries', OrderedDict((name, config_handler.encfs_cfg_entry(name)._asdict())
+                                                                    for name in metrics if name != self.BENCH_BASELINE)),
+                                  ('results', metrics)])
+            with open(args['output'], 'w') as output_file:
+                json.dump(report, output_file, indent = 2)
+            print('\nResults written to: {}'.format(args['output']))
+
+    def advise_cfg_entry(self, args):
+        from efst.encfs.encfs_advisor import EncFSBlockAdvisor
+        base_entry = config_handler.encfs_cfg_entry(args['base_entry'])
+        print('Sampling: {}'.format(args['target_path']), flush = True)
+        tree_sample = EncFSBlockAdvisor.sample_tree(args['target_path'], backend_path = args['backend_path'],
+                                                                            sample_size = args['sample_size'])
+        if not tree_sample.files:
+            print('   No files found')
+            return
+        access_pattern = args['access_pattern']
+        if access_pattern not in EncFSBlockAdvisor.ACCESS_PATTERNS:
+            access_pattern = EncFSBlockAdvisor.access_pattern(tree_sample)
+        print('   Files: {0:,} ({1:,} sampled), {2}'.format(tree_sample.files, len(tree_sample.sizes),
+                                                                        self._size_desc(tree_sample.total_size)))
+        print('   File sizes: p50 {0}, p90 {1}, p99 {2}'.format(*(self._size_desc(
+                        EncFSBlockAdvisor.size_percentile(tree_sample, percentile)) for percentile in (50, 90, 99))))
+        print('   Backing file system block size: {} bytes'.format(tree_sample.fs_block_size))
+        print('   Access pattern: {}'.format(access_pattern))
+
+        block_mac = {'on': True, 'off': False}.get(args['block_headers'])
+        candidates = EncFSBlockAdvisor.candidates(tree_sample, base_entry,
+                                                        access_pattern = access_pattern, block_mac = block_mac)
+        recommended = EncFSBlockAdvisor.recommend(candidates)
+        print()
+        self._print_advise_table(candidates, recommended)
+        print('\nRecommended: block size {0}, block authentication headers {1}'.format(recommended.block_size,
+                                                                    'enabled' if recommended.block_mac else 'disabled'))
+
+        if args['config_entry']:
+            entry_conf = base_entry._replace(blockSize = recommended.block_size,
+                                                    blockMACBytes = 'y' if recommended.block_mac else 'n')
+            config_handler.register_encfs_cfg_entry(args['config_entry'], entry_conf)
+
     def unregister_cfg_entry(self, args):
         config_handler.unregister_encfs_cfg_entry(args['config_entry'])
 
 
 
+    # Helpers
+    BENCH_BASELINE = 'plain'
+
+    @staticmethod
+    def _print_bench_table(metrics):
+        ''' Prints out the benchmark metrics, a row per metric and a column per config entry
+        '''
+        from efst.utils.efst_bench import FSBenchmark
+        bench_columns = ((FSBenchmark.SEQ_WRITE, 'mb_s', 'MB/s'), (FSBenchmark.SEQ_READ, 'mb_s', 'MB/s'),
+                         (FSBenchmark.RANDOM_READ, 'ops_s', 'ops/s'), (FSBenchmark.RANDOM_READ, 'p50_ms', 'p50 ms'),
+                         (FSBenchmark.RANDOM_READ, 'p99_ms', 'p99 ms'),
+                         (FSBenchmark.FILE_CREATE, 'ops_s', 'ops/s'), (FSBenchmark.FILE_CREATE, 'p99_ms', 'p99 ms'),
+                         (FSBenchmark.FILE_STAT, 'ops_s', 'ops/s'), (FSBenchmark.FILE_DELETE, 'ops_s', 'ops/s'))
+        rows = [['Workload', 'Metric'] + list(metrics)]
+        for workload, metric, metric_desc in bench_columns:
+            rows.append([workload, metric_desc] + ['{}'.format(entry_metrics[workload][metric])
+                                                                    for entry_metrics in metrics.values()])
+        widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+        for row in rows:
+            print('   {}'.format('  '.join('{0:{1}{2}}'.format(value, '<' if column < 2 else '>', width)
+                                                    for column, (value, width) in enumerate(zip(row, widths)))))
+
+
+    @staticmethod
+    def _print_advise_table(candidates, recommended):
+        ''' Prints out the block size candidates, best first
+        '''
+        rows = [['', 'Block Size', 'Block MAC', 'Storage Overhead', 'Seq. Throughput', 'Random Throughput']]
+        for candidate in candidates:
+            rows.append(['*' if candidate == recommended else '', '{}'.format(candidate.block_size),
+                         'on' if candidate.block_mac else 'off', '{:.2%}'.format(candidate.storage_overhead),
+                         '{:.0%}'.format(candidate.seq_throughput), '{:.0%}'.format(candidate.random_throughput)])
+        widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+        for row in rows:
+            print('   {}'.format('  '.join('{0:>{1}}'.format(value, width) for value, width in zip(row, widths))))
+
+    @staticmethod
+    def _size_desc(size):
+        for unit in ('bytes', 'KB', 'MB', 'GB'):
+            if size < 1024 or unit == 'GB':
+                return '{0:,.0f} {1}'.format(size, unit) if unit == 'bytes' else '{0:,.1f} {1}'.format(size, unit)
+            size /= 1024
+
+
 def main():
     EFSCDispatcher().dispatch()
 
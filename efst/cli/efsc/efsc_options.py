@@ -12,14 +12,18 @@
 ## GNU General Public License for more details.
 
 import os
-from efst.cli.efst.efst_options import EFSTOptionsParser, EFSTHelpFormatter, EFSTCommands
+from collections import OrderedDict
+from efst.cli.efst.efst_options import EFSTOptionsParser, EFSTCommandParser, EFSTHelpFormatter, EFSTCommands
 from efst.encfs.encfs_cfg import EncFSCFG
 from efst.encfs.encfs_cfg import EncFSCipherAlg, EncFSNameAlg
-from efst.config.efst_config import config_handler
-from efst.utils.efst_utils import UniquePartialMatchList
+from efst.config.efst_config import config_handler, CmdTimeouts
+from efst.utils.efst_utils import FSHelper, UniquePartialMatchList
 
 class EFSCCommands(EFSTCommands):
     CREATE_KEY = 'create-key'
+    CALIBRATE = 'calibrate'
+    BENCH = 'bench'
+    ADVISE = 'advise'
 
     @classmethod
     def commands_meta(cls):
@@ -27,7 +31,10 @@ class EFSCCommands(EFSTCommands):
                         '{}, '.format(cls.CREATE_KEY),
                         '{}, '.format(cls.REGISTER),
                         '{}, '.format(cls.UNREGISTER),
-                        '{}'.format(cls.SHOW),
+                        '{}, '.format(cls.SHOW),
+                        '{}, '.format(cls.CALIBRATE),
+                        '{}, '.format(cls.BENCH),
+                        '{}'.format(cls.ADVISE),
                         #'{}, '.format(cls.INFO),
                         #'{}'.format(cls.VERSION),
                         '}'))
@@ -54,14 +61,60 @@ class EFSCOptionsParser(EFSTOptionsParser):
         ''' Commands parsing
         '''
         subparsers = parser.add_subparsers(dest = 'sub_cmd', title = 'EFSC commands',
-                                                                            metavar = EFSCCommands.commands_meta())
+                                                                            metavar = EFSCCommands.commands_meta(),
+                                                                                parser_class = EFSTCommandParser)
         self._add_version(subparsers)
         self._add_info(subparsers)
 
         # Create Key
-        create_key_parser = subparsers.add_parser(EFSCCommands.CREATE_KEY,
+        subparsers.add_parser(EFSCCommands.CREATE_KEY,
                                    description = 'Creates EncFS Conf/Key file',
-                                   formatter_class=EFSTHelpFormatter)
+                                   formatter_class=EFSTHelpFormatter,
+                                   add_args = self._add_create_key_args)
+
+        # Show EFST Config Entry
+        subparsers.add_parser(EFSCCommands.SHOW,
+                                   description = 'Shows a registered EFST Config entry',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_show_args)
+
+        # Register EFST Config
+        subparsers.add_parser(EFSCCommands.REGISTER,
+                                   description = 'Registers an EFST config entry',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_register_args)
+
+        # Calibrate EFST Config
+        subparsers.add_parser(EFSCCommands.CALIBRATE,
+                                   description = 'Benchmarks the EncFS key derivation (PBKDF2) on this machine ' \
+                                                    'and stores the number of iterations for a target unlock latency ' \
+                                                        'with an EFST config entry, to be used for creating conf/key files',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_calibrate_args)
+
+        # Benchmark EFST Configs
+        subparsers.add_parser(EFSCCommands.BENCH,
+                                   description = 'Benchmarks the I/O performance of EFST config entries, ' \
+                                            'on throwaway EncFS volumes created and mounted for each entry',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_bench_args)
+
+        # Advise EFST Config
+        subparsers.add_parser(EFSCCommands.ADVISE,
+                                   description = 'Samples a plaintext folder tree along with the backing file system ' \
+                                            'and recommends EncFS block size / block authentication settings, ' \
+                                            'with estimated storage overhead and relative throughput',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_advise_args)
+
+        # Un-Register EFST Config
+        subparsers.add_parser(EFSCCommands.UNREGISTER,
+                                   description = 'Un-registers an EFST config entry',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_unregister_args)
+
+    # Commands arguments
+    def _add_create_key_args(self, create_key_parser):
         required_args_group = create_key_parser.add_argument_group('Required Arguments')
         required_args_group.add_argument('-cp', '--conf-path', dest = 'conf_path',
                         type = str,
@@ -69,18 +122,11 @@ class EFSCOptionsParser(EFSTOptionsParser):
                         help = 'Target path to the EncFS conf/key file')
         self._add_config_entry(create_key_parser)
 
-
-        # Show EFST Config Entry
-        show_parser = subparsers.add_parser(EFSCCommands.SHOW,
-                                   description = 'Shows a registered EFST Config entry',
-                                             formatter_class=EFSTHelpFormatter)
+    def _add_show_args(self, show_parser):
         required_args_group = show_parser.add_argument_group('Required Arguments')
         self._add_cfg_entry_name(required_args_group, registered_only = True, help = "Name of EFST Config entry to show")
 
-        # Register EFST Config
-        register_parser = subparsers.add_parser(EFSCCommands.REGISTER,
-                                   description = 'Registers an EFST config entry',
-                                             formatter_class=EFSTHelpFormatter)
+    def _add_register_args(self, register_parser):
         required_args_group = register_parser.add_argument_group('Required Arguments')
         self._add_cfg_entry_name(required_args_group, registered_only = False, help = "Name of EFST Config Entry to register")
 
@@ -131,21 +177,112 @@ class EFSCOptionsParser(EFSTOptionsParser):
                     help = 'Disables file-hole pass-through, writing encrypted blocks when file holes are created',
                     action='store_true')
 
+    def _add_calibrate_args(self, calibrate_parser):
+        from efst.encfs.encfs_keygen import EncFSKeyGenerator
+        required_args_group = calibrate_parser.add_argument_group('Required Arguments')
+        self._add_cfg_entry_name(required_args_group, registered_only = True, help = "Name of EFST Config entry to calibrate")
+        optional_args_group = calibrate_parser.add_argument_group('Additional Arguments')
+        optional_args_group.add_argument('-tl', '--target-latency', dest = 'target_latency',
+                        type = int,
+                        default = EncFSKeyGenerator.DEFAULT_KDF_DURATION,
+                        help = 'Target key derivation time per unlock, in milliseconds. ' \
+                                'Higher values make passwords harder to brute-force, at the cost of slower ' \
+                                'mount / name encoding operations. {} by default'.format(EncFSKeyGenerator.DEFAULT_KDF_DURATION))
+        optional_args_group.add_argument('-dr', '--dry-run', dest = 'dry_run',
+                    help = 'Only shows the proposed number of iterations, without storing it',
+                    action = 'store_true')
 
-        # Un-Register EFST Config
-        unregister_parser = subparsers.add_parser(EFSCCommands.UNREGISTER,
-                                   description = 'Un-registers an EFST config entry',
-                                             formatter_class=EFSTHelpFormatter)
+    def _add_bench_args(self, bench_parser):
+        from efst.utils.efst_bench import FSBenchmark
+        required_args_group = bench_parser.add_argument_group('Required Arguments')
+        required_args_group.add_argument('-ce', '--config-entries', dest = 'config_entries',
+                        type = str,
+                        nargs = '+',
+                        metavar = config_handler.registered_encfs_cfg_entries(),
+                        required = True,
+                        choices = UniquePartialMatchList(config_handler.registered_encfs_cfg_entries()),
+                        help = 'Names of EFST Config entries to benchmark')
+        optional_args_group = bench_parser.add_argument_group('Additional Arguments')
+        optional_args_group.add_argument('-fs', '--file-size', dest = 'file_size',
+                        type = int,
+                        default = FSBenchmark.DEFAULT_FILE_SIZE_MB,
+                        help = 'Size of the sequential read / write file in MB, ' \
+                                                    '{} by default'.format(FSBenchmark.DEFAULT_FILE_SIZE_MB))
+        optional_args_group.add_argument('-fc', '--file-count', dest = 'file_count',
+                        type = int,
+                        default = FSBenchmark.DEFAULT_SMALL_FILES,
+                        help = 'Number of small files to create / stat / delete, ' \
+                                                    '{} by default'.format(FSBenchmark.DEFAULT_SMALL_FILES))
+        optional_args_group.add_argument('-rr', '--random-reads', dest = 'random_reads',
+                        type = int,
+                        default = FSBenchmark.DEFAULT_RANDOM_READS,
+                        help = 'Number of random {0} byte reads, {1} by default'.format(FSBenchmark.READ_SIZE,
+                                                                                FSBenchmark.DEFAULT_RANDOM_READS))
+        optional_args_group.add_argument('-bl', '--baseline', dest = 'baseline',
+                    help = 'Also benchmarks a plain (non-encrypted) folder, for comparison',
+                    action = 'store_true')
+        optional_args_group.add_argument('-wd', '--work-dir', dest = 'work_dir',
+                        type = lambda wpath: self._is_valid_dir_path(bench_parser, wpath),
+                        help = 'Folder for the throwaway volumes, e.g. on the file system to be used. ' \
+                                                    'If omitted, the system temp folder is used')
+        optional_args_group.add_argument('-o', '--output', dest = 'output',
+                        type = lambda opath: FSHelper.full_path(opath, check_parent_path = True),
+                        help = 'Path to a JSON file for the benchmark results')
+        advanced_args_group = bench_parser.add_argument_group('Advanced Arguments')
+        self._add_timeout(advanced_args_group, CmdTimeouts.MOUNT,
+                                help = 'Seconds to wait for a throwaway volume to mount')
+
+    def _add_advise_args(self, advise_parser):
+        from efst.encfs.encfs_advisor import EncFSBlockAdvisor
+        required_args_group = advise_parser.add_argument_group('Required Arguments')
+        required_args_group.add_argument('-tp', '--target-path', dest = 'target_path',
+                        type = lambda tpath: self._is_valid_dir_path(advise_parser, tpath),
+                        required = True,
+                        help = 'Path to the plaintext folder tree to sample')
+        optional_args_group = advise_parser.add_argument_group('Additional Arguments')
+        optional_args_group.add_argument('-bp', '--backend-path', dest = 'backend_path',
+                        type = lambda bpath: self._is_valid_dir_path(advise_parser, bpath),
+                        help = 'Folder on the file system to hold the encrypted data. ' \
+                                                    'If omitted, the target path is used')
+        optional_args_group.add_argument('-ap', '--access-pattern', dest = 'access_pattern',
+                        type = str,
+                        choices = (self._ADVISE_AUTO,) + EncFSBlockAdvisor.ACCESS_PATTERNS,
+                        default = self._ADVISE_AUTO,
+                        help = 'Typical access pattern. If omitted, guessed from the median file size: ' \
+                                    'small files for random access, large files for sequential access')
+        optional_args_group.add_argument('-bh', '--block-headers', dest = 'block_headers',
+                        type = str,
+                        choices = (self._ADVISE_AUTO, 'on', 'off'),
+                        default = self._ADVISE_AUTO,
+                        help = 'Per-block authentication code headers. If omitted, ' \
+                                                    'recommended as long as the storage overhead stays low')
+        optional_args_group.add_argument('-be', '--base-entry', dest = 'base_entry',
+                        type = str,
+                        metavar = config_handler.registered_encfs_cfg_entries(),
+                        choices = UniquePartialMatchList(config_handler.registered_encfs_cfg_entries()),
+                        help = 'EFST Config entry to take the other EncFS settings from, ' \
+                                                    'the default entry if omitted')
+        optional_args_group.add_argument('-ce', '--config-entry', dest = 'config_entry',
+                        type = str,
+                        help = 'Name of a new EFST Config entry to register with the recommended settings')
+        advanced_args_group = advise_parser.add_argument_group('Advanced Arguments')
+        advanced_args_group.add_argument('-ss', '--sample-size', dest = 'sample_size',
+                        type = int,
+                        default = EncFSBlockAdvisor.DEFAULT_SAMPLE_SIZE,
+                        help = 'Maximum number of file sizes to sample, ' \
+                                                    '{} by default'.format(EncFSBlockAdvisor.DEFAULT_SAMPLE_SIZE))
+
+    def _add_unregister_args(self, unregister_parser):
         required_args_group = unregister_parser.add_argument_group('Required Arguments')
         self._add_cfg_entry_name(required_args_group, registered_only = True, help = "Name of EFST Config entry to unregister")
 
-
     # Options checking
     def _check_cmd_args(self, args, parser):
         ''' Validation of supplied CLI commands
         '''
         super()._check_cmd_args(args, parser)
-        if args['sub_cmd'] in (EFSCCommands.SHOW, EFSCCommands.UNREGISTER, EFSCCommands.CREATE_KEY):
+        if args['sub_cmd'] in (EFSCCommands.SHOW, EFSCCommands.UNREGISTER, EFSCCommands.CREATE_KEY,
+                                                                                        EFSCCommands.CALIBRATE):
             # Registered Entry name could be a partial match, need to expand
             args['config_entry'] = UniquePartialMatchList(
                                         config_handler.registered_encfs_cfg_entries()).find(args['config_entry'])
@@ -160,6 +297,27 @@ class EFSCOptionsParser(EFSTOptionsParser):
                         print('EncFS conf/key file already exists: \n\t"{}"'.format(args['conf_path']))
                         parser.exit()
 
+            # Calibrate
+            elif args['sub_cmd'] == EFSCCommands.CALIBRATE and args['target_latency'] <= 0:
+                parser.error('The target latency should be a positive number of milliseconds')
+
+        elif args['sub_cmd'] == EFSCCommands.BENCH:
+            cfg_entries = UniquePartialMatchList(config_handler.registered_encfs_cfg_entries())
+            args['config_entries'] = list(OrderedDict.fromkeys(cfg_entries.find(cfg_entry)
+                                                                for cfg_entry in args['config_entries']))
+            if min(args['file_size'], args['file_count'], args['random_reads']) <= 0:
+                parser.error('The benchmark sizes should be positive numbers')
+
+        elif args['sub_cmd'] == EFSCCommands.ADVISE:
+            if args['base_entry']:
+                args['base_entry'] = UniquePartialMatchList(
+                                        config_handler.registered_encfs_cfg_entries()).find(args['base_entry'])
+            if args['config_entry'] in (config_handler.registered_encfs_cfg_entries()):
+                print('"{0}": entry name already registered'.format(args['config_entry']))
+                parser.exit()
+            if args['sample_size'] <= 0:
+                parser.error('The sample size should be a positive number')
+
         # Register an EncFS Config
         elif args['sub_cmd'] in EFSCCommands.REGISTER:
             if args['config_entry'] in (config_handler.registered_encfs_cfg_entries()):
@@ -189,6 +347,8 @@ class EFSCOptionsParser(EFSTOptionsParser):
         return None
 
     # Helpers
+    _ADVISE_AUTO = 'auto'
+
     @staticmethod
     def _add_cfg_entry_name(parser, registered_only = False, help = 'EncFS Config Entry name'):
         parser.add_argument('-ce', '--config-entry', dest = 'config_entry',
@@ -12,12 +12,14 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os
+import os, sys, time, json
+from collections import OrderedDict
 from efst.cli.efst.efst_dispatch import EFSTDispatcher
-from efst.encfs.encfs_handler import EncFSHandler
+from efst.cli.efst.checks.chk_encfs import check_encfs_installed
 from efst.config.efst_config import config_handler, EntryTypes, EFSTConfigKeys, ConfigEntries
 from efst.cli.efsm.efsm_options import EFSMOptionsParser, EFSMCommands
-from efst.utils.efst_utils import PasswordHandler
+from efst.encfs.encfs_cfg import EncFSCFG
+from efst.utils.efst_utils import PasswordHandler, FSHelper, UniqueDirNamesChecker, UniquePartialMatchList
 
 
 class EFSMDispatcher(EFSTDispatcher):
@@ -32,7 +34,10 @@ class EFSMDispatcher(EFSTDispatcher):
             args = self.option_parser.parse_options()
 
             if args['sub_cmd'] in (EFSMCommands.CREATE):
-                if args['reverse']:
+                check_encfs_installed()
+                if args['manifest']:
+                    self.create_entries(args)
+                elif args['reverse']:
                     self.create_entry(args, EntryTypes.ReversedCipherText)
                 else:
                     self.create_entry(args, EntryTypes.CipherText)
@@ -46,15 +51,32 @@ class EFSMDispatcher(EFSTDispatcher):
             elif args['sub_cmd'] == EFSMCommands.SHOW:
                 self.show_entry(args)
 
+            elif args['sub_cmd'] == EFSMCommands.STATUS:
+                self.show_status(args)
+
+            elif args['sub_cmd'] == EFSMCommands.CHECK:
+                self.check_entries(args)
+
             elif args['sub_cmd'] == EFSMCommands.UNREGISTER:
                 self.unregister_entry(args)
 
             elif args['sub_cmd'] == EFSMCommands.MOUNT:
+                check_encfs_installed()
                 self.mount_entry(args)
 
             elif args['sub_cmd'] == EFSMCommands.UMOUNT:
                 self.umount_entry(args)
 
+            elif args['sub_cmd'] == EFSMCommands.UNLOCK:
+                check_encfs_installed()
+                self.unlock_entry(args)
+
+            elif args['sub_cmd'] == EFSMCommands.LOCK:
+                self.lock_entry(args)
+
+            elif args['sub_cmd'] == EFSMCommands.AGENT:
+                self.show_agent()
+
             else:
                 print('Nothing to dispatch')
                 return False
@@ -80,6 +102,57 @@ class EFSMDispatcher(EFSTDispatcher):
             self.register_entry(args, entry_type)
 
 
+    def create_entries(self, args):
+        ''' Creates and registers EncFS backend stores / respective views defined in a manifest,
+            creating the conf/key files in parallel and writing out the config once
+        '''
+        from efst.encfs.encfs_handler import EncFSHandler
+        manifest_entries, results = self._manifest_entries(args)
+        create_requests = []
+        for entry in manifest_entries:
+            try:
+                entry['pwd'] = self._manifest_pwd(entry, os.path.dirname(args['manifest']))
+            except ValueError as e:
+                results.append(EncFSHandler.CreateResult(entry['entry_name'], entry['conf_path'], False, str(e), 0.0))
+                continue
+            os.makedirs(entry['backend_path'], exist_ok = True)
+            create_requests.append(EncFSHandler.CreateRequest(entry['entry_name'], entry['pwd'],
+                                    config_handler.encfs_cfg_entry(entry['config_entry']), entry['conf_path']))
+        for result in results:
+            print('{0}: {1}'.format(result.name, result.message), flush = True)
+
+        start = time.time()
+        try:
+            for result in EncFSHandler.create_cfg_files(create_requests, workers = args['workers'],
+                                                                                    timeout = args['timeout']):
+                results.append(result)
+                print('{0}: {1} ({2:.2f}s)'.format(result.name, 'created' if result.created else result.message,
+                                                                                    result.elapsed), flush = True)
+        except KeyboardInterrupt:
+            print('\nInterrupted, the running conf/key files creation was cancelled', file = sys.stderr)
+
+        created = set(result.name for result in results if result.created)
+        entries = []
+        for entry in manifest_entries:
+            if entry['entry_name'] not in created:
+                continue
+            if entry['store_pwd']:
+                PasswordHandler.store_pwd(entry['pwd'], entry['pwd_entry'])
+            entries.append((entry['entry_name'], ConfigEntries.EFSTEntry(
+                                        EntryTypes.ReversedCipherText if entry['reverse'] else EntryTypes.CipherText,
+                                        entry['pwd_entry'],
+                                        entry['conf_path'],
+                                        entry['backend_path'],
+                                        entry['mountpoint_path'],
+                                        entry['idle_minutes'],
+                                        entry['no_batch_mount'],
+                                        entry['mount_name'])))
+        config_handler.register_entries(entries, quiet = True)
+
+        print()
+        self._print_summary(results, 'created', time.time() - start, succeeded = lambda result: result.created,
+                                    done_details = lambda result: result.cfg_target_path, details_desc = 'Conf/Key file')
+
     def register_entry(self, args, entry_type):
         ''' Registers EFST entry
         '''
@@ -117,6 +190,110 @@ class EFSMDispatcher(EFSTDispatcher):
         print('   Batch Mount: {}'.format(batch_mount_desc(entry.no_batch_mount)))
         print('   Volume name: {}'.format(entry.volume_name))
 
+    def show_status(self, args):
+        ''' Prints out the mount state of all registered EFST entries,
+            from a single mount table snapshot
+        '''
+        from efst.encfs.encfs_handler import EncFSHandler
+        from efst.encfs.encfs_agent_client import EncFSAgentClient, EncFSAgentError
+        from efst.utils.efst_mounts import MountTable
+        mount_entries = MountTable.entries(refresh = True)
+        encfs_pids = EncFSHandler.encfs_pids()
+        try:
+            _, unlocked_volumes = EncFSAgentClient().status()
+        except EncFSAgentError:
+            unlocked_volumes = []
+        unlocked_entries = set(volume.entry_name for volume in unlocked_volumes)
+
+        statuses = []
+        for entry_name in config_handler.registered_entries():
+            if entry_name == EFSTConfigKeys.NO_ENTRIES_REGISTERED:
+                break
+            entry = config_handler.entry(entry_name)
+            mount_entry = mount_entries.get(entry.mount_dir_path)
+            statuses.append(OrderedDict((('entry_name', entry_name),
+                                         ('entry_type', EntryTypes(entry.entry_type).name),
+                                         ('mounted', mount_entry is not None),
+                                         ('mount_dir_path', entry.mount_dir_path),
+                                         ('fstype', mount_entry.fstype if mount_entry else None),
+                                         ('encfs_pid', encfs_pids.get(entry.mount_dir_path)),
+                                         ('unmount_on_idle', entry.unmount_on_idle),
+                                         ('unlocked', entry_name in unlocked_entries))))
+
+        if args['json']:
+            print(json.dumps(statuses, indent = 2))
+            return
+        if not statuses:
+            print('No entries registered')
+            return
+        rows = [('Entry', 'State', 'PID', 'Idle un-mount', 'Agent', 'Mount folder')]
+        for status in statuses:
+            rows.append((status['entry_name'], 'mounted' if status['mounted'] else 'unmounted',
+                            str(status['encfs_pid'] or '-'),
+                            self._mins_format(status['unmount_on_idle']) if status['unmount_on_idle'] else 'disabled',
+                            'unlocked' if status['unlocked'] else '-', status['mount_dir_path']))
+        self._print_table(rows)
+
+    def check_entries(self, args):
+        ''' Probes all mounted EFST entries for responsiveness,
+            optionally re-mounting the stale ones
+        '''
+        from efst.encfs.encfs_handler import EncFSHandler
+        from efst.utils.efst_mounts import MountTable
+        mount_entries = MountTable.entries(refresh = True)
+        mounted_entries = OrderedDict((entry_name, entry) for entry_name, entry in
+                                        ((entry_name, config_handler.entry(entry_name))
+                                            for entry_name in config_handler.registered_entries()
+                                                        if entry_name != EFSTConfigKeys.NO_ENTRIES_REGISTERED)
+                                                                    if entry.mount_dir_path in mount_entries)
+
+        start = time.time()
+        results = sorted(EncFSHandler.probe_mounts(((entry_name, entry.mount_dir_path)
+                                                        for entry_name, entry in mounted_entries.items()),
+                                                    workers = args['workers'], timeout = args['timeout'],
+                                                    slow_threshold = args['slow_threshold']),
+                                                                            key = lambda result: result.name)
+        elapsed = time.time() - start
+
+        remounted = {}
+        stale_entries = [(result.name, mounted_entries[result.name]) for result in results
+                                                                if result.state == EncFSHandler.PROBE_STALE]
+        if args['remount'] and stale_entries:
+            if not args['json']:
+                print('Re-mounting {} stale entries'.format(len(stale_entries)))
+            self._umount_batch(stale_entries, batch_umount = True, timeout = args['timeout'],
+                                                        lazy_fallback = True, quiet = args['json'])
+            remounted = {result.name: result.mounted for result in self._mount_batch(stale_entries,
+                                        batch_mount = True, workers = args['workers'], quiet = args['json'])}
+            if not args['json']:
+                print()
+
+        if args['json']:
+            print(json.dumps([OrderedDict((('entry_name', result.name),
+                                           ('mount_dir_path', result.mount_dir_path),
+                                           ('state', result.state),
+                                           ('latency', round(result.latency, 6)),
+                                           ('message', result.message),
+                                           ('remounted', remounted.get(result.name))))
+                                                                    for result in results], indent = 2))
+            return
+        if not results:
+            print('No mounted entries')
+            return
+        print('Probed {0} mounted entries in {1:.2f}s: {2}'.format(len(results), elapsed,
+                    ', '.join('{0} {1}'.format(sum(1 for result in results if result.state == state), state)
+                                                        for state in (EncFSHandler.PROBE_HEALTHY,
+                                                                        EncFSHandler.PROBE_SLOW,
+                                                                        EncFSHandler.PROBE_STALE))))
+        rows = [('Entry', 'State', 'Latency', 'Mount folder / Details')]
+        for result in results:
+            state = result.state
+            if result.name in remounted:
+                state = '{0}, {1}'.format(state, 'remounted' if remounted[result.name] else 'remount failed')
+            rows.append((result.name, state, '{:.3f}s'.format(result.latency),
+                            result.mount_dir_path if result.state == EncFSHandler.PROBE_HEALTHY else result.message))
+        self._print_table(rows, right_aligned = (2,))
+
     def unregister_entry(self, args):
         ''' Un-Registers EFST entry
         '''
@@ -131,35 +308,287 @@ class EFSMDispatcher(EFSTDispatcher):
 
     def mount_entry(self, args):
         ''' Mounts a registered EFST entry
+            Batch entries are mounted concurrently, followed by a summary
+        '''
+        self._mount_batch(self._mount_entries(args['entry_name']),
+                            batch_mount = (args['entry_name'] == EFSTConfigKeys.BATCH_MOUNT_ENTRIES_SYMBOL),
+                                                            workers = args['workers'], timeout = args['timeout'])
+
+    def umount_entry(self, args, quiet = False):
+        ''' Un-mounts a registered EFST entry
+            Batch entries are un-mounted concurrently within a deadline, followed by a summary
         '''
-        for idx, (mount_entry_name, mount_entry) in enumerate(self._mount_entries(args['entry_name'])):
+        self._umount_batch(self._mount_entries(args['entry_name']),
+                            batch_umount = (args['entry_name'] == EFSTConfigKeys.BATCH_MOUNT_ENTRIES_SYMBOL),
+                            workers = args.get('workers'),
+                            timeout = args.get('timeout'),
+                            lazy_fallback = not args.get('no_lazy'), quiet = quiet)
+
+    def unlock_entry(self, args):
+        ''' Unlocks a registered EFST entry in the EFST agent
+        '''
+        from efst.encfs.encfs_agent_client import EncFSAgentClient, EncFSAgentError
+        agent_client = EncFSAgentClient()
+        for idx, (unlock_entry_name, unlock_entry) in enumerate(self._mount_entries(args['entry_name'])):
             if idx > 0: print()
-            print("Mounting: {}".format(mount_entry_name))
+            print("Unlocking: {}".format(unlock_entry_name))
 
-            pwd, new_pwd = PasswordHandler.get_pwd(mount_entry.pwd_entry)
+            pwd, new_pwd = PasswordHandler.get_pwd(unlock_entry.pwd_entry)
             if not pwd:
                 print('No password entered, exiting')
+                continue
+            try:
+                agent_client.unlock(unlock_entry_name, unlock_entry.encfs_dir_path, unlock_entry.encfs_config_path,
+                                                                    pwd, ttl_minutes = args['ttl_minutes'])
+            except EncFSAgentError as e:
+                print('Could not unlock: {}'.format(e))
+            else:
+                print('Unlocked for {}'.format(self._mins_format(args['ttl_minutes'])))
+                if new_pwd:
+                    self._store_pwd(pwd, unlock_entry.pwd_entry)
+
+    def lock_entry(self, args):
+        ''' Locks a registered EFST entry in the EFST agent, or all of them for batch entries
+        '''
+        from efst.encfs.encfs_agent_client import EncFSAgentClient, EncFSAgentError
+        agent_client = EncFSAgentClient()
+        try:
+            if args['entry_name'] == EFSTConfigKeys.BATCH_MOUNT_ENTRIES_SYMBOL:
+                locked = agent_client.lock()
             else:
-                if EncFSHandler.mount(pwd,
+                entry = config_handler.entry(args['entry_name'])
+                locked = agent_client.lock(entry.encfs_dir_path, entry.encfs_config_path)
+        except EncFSAgentError:
+            print('EFST agent is not running')
+        else:
+            print('Locked {0} entr{1}'.format(locked, 'y' if locked == 1 else 'ies'))
+
+    def show_agent(self):
+        ''' Prints out the EFST agent status
+        '''
+        from efst.encfs.encfs_agent_client import EncFSAgentClient, EncFSAgentError
+        try:
+            pid, volumes = EncFSAgentClient().status()
+        except EncFSAgentError:
+            print('EFST agent is not running')
+            return
+        print('EFST agent running, pid: {}'.format(pid))
+        if not volumes:
+            print('   No unlocked entries')
+        for volume in volumes:
+            print('   {0}: unlocked for {1}'.format(volume.entry_name,
+                                                    self._mins_format((volume.expires_in + 59) // 60)))
+
+
+    def _mount_batch(self, named_entries, batch_mount = False, workers = None, timeout = None, quiet = False):
+        ''' Mounts (entry name, entry) pairs, asking for the passwords upfront one entry at a time
+            Returns the MountResults
+        '''
+        from efst.encfs.encfs_handler import EncFSHandler
+        mount_requests, new_pwds = [], {}
+        for mount_entry_name, mount_entry in named_entries:
+            if not (batch_mount or quiet):
+                print("Mounting: {}".format(mount_entry_name))
+            pwd, new_pwd = self._get_pwd(mount_entry)
+            if not pwd and new_pwd:
+                print('No password entered{}'.format(', skipping: {}'.format(mount_entry_name)
+                                                                            if batch_mount else ', exiting'))
+                continue
+            if new_pwd:
+                new_pwds[mount_entry_name] = pwd
+            mount_requests.append(EncFSHandler.MountRequest(mount_entry_name, pwd,
                             mount_entry.encfs_config_path,
                             mount_entry.encfs_dir_path,
                             mount_entry.mount_dir_path,
                             mount_entry.volume_name,
-                            unmount_on_idle = mount_entry.unmount_on_idle,
-                            reverse = True if mount_entry.entry_type == EntryTypes.ReversedCipherText else False):
-                    if new_pwd:
-                        self._store_pwd(pwd, mount_entry.pwd_entry)
-
-    def umount_entry(self, args, quiet = False):
-        ''' Un-mounts a registered EFST entry
+                            True if mount_entry.entry_type == EntryTypes.ReversedCipherText else False,
+                            mount_entry.unmount_on_idle))
+        if not mount_requests:
+            return []
+
+        start = time.time()
+        results = []
+        try:
+            for result in EncFSHandler.mount_many(mount_requests, workers = workers, timeout = timeout):
+                results.append(result)
+                if quiet:
+                    continue
+                if batch_mount:
+                    print('{0}: {1} ({2:.2f}s)'.format(result.name, result.message.strip(), result.elapsed), flush = True)
+                else:
+                    print(result.message.strip())
+        except KeyboardInterrupt:
+            print('\nInterrupted, the running mounts were cancelled', file = sys.stderr)
+        if batch_mount and not quiet:
+            print()
+            self._print_summary(results, 'mounted', time.time() - start)
+
+        for result in results:
+            if result.mounted and result.name in new_pwds:
+                if batch_mount:
+                    print('{}:'.format(result.name))
+                self._store_pwd(new_pwds[result.name], config_handler.entry(result.name).pwd_entry)
+        return results
+
+    def _umount_batch(self, named_entries, batch_umount = False, workers = None,
+                                                        timeout = None, lazy_fallback = True, quiet = False):
+        ''' Un-mounts (entry name, entry) pairs, returning the UmountResults
         '''
-        for idx, (umount_entry_name, umount_entry) in enumerate(self._mount_entries(args['entry_name'])):
-            if idx > 0: print()
-
-            print("Un-mounting: {}".format(umount_entry_name))
-            EncFSHandler.umount(umount_entry.mount_dir_path, quiet = quiet)
-
-
+        from efst.encfs.encfs_handler import EncFSHandler
+        umount_requests = [(umount_entry_name, umount_entry.mount_dir_path)
+                                                for umount_entry_name, umount_entry in named_entries]
+        if not batch_umount and not quiet:
+            print("Un-mounting: {}".format(umount_requests[0][0]))
+
+        start = time.time()
+        results = []
+        try:
+            for result in EncFSHandler.umount_many(umount_requests, workers = workers,
+                                                            timeout = timeout, lazy_fallback = lazy_fallback):
+                results.append(result)
+                if quiet:
+                    continue
+                if batch_umount:
+                    print('{0}: {1} ({2:.2f}s)'.format(result.name, result.message.strip(), result.elapsed), flush = True)
+                else:
+                    print(result.message.strip())
+        except KeyboardInterrupt:
+            print('\nInterrupted, the running un-mounts were cancelled', file = sys.stderr)
+        if batch_umount and not quiet:
+            print()
+            self._print_summary(results, 'unmounted', time.time() - start,
+                                                            succeeded = lambda result: result.unmounted,
+                                                            done_desc = lambda result: 'unmounted (lazy)'
+                                                                        if result.lazy else 'unmounted')
+        return results
+
+    @staticmethod
+    def _manifest_entries(args):
+        ''' Reads and checks the manifest entries, compiling their defaults the same way "efsm create" does
+            Returns the entries to create along with CreateResults for the ones that did not check out
+        '''
+        from efst.encfs.encfs_handler import EncFSHandler
+        try:
+            with open(args['manifest'], encoding = 'utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError) as e:
+            print('Could not read the manifest file: {}'.format(e))
+            sys.exit(1)
+        if isinstance(manifest, dict):
+            manifest = manifest.get('entries')
+        if not isinstance(manifest, list):
+            print('The manifest should be a list of entries')
+            sys.exit(1)
+
+        manifest_dir = os.path.dirname(args['manifest'])
+        full_path = lambda path: FSHelper.full_path(os.path.join(manifest_dir, os.path.expanduser(path)))
+        registered_entries = set(config_handler.registered_entries())
+        cfg_entries = UniquePartialMatchList(config_handler.registered_encfs_cfg_entries())
+        unique_names_checker = None
+
+        entries, failed, cfg_paths = [], [], set()
+        for idx, item in enumerate(manifest):
+            if not isinstance(item, dict) or not item.get('entry_name') or not item.get('backend_path'):
+                entry_name = item.get('entry_name') if isinstance(item, dict) else None
+                failed.append(EncFSHandler.CreateResult(str(entry_name or '#{}'.format(idx + 1)), '', False,
+                                                            'Entry name and backend path are required', 0.0))
+                continue
+            entry_name = str(item['entry_name'])
+            backend_path = full_path(item['backend_path'])
+            conf_path = full_path(item['conf_path']) if item.get('conf_path') else backend_path
+            if os.path.isdir(conf_path) or conf_path == backend_path:
+                conf_path = os.path.join(conf_path, EncFSCFG.DEFAULT_CFG_FNAME)
+
+            error = None
+            if entry_name in registered_entries:
+                error = 'Entry name already registered'
+            elif os.path.exists(conf_path) or conf_path in cfg_paths:
+                error = 'EncFS conf/key file already exists: {}'.format(conf_path)
+            elif item.get('config_entry') and item['config_entry'] not in cfg_entries:
+                error = 'Not a registered config entry: {}'.format(item['config_entry'])
+            if error:
+                failed.append(EncFSHandler.CreateResult(entry_name, conf_path, False, error, 0.0))
+                continue
+
+            mountpoint_path = item.get('mountpoint_path')
+            if mountpoint_path:
+                mountpoint_path = full_path(mountpoint_path)
+            else:
+                if not unique_names_checker:
+                    unique_names_checker = UniqueDirNamesChecker(config_handler.os_config.mountpoint_folder)
+                mountpoint_path = os.path.join(config_handler.os_config.mountpoint_folder,
+                                                                    unique_names_checker.unique_name(entry_name))
+
+            registered_entries.add(entry_name)
+            cfg_paths.add(conf_path)
+            entries.append({'entry_name': entry_name,
+                            'backend_path': backend_path,
+                            'conf_path': conf_path,
+                            'config_entry': cfg_entries.find(item['config_entry'])
+                                                    if item.get('config_entry') else args['config_entry'],
+                            'mountpoint_path': mountpoint_path,
+                            'mount_name': str(item.get('mount_name') or entry_name),
+                            'idle_minutes': item.get('idle_minutes', 0),
+                            'reverse': bool(item.get('reverse')),
+                            'no_batch_mount': bool(item.get('no_batch_mount')),
+                            'pwd_source': item.get('pwd_source', 'prompt'),
+                            'store_pwd': bool(item.get('store_pwd')),
+                            'pwd_entry': 'efst-entry-{}'.format(entry_name)})
+        return entries, failed
+
+    @staticmethod
+    def _manifest_pwd(entry, manifest_dir):
+        ''' Gets a manifest entry password from its source, i.e. one of:
+            prompt, env:VAR, file:PATH, keyring:ENTRY
+        '''
+        source, _, source_arg = entry['pwd_source'].partition(':')
+        if source == 'prompt':
+            print('Password for: {}'.format(entry['entry_name']))
+            pwd = PasswordHandler.get_pwd_input(confirm = True)
+        elif source == 'env':
+            pwd = os.environ.get(source_arg)
+        elif source == 'file':
+            try:
+                with open(os.path.join(manifest_dir, os.path.expanduser(source_arg)), encoding = 'utf-8') as pwd_file:
+                    pwd = pwd_file.readline().rstrip('\r\n')
+            except OSError as e:
+                raise ValueError('Could not read the password file: {}'.format(e))
+        elif source == 'keyring':
+            pwd = PasswordHandler.stored_pwd(source_arg)
+        else:
+            raise ValueError('Unknown password source: {}'.format(entry['pwd_source']))
+        if not pwd:
+            raise ValueError('No password from: {}'.format(entry['pwd_source']))
+        return pwd
+
+    @staticmethod
+    def _print_summary(results, action_desc, elapsed, succeeded = lambda result: result.mounted, done_desc = None,
+                                        done_details = lambda result: result.mount_dir_path, details_desc = 'Mount folder'):
+        ''' Prints out a batch summary table
+        '''
+        done_cnt = sum(1 for result in results if succeeded(result))
+        print('{0} {1} of {2} entries in {3:.2f}s'.format(action_desc.capitalize(), done_cnt, len(results), elapsed))
+
+        rows = [('Entry', 'Result', 'Time', '{} / Details'.format(details_desc))]
+        for result in sorted(results, key = lambda result: result.name):
+            details = done_details(result) if succeeded(result) else \
+                            next((line for line in result.message.splitlines() if line.strip()), '')
+            rows.append((result.name, (done_desc(result) if done_desc else action_desc) if succeeded(result) else 'failed',
+                                                        '{:.2f}s'.format(result.elapsed), details))
+        EFSMDispatcher._print_table(rows, right_aligned = (2,))
+
+    @staticmethod
+    def _print_table(rows, right_aligned = ()):
+        ''' Prints out rows of columns, the last column as is
+        '''
+        widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]) - 1)]
+        for row in rows:
+            print('   {}'.format('  '.join(['{0:{1}{2}}'.format(value, '>' if column in right_aligned else '<', width)
+                                                for column, (value, width) in enumerate(zip(row, widths))] + [row[-1]])))
+
+    @staticmethod
+    def _mins_format(mins):
+        return '{0} min{1}'.format(mins, '' if int(mins) == 1 else 's')
 
     def _mount_entries(self, entry_name):
         if entry_name == EFSTConfigKeys.BATCH_MOUNT_ENTRIES_SYMBOL:
@@ -13,9 +13,9 @@
 
 import os
 from enum import IntEnum
-from efst.cli.efst.efst_options import EFSTOptionsParser, EFSTHelpFormatter, EFSTCommands
+from efst.cli.efst.efst_options import EFSTOptionsParser, EFSTCommandParser, EFSTHelpFormatter, EFSTCommands
 from efst.encfs.encfs_cfg import EncFSCFG
-from efst.config.efst_config import config_handler, EFSTConfigKeys, EntryTypes
+from efst.config.efst_config import config_handler, EFSTConfigKeys, EntryTypes, CmdTimeouts
 from efst.utils.efst_utils import FSHelper, UniqueDirNamesChecker, UniquePartialMatchList
 
 
@@ -23,6 +23,11 @@ class EFSMCommands(EFSTCommands):
     CREATE = 'create'
     MOUNT = 'mount'
     UMOUNT = 'umount'
+    UNLOCK = 'unlock'
+    LOCK = 'lock'
+    AGENT = 'agent'
+    STATUS = 'status'
+    CHECK = 'check'
 
     @classmethod
     def commands_meta(cls):
@@ -31,8 +36,13 @@ class EFSMCommands(EFSTCommands):
                         '{}, '.format(cls.REGISTER),
                         '{}, '.format(cls.UNREGISTER),
                         '{}, '.format(cls.SHOW),
+                        '{}, '.format(cls.STATUS),
+                        '{}, '.format(cls.CHECK),
                         '{}, '.format(cls.MOUNT),
-                        '{}'.format(cls.UMOUNT),
+                        '{}, '.format(cls.UMOUNT),
+                        '{}, '.format(cls.UNLOCK),
+                        '{}, '.format(cls.LOCK),
+                        '{}'.format(cls.AGENT),
                         #'{}, '.format(cls.INFO),
                         #'{}'.format(cls.VERSION),
                         '}'))
@@ -68,67 +78,191 @@ class EFSMOptionsParser(EFSTOptionsParser):
         '''
         subparsers = parser.add_subparsers(dest = 'sub_cmd',
                                                 title = 'EFSM commands',
-                                                        metavar = EFSMCommands.commands_meta())
+                                                        metavar = EFSMCommands.commands_meta(),
+                                                            parser_class = EFSTCommandParser)
         self._add_version(subparsers)
         self._add_info(subparsers)
 
         # Create
-        create_parser = subparsers.add_parser(EFSMCommands.CREATE,
+        subparsers.add_parser(EFSMCommands.CREATE,
                                    description = 'Sets up and register EncFS backend folder and its corresponding view',
-                                   formatter_class=EFSTHelpFormatter)
-        self._add_entry_groups(create_parser, action_type = ConfKeyActionType.Create)
-        self._add_config_entry(create_parser)
+                                   formatter_class=EFSTHelpFormatter,
+                                   add_args = self._add_create_args)
 
         # Register
-        register_parser = subparsers.add_parser(EFSMCommands.REGISTER,
+        subparsers.add_parser(EFSMCommands.REGISTER,
                                    description = 'Register EncFS backend folder and sets up its corresponding view',
-                                   formatter_class=EFSTHelpFormatter)
-        self._add_entry_groups(register_parser, action_type = ConfKeyActionType.Register)
+                                   formatter_class=EFSTHelpFormatter,
+                                   add_args = self._add_register_args)
 
         # Show
-        show_parser = subparsers.add_parser(EFSMCommands.SHOW,
+        subparsers.add_parser(EFSMCommands.SHOW,
                                    description = 'Shows a registered EncFS entry',
-                                             formatter_class=EFSTHelpFormatter)
-        required_args_group = show_parser.add_argument_group('Required Arguments')
-        self._add_entry_name(required_args_group, registered_only = True, help = "Name of entry to show")
-
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_show_args)
+
+        # Status
+        subparsers.add_parser(EFSMCommands.STATUS,
+                                   description = 'Shows the mount state of all registered EncFS entries',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_status_args)
+
+        # Check
+        subparsers.add_parser(EFSMCommands.CHECK,
+                                   description = 'Probes all mounted EncFS entries for responsiveness, ' \
+                                                        'classifying them as healthy, slow or stale',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_check_args)
 
         # Unregister
-        unregister_parser = subparsers.add_parser(EFSMCommands.UNREGISTER,
+        subparsers.add_parser(EFSMCommands.UNREGISTER,
                                    description = 'Removes a registered EncFS entry',
-                                             formatter_class=EFSTHelpFormatter)
-        required_args_group = unregister_parser.add_argument_group('Required Arguments')
-        self._add_entry_name(required_args_group, registered_only = True, help = "Name of entry to unregister")
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_unregister_args)
 
         # Mount
-        mount_parser = subparsers.add_parser(EFSMCommands.MOUNT,
+        subparsers.add_parser(EFSMCommands.MOUNT,
                                              description = 'Mounts a registered EncFS entry',
-                                             formatter_class=EFSTHelpFormatter)
-        required_args_group = mount_parser.add_argument_group('Required Arguments')
-        self._add_entry_name(required_args_group, registered_only = True,
-                             show_batch_mount_symbol = True, help = "Name of registered entry to mount")
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_mount_args)
 
         # Umount
-        umount_parser = subparsers.add_parser(EFSMCommands.UMOUNT,
+        subparsers.add_parser(EFSMCommands.UMOUNT,
                                              description = 'Un-mounts a registered EncFS entry',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_umount_args)
+
+        # Unlock
+        subparsers.add_parser(EFSMCommands.UNLOCK,
+                                             description = 'Unlocks a registered EncFS entry in the EFST agent, ' \
+                                                    'so that it can be mounted and have its names translated without a password',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_unlock_args)
+
+        # Lock
+        subparsers.add_parser(EFSMCommands.LOCK,
+                                             description = 'Locks a registered EncFS entry in the EFST agent',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_lock_args)
+
+        # Agent
+        subparsers.add_parser(EFSMCommands.AGENT,
+                                             description = 'Shows the EFST agent status',
                                              formatter_class=EFSTHelpFormatter)
+
+    # Commands arguments
+    def _add_create_args(self, create_parser):
+        from efst.encfs.encfs_handler import EncFSHandler
+        self._add_entry_groups(create_parser, action_type = ConfKeyActionType.Create)
+        self._add_config_entry(create_parser)
+        manifest_args_group = create_parser.add_argument_group('Manifest Arguments')
+        manifest_args_group.add_argument('-mf', '--manifest', dest = 'manifest',
+                    type = lambda mpath: self._is_valid_file_path(create_parser, mpath),
+                    help = 'Creates and registers all entries defined in a JSON manifest file, ' \
+                            'i.e. a list of objects with the "entry_name", "backend_path" and optionally ' \
+                            'the "conf_path", "config_entry", "mountpoint_path", "mount_name", "idle_minutes", ' \
+                            '"reverse", "no_batch_mount", "pwd_source" (prompt, env:VAR, file:PATH, keyring:ENTRY) ' \
+                            'and "store_pwd" keys. Relative paths are resolved against the manifest folder')
+        self._add_workers(manifest_args_group, help = 'Number of manifest conf/key files created in parallel, ' \
+                                                            'defaults to {}'.format(EncFSHandler.CREATE_WORKERS))
+        self._add_timeout(manifest_args_group, CmdTimeouts.CREATE,
+                                help = 'Seconds to wait for encfs to create a conf/key file, before killing it')
+
+    def _add_register_args(self, register_parser):
+        self._add_entry_groups(register_parser, action_type = ConfKeyActionType.Register)
+
+    def _add_show_args(self, show_parser):
+        required_args_group = show_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True, help = "Name of entry to show")
+
+    def _add_status_args(self, status_parser):
+        optional_args_group = status_parser.add_argument_group('Additional Arguments')
+        optional_args_group.add_argument('-js', '--json', dest = 'json',
+                    help = 'Prints out the entries state as JSON, e.g. for monitoring',
+                    action = 'store_true')
+
+    def _add_check_args(self, check_parser):
+        from efst.encfs.encfs_handler import EncFSHandler
+        optional_args_group = check_parser.add_argument_group('Additional Arguments')
+        optional_args_group.add_argument('-rm', '--remount', dest = 'remount',
+                    help = 'Re-mounts the stale entries',
+                    action = 'store_true')
+        optional_args_group.add_argument('-js', '--json', dest = 'json',
+                    help = 'Prints out the probe results as JSON, e.g. for monitoring',
+                    action = 'store_true')
+        advanced_args_group = check_parser.add_argument_group('Advanced Arguments')
+        self._add_timeout(advanced_args_group, CmdTimeouts.PROBE,
+                                help = 'Seconds to wait for a mount to respond, before considering it stale')
+        advanced_args_group.add_argument('-st', '--slow-threshold', dest = 'slow_threshold',
+                    type = float,
+                    default = EncFSHandler.PROBE_SLOW_THRESHOLD,
+                    help = 'Seconds for a mount to respond, above which it is considered slow')
+        self._add_workers(advanced_args_group, help = 'Number of mounts probed in parallel, defaults to all at once')
+
+    def _add_unregister_args(self, unregister_parser):
+        required_args_group = unregister_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True, help = "Name of entry to unregister")
+
+    def _add_mount_args(self, mount_parser):
+        from efst.encfs.encfs_handler import EncFSHandler
+        required_args_group = mount_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True,
+                             show_batch_mount_symbol = True, help = "Name of registered entry to mount")
+        advanced_args_group = mount_parser.add_argument_group('Advanced Arguments')
+        self._add_workers(advanced_args_group, help = 'Number of batch entries mounted in parallel, ' \
+                                                            'defaults to {}'.format(EncFSHandler.MOUNT_WORKERS))
+        self._add_timeout(advanced_args_group, CmdTimeouts.MOUNT,
+                                help = 'Seconds to wait for a mount, before killing it')
+
+    def _add_umount_args(self, umount_parser):
+        from efst.encfs.encfs_handler import EncFSHandler
         required_args_group = umount_parser.add_argument_group('Required Arguments')
         self._add_entry_name(required_args_group, registered_only = True,
                              show_batch_mount_symbol = True, help = "Name of registered entry to un-mount")
-
+        advanced_args_group = umount_parser.add_argument_group('Advanced Arguments')
+        self._add_workers(advanced_args_group, help = 'Number of batch entries un-mounted in parallel, ' \
+                                                            'defaults to {}'.format(EncFSHandler.MOUNT_WORKERS))
+        self._add_timeout(advanced_args_group, CmdTimeouts.UMOUNT,
+                                help = 'Seconds to wait for an un-mount, before falling back to a lazy un-mount')
+        advanced_args_group.add_argument('-nl', '--no-lazy', dest = 'no_lazy',
+                    help = 'Disables the lazy un-mount fallback for stale or timed out mounts',
+                    action = 'store_true')
+
+    def _add_unlock_args(self, unlock_parser):
+        from efst.encfs.encfs_agent_client import EncFSAgentClient
+        required_args_group = unlock_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True,
+                             show_batch_mount_symbol = True, help = "Name of registered entry to unlock")
+        optional_args_group = unlock_parser.add_argument_group('Additional Arguments')
+        optional_args_group.add_argument('-tm', '--ttl-minutes', dest = 'ttl_minutes',
+                    type = int,
+                    default = EncFSAgentClient.DEFAULT_TTL_MINUTES,
+                    help = 'Keep the entry unlocked for the given number of minutes')
+
+    def _add_lock_args(self, lock_parser):
+        required_args_group = lock_parser.add_argument_group('Required Arguments')
+        self._add_entry_name(required_args_group, registered_only = True,
+                             show_batch_mount_symbol = True, help = "Name of registered entry to lock")
 
     # Options checking
     def _check_cmd_args(self, args, parser):
         ''' Validation of supplied CLI commands
         '''
         super()._check_cmd_args(args, parser)
-        if args['sub_cmd'] in (EFSMCommands.VERSION, EFSMCommands.INFO):
+        if args['sub_cmd'] in (EFSMCommands.VERSION, EFSMCommands.INFO, EFSMCommands.AGENT,
+                                                                    EFSMCommands.STATUS, EFSMCommands.CHECK):
             # not much to check there
            pass
 
+        elif args['sub_cmd'] == EFSMCommands.CREATE and args['manifest']:
+            # manifest entries are checked one by one, on creation
+            args['config_entry'] = UniquePartialMatchList(
+                                        config_handler.registered_encfs_cfg_entries()).find(args['config_entry'])
+
         elif args['sub_cmd'] not in (EFSMCommands.REGISTER, EFSMCommands.CREATE):
             # Registered Entry name could be a partial match, need to expand
-            include_batch_mode = args['sub_cmd'] in (EFSMCommands.MOUNT, EFSMCommands.UMOUNT)
+            include_batch_mode = args['sub_cmd'] in (EFSMCommands.MOUNT, EFSMCommands.UMOUNT,
+                                                                    EFSMCommands.UNLOCK, EFSMCommands.LOCK)
             args['entry_name'] = UniquePartialMatchList(
                                         config_handler.registered_entries(show_batch_mount_symbol = include_batch_mode)).find(args['entry_name'])
 
@@ -138,11 +272,17 @@ class EFSMOptionsParser(EFSTOptionsParser):
                 print('To register an existing EncFS backend entry: \n\t $ efsm register -h')
                 parser.exit()
 
+            if args['sub_cmd'] == EFSMCommands.UNLOCK and args['ttl_minutes'] <= 0:
+                parser.error('The unlock time should be a positive number of minutes')
+
         elif args['sub_cmd'] in (EFSMCommands.REGISTER, EFSMCommands.CREATE, EFSMCommands.MOUNT):
             # compile pwd entry name
             args['pwd_entry'] = 'efst-entry-{}'.format(args['entry_name'])
 
             if args['sub_cmd'] in (EFSMCommands.REGISTER, EFSMCommands.CREATE):
+                if not (args['entry_name'] and args['backend_path']):
+                    parser.error('the following arguments are required: -en/--entry-name, -bp/--backend-path')
+
                 if args['entry_name'] in (config_handler.registered_entries()):
                     entry = config_handler.entry(args['entry_name'])
                     print('"{0}": entry name already registered as a {1} Entry'.format(args['entry_name'],
@@ -204,14 +344,15 @@ class EFSMOptionsParser(EFSTOptionsParser):
     @classmethod
     def _add_entry_groups(cls, parser, action_type = ConfKeyActionType.Register):
         required_args_group = parser.add_argument_group('Required Arguments')
-        cls._add_entry_name(required_args_group)
+        # with a manifest, the entries come from there
+        cls._add_entry_name(required_args_group, required = action_type != ConfKeyActionType.Create)
 
         # Backend store
         required_args_group.add_argument('-bp', '--backend-path', dest = 'backend_path',
             type = (lambda bpath:FSHelper.full_path(bpath)) \
                     if action_type == ConfKeyActionType.Create \
                         else (lambda bpath: cls._is_valid_dir_path(parser, bpath)),
-            required = True,
+            required = action_type != ConfKeyActionType.Create,
             help = 'Path to the back-end store folder. ' \
                 'The backend folder typically contains your ciphered data, for which a plaintext view folder is set up and registered. ' \
                 'That can reversed via the "--reverse" switch, which results in an on-demand ciphered view for your plaintext back-end data')
@@ -23,6 +23,3 @@ def check_encfs_installed():
         print(EncFSNotInstalled().default_message)
         sys.exit(0)
 
-# check encfs installed
-check_encfs_installed()
-
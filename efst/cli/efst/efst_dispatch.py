@@ -13,14 +13,11 @@
 ## GNU General Public License for more details.
 
 import efst.cli.efst.checks.chk_pv
-import efst.cli.efst.checks.chk_encfs
-import sys
-from distutils.util import strtobool
-from efst.utils.efst_utils import PasswordHandler
-from efst.encfs.encfs_handler import EncFSHandler
+import sys, json
+from collections import OrderedDict
+from efst.utils.efst_utils import PasswordHandler, strtobool, efst_version
 from efst.config.efst_config import config_handler
 from efst.cli.efst.efst_options import EFSTOptionsParser, EFSTCommands
-import pkg_resources
 
 
 class EFSTDispatcher:
@@ -39,6 +36,9 @@ class EFSTDispatcher:
         elif args['sub_cmd'] == EFSTCommands.INFO:
             self.print_info()
 
+        elif args['sub_cmd'] == EFSTCommands.CLI_BENCH:
+            self.cli_bench(args)
+
         else:
             # nothing to dispatch
             return False
@@ -49,8 +49,7 @@ class EFSTDispatcher:
     def print_version(self):
         ''' Prints EFST version info
         '''
-        version = pkg_resources.require("efst")[0].version
-        print('Encrypted File System Tools version {}'.format(version))
+        print('Encrypted File System Tools version {}'.format(efst_version() or 'unknown'))
 
     def print_info(self):
         ''' Prints EFST general info
@@ -58,9 +57,48 @@ class EFSTDispatcher:
         print('Encrypted File System Tools: {}'.format(self.option_parser.script_name))
         print(self.option_parser.description)
 
+    def cli_bench(self, args):
+        ''' Benchmarks EFST CLI calls latency, optionally comparing against a baseline
+        '''
+        from efst.utils.efst_clibench import CLIBenchmark
+        baseline = None
+        if args['baseline_file']:
+            try:
+                with open(args['baseline_file']) as baseline_file:
+                    baseline = json.load(baseline_file)['results']
+            except (OSError, ValueError, KeyError) as e:
+                print('Cannot read the baseline file: {}'.format(e))
+                sys.exit(1)
+
+        results = CLIBenchmark(runs = args['runs'], entry_names = args['entry_names'],
+                                                                    timeout = args['timeout']).run()
+        print()
+        self._print_cli_bench_table(results)
+
+        if args['output']:
+            report = OrderedDict([('metadata', CLIBenchmark.metadata()),
+                                  ('params', OrderedDict([('runs', args['runs']),
+                                                          ('entry_names', args['entry_names'] or []),
+                                                          ('timeout', args['timeout'])])),
+                                  ('results', results)])
+            with open(args['output'], 'w') as output_file:
+                json.dump(report, output_file, indent = 2)
+            print('\nResults written to: {}'.format(args['output']))
+
+        if baseline is not None:
+            regressions = CLIBenchmark.regressions(results, baseline, threshold = args['threshold'])
+            if not regressions:
+                print('\nNo regressions vs. baseline (threshold {}%)'.format(args['threshold']))
+                return
+            print('\nRegressions vs. baseline (threshold {}%):'.format(args['threshold']))
+            for name, baseline_ms, current_ms, change in regressions:
+                print('   {0}: {1} ms -> {2} ms (+{3}%)'.format(name, baseline_ms, current_ms, change))
+            sys.exit(1)
+
     def create_key(self, args):
         ''' Creates EncFS conf/key file at specified location
         '''
+        from efst.encfs.encfs_handler import EncFSHandler
         cfg_entry = config_handler.encfs_cfg_entry(args['config_entry'])
         pwd = PasswordHandler.get_pwd_input(confirm = True)
         if not pwd:
@@ -74,6 +112,28 @@ class EFSTDispatcher:
         return pwd, result
 
     # Internal helpers
+    @staticmethod
+    def _print_cli_bench_table(results):
+        ''' Prints out the benchmark results, a row per benchmark
+        '''
+        columns = ('runs', 'failures', 'min_ms', 'p50_ms', 'p95_ms', 'mean_ms')
+        rows = [['Benchmark'] + list(columns)]
+        for name, metrics in results.items():
+            rows.append([name] + ['{}'.format(metrics.get(column, '-')) for column in columns])
+        widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+        for row in rows:
+            print('   {}'.format('  '.join('{0:{1}{2}}'.format(value, '<' if column == 0 else '>', width)
+                                                    for column, (value, width) in enumerate(zip(row, widths)))))
+
+    @staticmethod
+    def _get_pwd(entry):
+        ''' Gets an entry password, unless its volume is unlocked in the EFST agent
+        '''
+        from efst.encfs.encfs_agent_client import EncFSAgentClient
+        if EncFSAgentClient().unlocked(entry.encfs_dir_path, entry.encfs_config_path):
+            return None, False
+        return PasswordHandler.get_pwd(entry.pwd_entry)
+
     def _store_pwd(self, pwd, pwd_entry):
         answer = input('Do you want to securely store the password for later use? [y/n]: ')
         try:
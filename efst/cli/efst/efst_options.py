@@ -12,10 +12,12 @@
 ## GNU General Public License for more details.
 
 import os
+from collections import OrderedDict
 from argparse import ArgumentParser, HelpFormatter
 from efst.config.efst_config import config_handler
 from efst.utils.efst_utils import FSHelper, UniquePartialMatchList
 from efst.config.efst_config import EFSTConfigKeys
+from efst.utils.efst_clibench import CLIBenchmark
 
 
 class EFSTCommands:
@@ -24,10 +26,12 @@ class EFSTCommands:
     SHOW = 'show'
     REGISTER = 'register'
     UNREGISTER = 'unregister'
+    CLI_BENCH = 'cli-bench'
 
     @classmethod
     def commands_meta(cls):
         return ''.join(('{',
+                        '{}, '.format(cls.CLI_BENCH),
                         '{}, '.format(cls.INFO),
                         '{}'.format(cls.VERSION),
                         '}'))
@@ -59,9 +63,15 @@ class EFSTOptionsParser:
         return self._script_name
 
     # Options Parsing Workflow
+    _parsed_args = None
+
     def parse_options(self):
         ''' General Options parsing workflow
+            The arguments are parsed once, for the base and the tool-specific dispatchers alike
         '''
+        if self._parsed_args is not None:
+            return self._parsed_args
+
         parser = ArgumentParser(prog = self._script_name,
                                     description = self._description,
                                         formatter_class=EFSTHelpFormatter)
@@ -72,6 +82,7 @@ class EFSTOptionsParser:
 
         self._check_args(args, parser)
 
+        self._parsed_args = args
         return args
 
     def parse_global_options(self, parser):
@@ -84,10 +95,52 @@ class EFSTOptionsParser:
         '''
         subparsers = parser.add_subparsers(dest = 'sub_cmd',
                                                 title = 'EFST commands',
-                                                    metavar = EFSTCommands.commands_meta())
+                                                    metavar = EFSTCommands.commands_meta(),
+                                                        parser_class = EFSTCommandParser)
         self._add_version(subparsers)
         self._add_info(subparsers)
 
+        # CLI latency benchmark
+        subparsers.add_parser(EFSTCommands.CLI_BENCH,
+                                   description = 'Benchmarks the latency of EFST CLI calls: ' \
+                                            'cold / warm startup of all entry points and, for given entries, ' \
+                                            'name encode / decode and mount / unmount cycles. ' \
+                                            'Exits with an error status if slower than a baseline',
+                                             formatter_class=EFSTHelpFormatter,
+                                             add_args = self._add_cli_bench_args)
+
+    def _add_cli_bench_args(self, cli_bench_parser):
+        ''' Adds the cli-bench command arguments
+        '''
+        optional_args_group = cli_bench_parser.add_argument_group('Additional Arguments')
+        optional_args_group.add_argument('-en', '--entry-names', dest = 'entry_names',
+                        type = str,
+                        nargs = '+',
+                        metavar = config_handler.registered_entries(),
+                        choices = UniquePartialMatchList(config_handler.registered_entries()),
+                        help = 'Registered EFST entries to benchmark encode / decode and mount / unmount for. ' \
+                                        'Their passwords need to be stored, as the commands run non-interactively')
+        optional_args_group.add_argument('-rn', '--runs', dest = 'runs',
+                        type = int,
+                        default = CLIBenchmark.DEFAULT_RUNS,
+                        help = 'Number of runs per benchmark, {} by default'.format(CLIBenchmark.DEFAULT_RUNS))
+        optional_args_group.add_argument('-o', '--output', dest = 'output',
+                        type = lambda opath: FSHelper.full_path(opath, check_parent_path = True),
+                        help = 'Path to a JSON file for the benchmark results')
+        optional_args_group.add_argument('-bf', '--baseline-file', dest = 'baseline_file',
+                        type = lambda bpath: self._is_valid_file_path(cli_bench_parser, bpath),
+                        help = 'Path to a JSON file with stored benchmark results to compare against')
+        optional_args_group.add_argument('-th', '--threshold', dest = 'threshold',
+                        type = float,
+                        default = CLIBenchmark.DEFAULT_THRESHOLD,
+                        help = 'Slowdown vs. the baseline median latency to flag as a regression, ' \
+                                                            'in %%, {} by default'.format(CLIBenchmark.DEFAULT_THRESHOLD))
+        advanced_args_group = cli_bench_parser.add_argument_group('Advanced Arguments')
+        advanced_args_group.add_argument('-to', '--timeout', dest = 'timeout',
+                        type = float,
+                        default = CLIBenchmark.DEFAULT_TIMEOUT,
+                        help = 'Seconds to wait for each CLI call, {} by default'.format(CLIBenchmark.DEFAULT_TIMEOUT))
+
     # Options checking
     def _check_args(self, args, parser):
         ''' Validation of supplied CLI arguments
@@ -109,6 +162,14 @@ class EFSTOptionsParser:
                 parser.print_help()
                 parser.exit()
 
+        elif args['sub_cmd'] == EFSTCommands.CLI_BENCH:
+            if args['entry_names']:
+                entries = UniquePartialMatchList(config_handler.registered_entries())
+                args['entry_names'] = list(OrderedDict.fromkeys(entries.find(entry_name)
+                                                                for entry_name in args['entry_names']))
+            if args['runs'] <= 0:
+                parser.error('The number of runs should be a positive number')
+
     @property
     def _default_command(self):
         ''' If no command was specified, print INFO by default
@@ -138,17 +199,32 @@ class EFSTOptionsParser:
             return path_arg
 
     @staticmethod
-    def _add_entry_name(parser, registered_only = False, help = 'EFST Entry name', show_batch_mount_symbol = False):
+    def _add_entry_name(parser, registered_only = False, help = 'EFST Entry name',
+                                                        show_batch_mount_symbol = False, required = True):
         parser.add_argument('-en', '--entry-name', dest = 'entry_name',
             type = str,
             metavar = config_handler.registered_entries(show_batch_mount_symbol = show_batch_mount_symbol)
                                                                                     if registered_only else None,
-            required = True,
+            required = required,
             choices = UniquePartialMatchList(
                             config_handler.registered_entries(show_batch_mount_symbol = show_batch_mount_symbol))
                                                                                     if registered_only else None,
             help = help)
 
+    @staticmethod
+    def _add_workers(parser, help = 'Number of parallel workers'):
+        parser.add_argument('-wn', '--workers', dest = 'workers',
+                        type = int,
+                        default = None,
+                        help = help)
+
+    @staticmethod
+    def _add_timeout(parser, timeout_op, help = 'Seconds to wait for the command'):
+        parser.add_argument('-to', '--timeout', dest = 'timeout',
+                        type = float,
+                        default = None,
+                        help = '{0}, defaults to the "{1}" timeout in efst.conf (0 for no timeout)'.format(help, timeout_op))
+
     @staticmethod
     def _add_config_entry(parser):
         ''' Preset config-entry argument
@@ -178,6 +254,22 @@ class EFSTOptionsParser:
                                         formatter_class=EFSTHelpFormatter)
 
 
+class EFSTCommandParser(ArgumentParser):
+    ''' Command sub-parser, adding its arguments only once the command gets parsed
+        This way the EFST config & the EncFS modules the arguments depend on
+        are only loaded for the command being run, and not e.g. for the top-level help
+    '''
+    def __init__(self, *args, add_args = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._add_args = add_args
+
+    def parse_known_args(self, args = None, namespace = None):
+        if self._add_args:
+            add_args, self._add_args = self._add_args, None
+            add_args(self)
+        return super().parse_known_args(args, namespace)
+
+
 class EFSTHelpFormatter(HelpFormatter):
     ''' Custom formatter for ArgumentParser
         Disables double metavar display, showing only for long-named options
@@ -11,11 +11,9 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os, sys, shutil
+import os, sys, shutil, threading
 from enum import IntEnum
 from collections import namedtuple
-from configobj import ConfigObj
-from pkg_resources import Requirement, resource_filename
 from efst.utils.efst_utils import FSHelper
 from efst.encfs.encfs_cfg import EncFSCFG
 
@@ -37,6 +35,7 @@ class EFSTConfigKeys:
     CIPHER_TEXT_ENTRIES_KEY = 'CipherTextEntries'
     REVERSED_CIPHER_TEXT_ENTRIES_KEY = 'ReversedCipherTextEntries'
     ENCFS_CFG_ENTRIES_KEY = 'EncFSConfigEntries'
+    TIMEOUTS_KEY = 'Timeouts'
 
     # UnRegistered entries placeholder
     NO_ENTRIES_REGISTERED = 'NoEntriesRegistered'
@@ -63,6 +62,8 @@ class EFSTConfigKeys:
     BLOCK_MAC_BYTES = 'blockMACBytes'
     BLOCK_MAC_RAND_BYTES = 'blockMACRandBytes'
     ALLOW_HOLES = 'allowHoles'
+    KDF_ITERATIONS = 'kdfIterations'
+    KDF_DURATION = 'kdfDuration'
 
     @staticmethod
     def entry_key_for_type(entry_type):
@@ -79,6 +80,19 @@ class EFSTConfigKeys:
             return EntryTypes.ReversedCipherText
 
 
+class CmdTimeouts:
+    ''' External commands timeouts per operation type, in seconds
+        The defaults can be overridden in the Timeouts section of efst.conf, with 0 for no timeout
+    '''
+    MOUNT = 'mount'
+    UMOUNT = 'umount'
+    PROBE = 'probe'
+    CTL = 'encfsctl'
+    CREATE = 'create'
+
+    DEFAULTS = {MOUNT: 60, UMOUNT: 10, PROBE: 5, CTL: 60, CREATE: 120}
+
+
 class ConfigEntries:
     EFSTEntry = namedtuple('EFSTEntry',
                         ['entry_type', 'pwd_entry', 'encfs_config_path', 'encfs_dir_path',
@@ -109,6 +123,10 @@ class OSConfig:
     def umount_cmd(self):
         return ''
 
+    @property
+    def lazy_umount_cmd(self):
+        return ''
+
     @property
     def volname_cmd(self):
         return ''
@@ -123,6 +141,18 @@ class OSConfig:
     def efst_user_dir_path(self):
         return FSHelper.full_path('~/efst')
 
+    @property
+    def efst_cache_dir_path(self):
+        return os.path.join(self.efst_user_dir_path, 'cache')
+
+    @property
+    def efst_index_dir_path(self):
+        return os.path.join(self.efst_user_dir_path, 'index')
+
+    @property
+    def efst_agent_socket_path(self):
+        return os.path.join(self.efst_user_dir_path, 'efst-agent.sock')
+
 
 class OSXConfig(OSConfig):
     ''' OSX-related config
@@ -135,6 +165,10 @@ class OSXConfig(OSConfig):
     def umount_cmd(self):
         return 'umount'
 
+    @property
+    def lazy_umount_cmd(self):
+        return 'umount -f'
+
     @property
     def volname_cmd(self):
         return '-o volname='
@@ -151,6 +185,10 @@ class LinuxConfig(OSConfig):
     def umount_cmd(self):
         return 'fusermount -u'
 
+    @property
+    def lazy_umount_cmd(self):
+        return 'fusermount -uz'
+
 
 class EFSTConfigHandler:
     def __init__(self):
@@ -170,14 +208,17 @@ class EFSTConfigHandler:
         self.usr_conf_data_path = os.path.join(self.os_config.efst_user_dir_path, 'efst.conf')
         if not os.path.exists(self.usr_conf_data_path):
             # stage from the efst conf template
+            from pkg_resources import Requirement, resource_filename
             lookup_path = resource_filename(Requirement.parse("efst"), "efst/config/efst.conf")
             shutil.copy(lookup_path, self.usr_conf_data_path)
 
+        from configobj import ConfigObj
         self.config = ConfigObj(self.usr_conf_data_path)
 
     def read_from_disk(self):
         ''' (Force-)Read conf data from disk
         '''
+        from configobj import ConfigObj
         self.config = ConfigObj(self.usr_conf_data_path)
 
 
@@ -186,15 +227,24 @@ class EFSTConfigHandler:
     def register_entry(self, entry_name, entry_info, quiet = False):
         ''' Registers EFST conf entry
         '''
-        if entry_name in self.registered_entries():
-            if not quiet:
-                if self._entry_key(entry_name) == EFSTConfigKeys.REVERSED_CIPHER_TEXT_ENTRIES_KEY:
-                    entry_type_str = 'Reversed CipherText'
-                else:
-                    entry_type_str = 'CipherText'
-                print('"{0}": entry name already registered as a {1} Entry'.format(entry_name, entry_type_str))
-            return False
-        else:
+        return bool(self.register_entries([(entry_name, entry_info)], quiet = quiet))
+
+    def register_entries(self, entries, quiet = False):
+        ''' Registers a batch of (entry name, entry info) EFST conf entries,
+            writing out the config once
+            Returns the names of the registered entries
+        '''
+        registered = []
+        for entry_name, entry_info in entries:
+            registered_key = self._entry_key(entry_name)
+            if registered_key:
+                if not quiet:
+                    if registered_key == EFSTConfigKeys.REVERSED_CIPHER_TEXT_ENTRIES_KEY:
+                        entry_type_str = 'Reversed CipherText'
+                    else:
+                        entry_type_str = 'CipherText'
+                    print('"{0}": entry name already registered as a {1} Entry'.format(entry_name, entry_type_str))
+                continue
             entry_key = EFSTConfigKeys.entry_key_for_type(entry_info.entry_type)
             self.config[entry_key][entry_name] = {
                     EFSTConfigKeys.PWD_ENTRY_NAME_KEY: entry_info.pwd_entry,
@@ -204,12 +254,14 @@ class EFSTConfigHandler:
                     EFSTConfigKeys.UNMOUNT_ON_IDLE_KEY: entry_info.unmount_on_idle,
                     EFSTConfigKeys.NO_BATCH_MOUNT_KEY: entry_info.no_batch_mount,
                     EFSTConfigKeys.VOLUME_NAME_KEY: entry_info.volume_name}
-            self.config.write()
+            registered.append(entry_name)
             if not quiet:
                 print('{0} Entry registered: {1}'.format(
                             'CipherText' if entry_key == EFSTConfigKeys.CIPHER_TEXT_ENTRIES_KEY
                                                                         else 'Reversed CipherText', entry_name))
-            return True
+        if registered:
+            self.config.write()
+        return registered
 
     def unregister_entry(self, entry_name, quiet = False):
         ''' Un-registers EFST conf entry
@@ -291,11 +343,31 @@ class EFSTConfigHandler:
                     EFSTConfigKeys.BLOCK_MAC_BYTES: entry_info.blockMACBytes,
                     EFSTConfigKeys.BLOCK_MAC_RAND_BYTES: entry_info.blockMACRandBytes,
                     EFSTConfigKeys.ALLOW_HOLES: entry_info.allowHoles}
+            if entry_info.kdfIterations:
+                self.config[EFSTConfigKeys.ENCFS_CFG_ENTRIES_KEY][entry_name].update({
+                    EFSTConfigKeys.KDF_ITERATIONS: entry_info.kdfIterations,
+                    EFSTConfigKeys.KDF_DURATION: entry_info.kdfDuration})
             self.config.write()
             if not quiet:
                 print('{0} entry registered'.format(entry_name))
             return True
 
+    def set_encfs_cfg_entry_kdf(self, entry_name, kdf_iterations, kdf_duration, quiet = False):
+        ''' Stores the key derivation cost with an EncFS configuration
+        '''
+        if not entry_name in self.registered_encfs_cfg_entries():
+            if not quiet:
+                print('"{0}": EncFS conf. entry not registered'.format(entry_name))
+            return False
+        else:
+            self.config[EFSTConfigKeys.ENCFS_CFG_ENTRIES_KEY][entry_name].update({
+                    EFSTConfigKeys.KDF_ITERATIONS: kdf_iterations,
+                    EFSTConfigKeys.KDF_DURATION: kdf_duration})
+            self.config.write()
+            if not quiet:
+                print('Stored with config entry: {}'.format(entry_name))
+            return True
+
     def unregister_encfs_cfg_entry(self, entry_name, quiet = False):
         ''' Un-registeres EncFS configuration
         '''
@@ -329,9 +401,27 @@ class EFSTConfigHandler:
                         entry_reader.get(EFSTConfigKeys.UNIQUE_IV),
                         entry_reader.get(EFSTConfigKeys.BLOCK_MAC_BYTES),
                         entry_reader.get(EFSTConfigKeys.BLOCK_MAC_RAND_BYTES),
-                        entry_reader.get(EFSTConfigKeys.ALLOW_HOLES))
+                        entry_reader.get(EFSTConfigKeys.ALLOW_HOLES),
+                        entry_reader.get(EFSTConfigKeys.KDF_ITERATIONS),
+                        entry_reader.get(EFSTConfigKeys.KDF_DURATION))
         return entry
 
+    # Timeouts
+    ###########
+    def cmd_timeout(self, op, timeout = None):
+        ''' Timeout for an external command operation type, unless explicitly given
+            Returns None for no timeout
+        '''
+        if timeout is None:
+            timeout = CmdTimeouts.DEFAULTS[op]
+            timeouts = self.config.get(EFSTConfigKeys.TIMEOUTS_KEY)
+            if timeouts and timeouts.get(op):
+                try:
+                    timeout = float(timeouts[op])
+                except ValueError:
+                    pass
+        return timeout if timeout and timeout > 0 else None
+
     # Internal helpers
     def _entry_key(self, entry_name):
         if entry_name in self.config[EFSTConfigKeys.CIPHER_TEXT_ENTRIES_KEY]:
@@ -341,5 +431,25 @@ class EFSTConfigHandler:
         else:
             return None
 
+
+class LazyConfigHandler:
+    ''' Stands in for the EFSTConfigHandler, only instantiating it on first use
+        so that importing EFST modules has no side effects (user folders, conf file staging / parsing)
+    '''
+    def __init__(self):
+        self._handler = None
+        self._lock = threading.Lock()
+
+    @property
+    def handler(self):
+        if self._handler is None:
+            with self._lock:
+                if self._handler is None:
+                    self._handler = EFSTConfigHandler()
+        return self._handler
+
+    def __getattr__(self, name):
+        return getattr(self.handler, name)
+
 # Simplest possible Singleton impl
-config_handler = EFSTConfigHandler()
+config_handler = LazyConfigHandler()
@@ -0,0 +1,186 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, time, random, hmac, hashlib
+from collections import namedtuple
+from efst.encfs.encfs_cfg import EncFSCipherAlg
+from efst.utils.efst_utils import strtobool
+from efst.encfs.encfs_codec import EncFSCipher, EncFSNameCodec, EncFSCodecNotSupported
+from efst.encfs.encfs_keygen import EncFSKeyGenerator
+
+
+''' EncFS block size advisor
+'''
+
+class EncFSBlockAdvisor:
+    ''' Recommends EncFS block size / block MAC settings for a plaintext tree
+        The tree gets sampled for its file sizes distribution, which along with the backing file system
+        block size gives the storage overhead of each candidate setting. Throughput is estimated relative
+        to the best candidate, from the measured cipher / MAC speed plus a fixed per-block cost,
+        and for random reads from the read amplification, i.e. whole EncFS blocks being decoded for each read
+    '''
+    TreeSample = namedtuple('TreeSample', ['files', 'total_size', 'sizes', 'fs_block_size'])
+    Candidate = namedtuple('Candidate', ['block_size', 'block_mac', 'storage_overhead',
+                                                    'seq_throughput', 'random_throughput', 'score'])
+
+    SEQUENTIAL, RANDOM, MIXED = 'sequential', 'random', 'mixed'
+    ACCESS_PATTERNS = (SEQUENTIAL, RANDOM, MIXED)
+
+    CANDIDATE_BLOCK_SIZES = (512, 1024, 2048, 4096)
+    DEFAULT_SAMPLE_SIZE = 10000
+    RANDOM_READ_SIZE = 4096
+    HEADER_BYTES = 8
+    # block MACs are recommended as long as they stay cheap
+    MAC_OVERHEAD_LIMIT = 0.01
+    MAC_SCORE_LIMIT = 0.9
+    # median file sizes telling small-files / large-files trees apart
+    RANDOM_ACCESS_FILE_SIZE = 64 * 1024
+    SEQUENTIAL_ACCESS_FILE_SIZE = 1024 * 1024
+    # fixed per-block cost (IV derivation, reading the block from the backing file),
+    # expressed in equivalent block encoding bytes
+    BLOCK_OVERHEAD_BYTES = 1024
+    CRYPTO_BENCH_BYTES = 4 * 1024 * 1024
+
+    @classmethod
+    def sample_tree(cls, target_path, backend_path = None, sample_size = DEFAULT_SAMPLE_SIZE):
+        ''' Samples the file sizes of a plaintext tree, along with the backing file system block size
+            Files are counted in full, with their sizes reservoir-sampled
+        '''
+        files, total_size, sizes = 0, 0, []
+        for dir_path, _, file_names in os.walk(target_path):
+            for file_name in file_names:
+                try:
+                    file_stat = os.lstat(os.path.join(dir_path, file_name))
+                except OSError:
+                    continue
+                files += 1
+                total_size += file_stat.st_size
+                if len(sizes) < sample_size:
+                    sizes.append(file_stat.st_size)
+                else:
+                    idx = random.randrange(files)
+                    if idx < sample_size:
+                        sizes[idx] = file_stat.st_size
+        fs_block_size = os.stat(backend_path if backend_path else target_path).st_blksize
+        return cls.TreeSample(files, total_size, sorted(sizes), fs_block_size)
+
+    @classmethod
+    def access_pattern(cls, tree_sample):
+        ''' Typical access pattern guessed from the median file size
+        '''
+        median = cls.size_percentile(tree_sample, 50)
+        if median < cls.RANDOM_ACCESS_FILE_SIZE:
+            return cls.RANDOM
+        elif median >= cls.SEQUENTIAL_ACCESS_FILE_SIZE:
+            return cls.SEQUENTIAL
+        return cls.MIXED
+
+    @classmethod
+    def candidates(cls, tree_sample, cfg_entry, access_pattern = MIXED, block_mac = None):
+        ''' Candidate block size / block MAC settings for a configuration entry, best first
+            With block_mac set to True / False, only the respective candidates are considered
+        '''
+        cipher_alg = EncFSCipherAlg(int(cfg_entry.cipherAlg))
+        block_sizes = set(cls.CANDIDATE_BLOCK_SIZES)
+        block_sizes.add(tree_sample.fs_block_size)
+        block_sizes = sorted(block_size for block_size in block_sizes
+                                                if block_size in EncFSCipherAlg.block_sizes(cipher_alg))
+        header_bytes = cls.HEADER_BYTES if strtobool(cfg_entry.uniqueIV) else 0
+        mac_bytes = EncFSKeyGenerator.BLOCK_MAC_BYTES + int(cfg_entry.blockMACRandBytes)
+        cipher_rate, mac_rate = cls._crypto_rates(cfg_entry)
+
+        candidates = []
+        for block_mac in ((False, True) if block_mac is None else (block_mac,)):
+            for block_size in block_sizes:
+                block_mac_bytes = mac_bytes if block_mac else 0
+                block_time = (block_size + cls.BLOCK_OVERHEAD_BYTES) / cipher_rate
+                if block_mac:
+                    block_time += block_size / mac_rate
+                # random reads decode (read_size - 1) / block_size + 1 blocks on average
+                random_blocks = (cls.RANDOM_READ_SIZE - 1 + block_size) / block_size
+                candidates.append([block_size, block_mac,
+                                        cls._storage_overhead(tree_sample, block_size, block_mac_bytes, header_bytes),
+                                        (block_size - block_mac_bytes) / block_time,
+                                        cls.RANDOM_READ_SIZE / (random_blocks * block_time)])
+
+        # relative to the best candidate
+        best_seq = max(candidate[3] for candidate in candidates)
+        best_random = max(candidate[4] for candidate in candidates)
+        scored = []
+        for block_size, block_mac, overhead, seq_throughput, random_throughput in candidates:
+            seq_throughput, random_throughput = seq_throughput / best_seq, random_throughput / best_random
+            if access_pattern == cls.SEQUENTIAL:
+                score = seq_throughput
+            elif access_pattern == cls.RANDOM:
+                score = random_throughput
+            else:
+                score = (seq_throughput + random_throughput) / 2
+            scored.append(cls.Candidate(block_size, block_mac, overhead, seq_throughput, random_throughput, score))
+        return sorted(scored, key = lambda candidate: (-candidate.score, candidate.storage_overhead))
+
+    @classmethod
+    def recommend(cls, candidates):
+        ''' The recommended candidate: the best one, with block MACs as long as these stay cheap
+        '''
+        best = candidates[0]
+        if best.block_mac:
+            return best
+        best_mac = next((candidate for candidate in candidates if candidate.block_mac), None)
+        if best_mac and best_mac.storage_overhead - best.storage_overhead <= cls.MAC_OVERHEAD_LIMIT \
+                                                    and best_mac.score >= best.score * cls.MAC_SCORE_LIMIT:
+            return best_mac
+        return best
+
+    @staticmethod
+    def size_percentile(tree_sample, percentile):
+        if not tree_sample.sizes:
+            return 0
+        return tree_sample.sizes[int(round(percentile / 100 * (len(tree_sample.sizes) - 1)))]
+
+    # Helpers
+    @staticmethod
+    def _storage_overhead(tree_sample, block_size, block_mac_bytes, header_bytes):
+        ''' Extra space the ciphertext takes on the backing file system, relative to the plaintext
+        '''
+        fs_block_size = tree_sample.fs_block_size
+        allocated = lambda size: -(-size // fs_block_size) * fs_block_size
+        plain_size = cipher_size = 0
+        for size in tree_sample.sizes:
+            plain_size += allocated(size)
+            if size:
+                blocks = -(-size // (block_size - block_mac_bytes))
+                size += blocks * block_mac_bytes + header_bytes
+            cipher_size += allocated(size)
+        return (cipher_size - plain_size) / plain_size if plain_size else 0.0
+
+    @classmethod
+    def _crypto_rates(cls, cfg_entry):
+        ''' Block encoding / block MAC speed (bytes/s), measured over a single large buffer
+            Without the in-process cipher, the block encoding speed is taken to be that of the MAC
+        '''
+        data = os.urandom(cls.CRYPTO_BENCH_BYTES)
+        mac = hmac.new(os.urandom(EncFSCipherAlg.default_key_size() // 8), digestmod = hashlib.sha1)
+        mac_rate = cls._timed_rate(lambda: mac.copy().update(data), len(data))
+        if not EncFSNameCodec.available():
+            return mac_rate, mac_rate
+        try:
+            key = EncFSCipher(EncFSCipherAlg.iface_name(cfg_entry.cipherAlg), int(cfg_entry.keySize)).new_key()
+        except EncFSCodecNotSupported:
+            return mac_rate, mac_rate
+        return cls._timed_rate(lambda: key.block_encode(data, 0), len(data)), mac_rate
+
+    @staticmethod
+    def _timed_rate(op, size):
+        start = time.perf_counter()
+        op()
+        return size / max(time.perf_counter() - start, 1e-9)
@@ -0,0 +1,212 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, sys, json, time, struct, socket, threading, socketserver
+from efst.encfs.encfs_handler import EncFSHandler
+from efst.encfs.encfs_agent_client import EncFSAgentClient, EncFSAgentError
+
+
+''' EFST unlock agent
+'''
+
+class EncFSAgent:
+    ''' Long-running agent holding unlocked volumes in memory, ssh-agent style
+        A volume is unlocked once, after which its derived key stays in the agent
+        for the requested time, serving name encode / decode and mount requests.
+        The agent exits once it has no unlocked volumes left
+    '''
+    IDLE_TIMEOUT = 60
+    # name round-tripped through encfsctl, when the password can not be checked in-process
+    CHECK_PWD_NAME = 'efst_agent_check'
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._volumes = {}
+        self._volumes_lock = threading.Lock()
+        self._volumes_changed = threading.Event()
+        self._server = None
+
+    def serve(self):
+        ''' Serves requests, until no unlocked volumes are left
+        '''
+        if EncFSAgentClient(self.socket_path).running():
+            # already there
+            return
+        if os.path.exists(self.socket_path):
+            # stale socket
+            os.remove(self.socket_path)
+
+        agent = self
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                if not agent._same_user(self.request):
+                    return
+                for line in self.rfile:
+                    try:
+                        response = agent._dispatch(json.loads(line.decode('utf-8')))
+                    except (EncFSAgentError, ValueError, KeyError, TypeError) as e:
+                        response = {'ok': False, 'error': str(e)}
+                    self.wfile.write('{}\n'.format(json.dumps(response)).encode('utf-8'))
+                    self.wfile.flush()
+
+        old_umask = os.umask(0o077)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon_threads = True
+
+        expiry_thread = threading.Thread(target = self._expire_volumes, daemon = True)
+        expiry_thread.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    # Requests
+    def _dispatch(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True}
+        elif op == 'unlock':
+            return self._unlock(request)
+        elif op == 'lock':
+            return self._lock(request)
+        elif op == 'status':
+            return self._status()
+        elif op == 'check':
+            return {'ok': True, 'unlocked': self._volume(request['enc_cfg_path'], required = False) is not None}
+        elif op in ('encode', 'decode'):
+            return self._translate(request, encode = (op == 'encode'))
+        elif op == 'mount':
+            return self._mount(request)
+        raise EncFSAgentError('Unknown request: {}'.format(op))
+
+    def _unlock(self, request):
+        enc_cfg_path, pwd = request['enc_cfg_path'], request['pwd']
+        pwd_valid = EncFSHandler.check_pwd(encfs_dir_path = request['encfs_dir_path'],
+                                                        enc_cfg_path = enc_cfg_path, pwd = pwd)
+        if pwd_valid is None:
+            # can not be checked in-process
+            pwd_valid = self._ctl_check_pwd(request['encfs_dir_path'], enc_cfg_path, pwd)
+        if not pwd_valid:
+            raise EncFSAgentError('Invalid password')
+        with self._volumes_lock:
+            self._volumes[enc_cfg_path] = {'entry_name': request['entry_name'],
+                                           'encfs_dir_path': request['encfs_dir_path'],
+                                           'pwd': pwd,
+                                           'expires': time.time() + request['ttl']}
+        self._volumes_changed.set()
+        return {'ok': True}
+
+    def _lock(self, request):
+        enc_cfg_path = request.get('enc_cfg_path')
+        with self._volumes_lock:
+            locked = [path for path in self._volumes if enc_cfg_path in (None, path)]
+            for path in locked:
+                self._forget(path)
+        self._volumes_changed.set()
+        return {'ok': True, 'locked': len(locked)}
+
+    def _status(self):
+        with self._volumes_lock:
+            volumes = [{'entry_name': volume['entry_name'], 'enc_cfg_path': path,
+                        'expires_in': max(0, int(volume['expires'] - time.time()))}
+                                                    for path, volume in sorted(self._volumes.items())]
+        return {'ok': True, 'pid': os.getpid(), 'volumes': volumes}
+
+    def _translate(self, request, encode):
+        enc_cfg_path = request['enc_cfg_path']
+        volume = self._volume(enc_cfg_path)
+        translate_many = EncFSHandler.encode_many if encode else EncFSHandler.decode_many
+        translated = dict(translate_many(encfs_dir_path = volume['encfs_dir_path'], enc_cfg_path = enc_cfg_path,
+                                                    filenames = request['names'], pwd = volume['pwd'], quiet = True))
+        return {'ok': True, 'names': [translated.get(name) for name in request['names']]}
+
+    def _mount(self, request):
+        enc_cfg_path = request['enc_cfg_path']
+        volume = self._volume(enc_cfg_path)
+        result = next(EncFSHandler.mount_many([EncFSHandler.MountRequest(volume['entry_name'], volume['pwd'],
+                                            enc_cfg_path, volume['encfs_dir_path'],
+                                            request['mount_dir_path'], request['mount_name'],
+                                            request['reverse'], request['unmount_on_idle'])]))
+        return {'ok': True, 'mounted': result.mounted, 'message': result.message}
+
+    # Helpers
+    def _volume(self, enc_cfg_path, required = True):
+        with self._volumes_lock:
+            volume = self._volumes.get(enc_cfg_path)
+            if volume and volume['expires'] <= time.time():
+                self._forget(enc_cfg_path)
+                volume = None
+        if not volume and required:
+            raise EncFSAgentError('Volume is not unlocked: {}'.format(enc_cfg_path))
+        return volume
+
+    @classmethod
+    def _ctl_check_pwd(cls, encfs_dir_path, enc_cfg_path, pwd):
+        ''' Checks a volume password via an encfsctl encode / decode round trip of a single name
+        '''
+        encoded = dict(EncFSHandler.encode_many(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path,
+                                                        filenames = [cls.CHECK_PWD_NAME], pwd = pwd, quiet = True))
+        encoded_name = encoded.get(cls.CHECK_PWD_NAME)
+        if not encoded_name:
+            return False
+        decoded = dict(EncFSHandler.decode_many(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path,
+                                                        filenames = [encoded_name], pwd = pwd, quiet = True))
+        return decoded.get(encoded_name) == cls.CHECK_PWD_NAME
+
+    def _forget(self, enc_cfg_path):
+        # expects the volumes lock to be held
+        del self._volumes[enc_cfg_path]
+        EncFSHandler.forget_volume(enc_cfg_path)
+
+    def _expire_volumes(self):
+        idle_since = None
+        while True:
+            with self._volumes_lock:
+                now = time.time()
+                for path in [path for path, volume in self._volumes.items() if volume['expires'] <= now]:
+                    self._forget(path)
+                if self._volumes:
+                    idle_since = None
+                    timeout = min(volume['expires'] for volume in self._volumes.values()) - now
+                else:
+                    # give it a bit of time before leaving, e.g. for the first unlock to arrive
+                    idle_since = idle_since or now
+                    if now - idle_since >= self.IDLE_TIMEOUT:
+                        break
+                    timeout = idle_since + self.IDLE_TIMEOUT - now
+            self._volumes_changed.wait(timeout = max(0, timeout))
+            self._volumes_changed.clear()
+        self._server.shutdown()
+
+    @staticmethod
+    def _same_user(sock):
+        ''' Only serves requests from processes of the same user,
+            on top of the socket file permissions
+        '''
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+        return uid == os.getuid()
+
+
+def main():
+    EncFSAgent(sys.argv[1]).serve()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, sys, json, time, subprocess
+from collections import namedtuple
+from efst.encfs.encfs_cfg import EncFSCFG
+from efst.encfs.encfs_codec import EncFSCodecError
+from efst.config.efst_config import config_handler
+
+
+''' EFST unlock agent client
+'''
+
+class EncFSAgentError(Exception):
+    pass
+
+
+class EncFSAgentClient:
+    ''' Talks to the EFST unlock agent over its unix socket
+        Requests and responses are JSON objects, one per line
+    '''
+    UnlockedVolume = namedtuple('UnlockedVolume', ['entry_name', 'enc_cfg_path', 'expires_in'])
+
+    DEFAULT_TTL_MINUTES = 30
+    START_TIMEOUT = 5
+
+    def __init__(self, socket_path = None):
+        self.socket_path = socket_path if socket_path else config_handler.os_config.efst_agent_socket_path
+
+    def running(self):
+        ''' Checks if the agent is up
+        '''
+        try:
+            self.request('ping')
+        except EncFSAgentError:
+            return False
+        return True
+
+    def start(self):
+        ''' Starts the agent in background, unless already running
+        '''
+        if self.running():
+            return True
+        subprocess.Popen([sys.executable, '-m', 'efst.encfs.encfs_agent', self.socket_path],
+                            stdin = subprocess.DEVNULL, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL,
+                                                                                        start_new_session = True)
+        deadline = time.time() + self.START_TIMEOUT
+        while time.time() < deadline:
+            if self.running():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def unlock(self, entry_name, encfs_dir_path, enc_cfg_path, pwd, ttl_minutes = DEFAULT_TTL_MINUTES):
+        ''' Unlocks a volume in the agent, starting the agent if needed
+            The agent checks the password before accepting it
+        '''
+        if not self.start():
+            raise EncFSAgentError('Could not start the EFST agent')
+        self.request('unlock', entry_name = entry_name, encfs_dir_path = encfs_dir_path,
+                                enc_cfg_path = self._cfg_path(encfs_dir_path, enc_cfg_path),
+                                                            pwd = pwd, ttl = ttl_minutes * 60)
+
+    def lock(self, encfs_dir_path = None, enc_cfg_path = None):
+        ''' Locks a volume, or all volumes when no volume is given
+            Returns the number of locked volumes
+        '''
+        return self.request('lock', enc_cfg_path = self._cfg_path(encfs_dir_path, enc_cfg_path)
+                                                                    if encfs_dir_path else None)['locked']
+
+    def status(self):
+        ''' Agent pid along with the list of its unlocked volumes
+        '''
+        response = self.request('status')
+        return response['pid'], [self.UnlockedVolume(**volume) for volume in response['volumes']]
+
+    def unlocked(self, encfs_dir_path, enc_cfg_path):
+        ''' Checks if a volume is unlocked in the agent
+        '''
+        try:
+            return self.request('check', enc_cfg_path = self._cfg_path(encfs_dir_path, enc_cfg_path))['unlocked']
+        except EncFSAgentError:
+            return False
+
+    def mount(self, encfs_dir_path, enc_cfg_path, mount_dir_path, mount_name,
+                                                                reverse = False, unmount_on_idle = None):
+        ''' Mounts an unlocked volume from the agent
+            Returns the mount result along with a message
+        '''
+        response = self.request('mount', enc_cfg_path = self._cfg_path(encfs_dir_path, enc_cfg_path),
+                                    mount_dir_path = mount_dir_path, mount_name = mount_name,
+                                        reverse = reverse, unmount_on_idle = unmount_on_idle, timeout = None)
+        return response['mounted'], response['message']
+
+    def request(self, op, timeout = 30, **params):
+        with self.connection(timeout = timeout) as connection:
+            return connection.request(op, **params)
+
+    def connection(self, timeout = 30):
+        return _EncFSAgentConnection(self.socket_path, timeout)
+
+    # Helpers
+    @staticmethod
+    def _cfg_path(encfs_dir_path, enc_cfg_path):
+        return os.path.realpath(enc_cfg_path if enc_cfg_path else
+                                    os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME))
+
+
+class _EncFSAgentConnection:
+    ''' A single connection to the agent, for a sequence of requests
+    '''
+    def __init__(self, socket_path, timeout):
+        import socket
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(socket_path)
+        except OSError as e:
+            self._sock.close()
+            raise EncFSAgentError('EFST agent is not running: {}'.format(e))
+        self._stream = self._sock.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._stream.close()
+        self._sock.close()
+
+    def request(self, op, **params):
+        try:
+            self._stream.write('{}\n'.format(json.dumps(dict(params, op = op))).encode('utf-8'))
+            self._stream.flush()
+            response = self._stream.readline()
+        except OSError as e:
+            raise EncFSAgentError('Error while talking to the EFST agent: {}'.format(e))
+        if not response:
+            raise EncFSAgentError('EFST agent closed the connection')
+        response = json.loads(response.decode('utf-8'))
+        if not response.get('ok'):
+            raise EncFSAgentError(response.get('error', 'EFST agent request failed'))
+        return response
+
+
+class EncFSAgentCodec:
+    ''' Name codec for volumes unlocked in the agent,
+        same interface as EncFSNameCodec
+    '''
+    BATCH_SIZE = 512
+
+    def __init__(self, client, enc_cfg_path):
+        self._client = client
+        self._enc_cfg_path = enc_cfg_path
+
+    @classmethod
+    def for_volume(cls, encfs_dir_path, enc_cfg_path):
+        ''' Agent codec for a volume, or None if the volume is not unlocked in the agent
+        '''
+        client = EncFSAgentClient()
+        if not client.unlocked(encfs_dir_path, enc_cfg_path):
+            return None
+        return cls(client, EncFSAgentClient._cfg_path(encfs_dir_path, enc_cfg_path))
+
+    def encode(self, path):
+        return self._translate_one(path, encode = True)
+
+    def decode(self, path):
+        return self._translate_one(path, encode = False)
+
+    def encode_many(self, paths):
+        return self._translate_many(paths, encode = True)
+
+    def decode_many(self, paths):
+        return self._translate_many(paths, encode = False)
+
+    # Helpers
+    def _translate_one(self, path, encode):
+        translated = next(self._translate_many((path,), encode))[1]
+        if translated is None:
+            raise EncFSCodecError('Could not {0} name: {1}'.format('encode' if encode else 'decode', path))
+        return translated
+
+    def _translate_many(self, paths, encode):
+        paths = iter(paths)
+        try:
+            with self._client.connection() as connection:
+                while True:
+                    batch = [path for _, path in zip(range(self.BATCH_SIZE), paths)]
+                    if not batch:
+                        break
+                    response = connection.request('encode' if encode else 'decode',
+                                                        enc_cfg_path = self._enc_cfg_path, names = batch)
+                    for pair in zip(batch, response['names']):
+                        yield pair
+        except EncFSAgentError as e:
+            raise EncFSCodecError(e.args[0])
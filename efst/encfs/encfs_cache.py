@@ -0,0 +1,208 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, json, zlib, hmac, hashlib, threading
+from collections import OrderedDict, namedtuple
+
+
+''' Persistent EncFS caches
+'''
+
+class EncFSNameCache:
+    ''' Per-volume LRU cache of plaintext <-> ciphertext name mappings,
+        stored encrypted at rest under a key derived from the volume password.
+        Cache files are named by a hash of the volume conf/key file,
+        so re-keying a volume invalidates its cache
+    '''
+    NameCacheStats = namedtuple('NameCacheStats', ['hits', 'misses', 'entries', 'max_entries'])
+
+    DEFAULT_MAX_ENTRIES = 50000
+    KDF_ITERATIONS = 100000
+
+    _MAGIC = b'EFSTNC1'
+    _NONCE_LEN = 16
+    _TAG_LEN = 32
+
+    def __init__(self, cache_dir_path, enc_cfg_path, pwd, max_entries = DEFAULT_MAX_ENTRIES):
+        with open(enc_cfg_path, 'rb') as cfg_file:
+            cfg_digest = hashlib.sha256(cfg_file.read()).digest()
+        self.cache_path = os.path.join(cache_dir_path, '{}.cache'.format(cfg_digest.hex()[:32]))
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+
+        key = hashlib.pbkdf2_hmac('sha256', pwd.encode('utf-8'), cfg_digest, self.KDF_ITERATIONS, 64)
+        self._enc_key, self._mac_key = key[:32], key[32:]
+
+        self._lock = threading.Lock()
+        self._names = OrderedDict()     # plaintext -> ciphertext, in LRU order
+        self._reversed = {}             # ciphertext -> plaintext
+        self._dirty = False
+        self._load()
+
+    @property
+    def stats(self):
+        return self.NameCacheStats(self.hits, self.misses, len(self._names), self.max_entries)
+
+    def encoded(self, plain_name):
+        ''' Cached ciphertext name for a plaintext name, or None
+        '''
+        with self._lock:
+            cipher_name = self._names.get(plain_name)
+            self._count(plain_name if cipher_name else None)
+            return cipher_name
+
+    def decoded(self, cipher_name):
+        ''' Cached plaintext name for a ciphertext name, or None
+        '''
+        with self._lock:
+            plain_name = self._reversed.get(cipher_name)
+            self._count(plain_name)
+            return plain_name
+
+    def store(self, plain_name, cipher_name):
+        ''' Stores a name mapping, evicting the least recently used ones when full
+        '''
+        with self._lock:
+            if self._names.get(plain_name) == cipher_name:
+                return
+            self._discard(plain_name, self._reversed.get(cipher_name))
+            self._names[plain_name] = cipher_name
+            self._reversed[cipher_name] = plain_name
+            while len(self._names) > self.max_entries:
+                old_plain_name, old_cipher_name = self._names.popitem(last = False)
+                del self._reversed[old_cipher_name]
+            self._dirty = True
+
+    def save(self):
+        ''' Writes the cache to disk, if changed
+        '''
+        with self._lock:
+            if not self._dirty:
+                return
+            data = zlib.compress(json.dumps(list(self._names.items())).encode('utf-8'))
+            nonce = os.urandom(self._NONCE_LEN)
+            encrypted = self._crypt(data, nonce)
+            tag = hmac.new(self._mac_key, self._MAGIC + nonce + encrypted, hashlib.sha256).digest()
+
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok = True)
+            tmp_path = '{}.tmp{}'.format(self.cache_path, os.getpid())
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as cache_file:
+                cache_file.write(self._MAGIC + nonce + encrypted + tag)
+            os.replace(tmp_path, self.cache_path)
+            self._dirty = False
+
+    # Helpers
+    def _load(self):
+        try:
+            with open(self.cache_path, 'rb') as cache_file:
+                raw = cache_file.read()
+        except OSError:
+            return
+
+        header_len = len(self._MAGIC) + self._NONCE_LEN
+        if len(raw) < header_len + self._TAG_LEN or not raw.startswith(self._MAGIC):
+            return
+        nonce, encrypted, tag = raw[len(self._MAGIC):header_len], raw[header_len:-self._TAG_LEN], raw[-self._TAG_LEN:]
+        expected_tag = hmac.new(self._mac_key, raw[:-self._TAG_LEN], hashlib.sha256).digest()
+        if not hmac.compare_digest(tag, expected_tag):
+            # wrong password or a corrupted cache
+            return
+        try:
+            names = json.loads(zlib.decompress(self._crypt(encrypted, nonce)).decode('utf-8'))
+        except (zlib.error, ValueError):
+            return
+        for plain_name, cipher_name in names[-self.max_entries:]:
+            self._names[plain_name] = cipher_name
+            self._reversed[cipher_name] = plain_name
+
+    def _count(self, plain_name):
+        if plain_name is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._names.move_to_end(plain_name)
+
+    def _discard(self, plain_name, other_plain_name):
+        for name in (plain_name, other_plain_name):
+            if name in self._names:
+                del self._reversed[self._names.pop(name)]
+
+    def _crypt(self, data, nonce):
+        # HMAC-SHA256 in counter mode as a keystream
+        digest_size = hashlib.sha256().digest_size
+        keystream = b''.join(hmac.new(self._enc_key, nonce + counter.to_bytes(8, 'big'), hashlib.sha256).digest()
+                                        for counter in range((len(data) + digest_size - 1) // digest_size))
+        keystream = keystream[:len(data)]
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')).to_bytes(len(data), 'big')
+
+
+class EncFSCruftState:
+    ''' Per-volume directory state of the last cruft scan
+        For each scanned directory, keeps its mtime / inode along with
+        its sub-directories and un-decodable entries, so that unchanged
+        directories do not need to be re-scanned.
+        The state is reset when the volume conf/key file changes
+    '''
+    def __init__(self, state_path, encfs_dir_path, enc_cfg_path):
+        self.state_path = state_path
+        with open(enc_cfg_path, 'rb') as cfg_file:
+            self._header = {'encfs_dir_path': os.path.realpath(encfs_dir_path),
+                            'cfg_digest': hashlib.sha256(cfg_file.read()).hexdigest()}
+        self._dirs = {}
+        self._scanned_dirs = {}
+        self._load()
+
+    def cached_entries(self, rel_dir_path, dir_stat):
+        ''' The (rel path, translated, is_dir) sub-directories and cruft entries
+            of an unchanged directory, or None if the directory needs to be scanned
+        '''
+        dir_state = self._dirs.get(rel_dir_path)
+        if not dir_state or dir_state[:2] != [dir_stat.st_mtime_ns, dir_stat.st_ino]:
+            return None
+        return [(os.path.join(rel_dir_path, name) if rel_dir_path else name, True if translated else None, is_dir)
+                                                                    for name, is_dir, translated in dir_state[2]]
+
+    def update(self, rel_dir_path, dir_stat, dir_entries):
+        ''' Records the state of a scanned directory
+        '''
+        self._scanned_dirs[rel_dir_path] = [dir_stat.st_mtime_ns, dir_stat.st_ino,
+                                            [[os.path.basename(rel_path), is_dir, bool(translated)]
+                                                for rel_path, translated, is_dir in dir_entries
+                                                                            if is_dir or not translated]]
+
+    def save(self, complete = True):
+        ''' Writes the state to disk
+            After a complete scan, directories that were not visited are gone and get dropped.
+            Nothing gets written if no directory was scanned, e.g. when the volume root could not be read
+        '''
+        if not self._scanned_dirs:
+            return
+        dirs = self._scanned_dirs if complete else dict(self._dirs, **self._scanned_dirs)
+        state = dict(self._header, dirs = dirs)
+
+        os.makedirs(os.path.dirname(self.state_path), exist_ok = True)
+        tmp_path = '{}.tmp{}'.format(self.state_path, os.getpid())
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding = 'utf-8') as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, self.state_path)
+
+    # Helpers
+    def _load(self):
+        try:
+            with open(self.state_path, encoding = 'utf-8') as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return
+        if isinstance(state, dict) and all(state.get(key) == value for key, value in self._header.items()):
+            self._dirs = state.get('dirs', {})
+
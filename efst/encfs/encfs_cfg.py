@@ -11,7 +11,8 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os
+import os, errno, base64, tempfile, threading
+import xml.etree.ElementTree as ET
 from enum import Enum, unique
 from collections import namedtuple
 
@@ -26,11 +27,197 @@ class EncFSCFG:
     # EncFS Cfg Key Entry
     EncFSCfgEntry = namedtuple('EncFSCfgEntry',['cipherAlg', 'keySize', 'blockSize',
                                                 'nameAlg', 'chainedNameIV', 'uniqueIV',
-                                                'blockMACBytes', 'blockMACRandBytes', 'allowHoles'])
+                                                'blockMACBytes', 'blockMACRandBytes', 'allowHoles',
+                                                'kdfIterations', 'kdfDuration'])
+    # the key derivation cost is optional, calibrated on key creation unless set
+    EncFSCfgEntry.__new__.__defaults__ = (None, None)
     DEFAULT_CFG_FNAME = '.encfs6.xml'
 
     ENCFS_CONFIG = 'ENCFS6_CONFIG'
 
+    _cfg_files = {}
+    _cfg_files_lock = threading.Lock()
+
+    @classmethod
+    def read_cfg_file(cls, enc_cfg_path):
+        ''' Reads an EncFS v6 conf/key file into an EncFSCfgFile
+            Parsed files are cached by their modification time and size
+        '''
+        try:
+            cfg_stat = os.stat(enc_cfg_path)
+        except OSError as e:
+            raise EncFSCfgError('Could not read EncFS conf/key file: {}'.format(e))
+        cache_key = os.path.realpath(enc_cfg_path)
+        cfg_state = (cfg_stat.st_mtime_ns, cfg_stat.st_size)
+
+        with cls._cfg_files_lock:
+            cached = cls._cfg_files.get(cache_key)
+            if cached and cached[0] == cfg_state:
+                return cached[1]
+
+        cfg_file = EncFSCfgFile.parse(enc_cfg_path)
+        with cls._cfg_files_lock:
+            cls._cfg_files[cache_key] = (cfg_state, cfg_file)
+        return cfg_file
+
+
+class EncFSCfgError(Exception):
+    pass
+
+
+class EncFSCfgFile(namedtuple('EncFSCfgFile', ['version', 'creator',
+                                                'cipher_name', 'cipher_version', 'name_alg', 'name_version',
+                                                'key_size', 'block_size', 'unique_iv', 'chained_name_iv',
+                                                'external_iv_chaining', 'block_mac_bytes', 'block_mac_rand_bytes',
+                                                'allow_holes', 'encoded_key', 'salt', 'kdf_iterations',
+                                                'desired_kdf_duration'])):
+    ''' EncFS v6 conf/key file contents
+    '''
+    __slots__ = ()
+
+    CFG_VERSION = 20100713
+    BOOST_CFG_VERSION = 20
+
+    @classmethod
+    def parse(cls, enc_cfg_path):
+        ''' Parses an EncFS v6 (boost serialization) XML conf/key file
+        '''
+        try:
+            cfg = ET.parse(enc_cfg_path).getroot().find('cfg')
+            cfg_value = lambda tag: cfg.find(tag).text.strip()
+            cfg_int = lambda tag, default = None: int(cfg_value(tag)) if cfg.find(tag) is not None else default
+            cfg_iface = lambda tag: (cfg_value('{}/name'.format(tag)),
+                                        (cfg_int('{}/major'.format(tag)), cfg_int('{}/minor'.format(tag))))
+
+            cipher_name, cipher_version = cfg_iface('cipherAlg')
+            name_alg, name_version = cfg_iface('nameAlg')
+            return cls(version = cfg_int('version'),
+                       creator = cfg_value('creator') if cfg.find('creator') is not None else None,
+                       cipher_name = cipher_name, cipher_version = cipher_version,
+                       name_alg = name_alg, name_version = name_version,
+                       key_size = cfg_int('keySize'),
+                       block_size = cfg_int('blockSize'),
+                       unique_iv = bool(cfg_int('uniqueIV', 0)),
+                       chained_name_iv = bool(cfg_int('chainedNameIV', 0)),
+                       external_iv_chaining = bool(cfg_int('externalIVChaining', 0)),
+                       block_mac_bytes = cfg_int('blockMACBytes', 0),
+                       block_mac_rand_bytes = cfg_int('blockMACRandBytes', 0),
+                       allow_holes = bool(cfg_int('allowHoles', 0)),
+                       encoded_key = base64.b64decode(cfg_value('encodedKeyData')),
+                       salt = base64.b64decode(cfg_value('saltData')),
+                       kdf_iterations = cfg_int('kdfIterations'),
+                       desired_kdf_duration = cfg_int('desiredKDFDuration'))
+        except (OSError, ET.ParseError, AttributeError, TypeError, ValueError) as e:
+            raise EncFSCfgError('Could not read EncFS conf/key file: {}'.format(e))
+
+    def write(self, enc_cfg_path):
+        ''' Writes an EncFS v6 (boost serialization) XML conf/key file
+            The file is written next to its target and then linked into place,
+            raising EncFSCfgError if the target already exists
+        '''
+        from xml.sax.saxutils import escape as xml_escape
+        xml_bool = lambda value: 1 if value else 0
+        xml_b64 = lambda data: base64.b64encode(data).decode('ascii')
+        lines = ['<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>',
+                 '<!DOCTYPE boost_serialization>',
+                 '<boost_serialization signature="serialization::archive" version="11">',
+                 '<cfg class_id="0" tracking_level="0" version="{}">'.format(self.BOOST_CFG_VERSION),
+                 '\t<version>{}</version>'.format(self.version),
+                 '\t<creator>{}</creator>'.format(xml_escape(self.creator)),
+                 '\t<cipherAlg class_id="1" tracking_level="0" version="0">',
+                 '\t\t<name>{}</name>'.format(self.cipher_name),
+                 '\t\t<major>{}</major>'.format(self.cipher_version[0]),
+                 '\t\t<minor>{}</minor>'.format(self.cipher_version[1]),
+                 '\t</cipherAlg>',
+                 '\t<nameAlg>',
+                 '\t\t<name>{}</name>'.format(self.name_alg),
+                 '\t\t<major>{}</major>'.format(self.name_version[0]),
+                 '\t\t<minor>{}</minor>'.format(self.name_version[1]),
+                 '\t</nameAlg>',
+                 '\t<keySize>{}</keySize>'.format(self.key_size),
+                 '\t<blockSize>{}</blockSize>'.format(self.block_size),
+                 '\t<uniqueIV>{}</uniqueIV>'.format(xml_bool(self.unique_iv)),
+                 '\t<chainedNameIV>{}</chainedNameIV>'.format(xml_bool(self.chained_name_iv)),
+                 '\t<externalIVChaining>{}</externalIVChaining>'.format(xml_bool(self.external_iv_chaining)),
+                 '\t<blockMACBytes>{}</blockMACBytes>'.format(self.block_mac_bytes),
+                 '\t<blockMACRandBytes>{}</blockMACRandBytes>'.format(self.block_mac_rand_bytes),
+                 '\t<allowHoles>{}</allowHoles>'.format(xml_bool(self.allow_holes)),
+                 '\t<encodedKeySize>{}</encodedKeySize>'.format(len(self.encoded_key)),
+                 '\t<encodedKeyData>\n{}\n\t</encodedKeyData>'.format(xml_b64(self.encoded_key)),
+                 '\t<saltLen>{}</saltLen>'.format(len(self.salt)),
+                 '\t<saltData>\n{}\n\t</saltData>'.format(xml_b64(self.salt)),
+                 '\t<kdfIterations>{}</kdfIterations>'.format(self.kdf_iterations),
+                 '\t<desiredKDFDuration>{}</desiredKDFDuration>'.format(self.desired_kdf_duration),
+                 '</cfg>',
+                 '</boost_serialization>']
+
+        cfg_data = '\n'.join(lines) + '\n'
+        try:
+            tmp_fd, tmp_cfg_path = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(enc_cfg_path)),
+                                                    prefix = '{}.'.format(os.path.basename(enc_cfg_path)), suffix = '.tmp')
+            try:
+                with open(tmp_fd, 'w', encoding = 'utf-8') as cfg_file:
+                    cfg_file.write(cfg_data)
+                try:
+                    # never replaces an existing conf/key file, along with the volume key in it
+                    os.link(tmp_cfg_path, enc_cfg_path)
+                except FileExistsError:
+                    raise
+                except OSError as e:
+                    if e.errno not in self._NO_LINK_ERRNOS:
+                        raise
+                    # no hard links on the target file system
+                    self._write_exclusive(enc_cfg_path, cfg_data)
+            finally:
+                os.remove(tmp_cfg_path)
+        except FileExistsError:
+            raise EncFSCfgError('EncFS conf/key file already exists: {}'.format(enc_cfg_path))
+        except OSError as e:
+            raise EncFSCfgError('Could not write EncFS conf/key file: {}'.format(e))
+
+    _NO_LINK_ERRNOS = (errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK, errno.ENOSYS)
+
+    @staticmethod
+    def _write_exclusive(enc_cfg_path, cfg_data):
+        ''' Writes a new file, failing if it already exists
+            A partially written file gets removed
+        '''
+        cfg_fd = os.open(enc_cfg_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with open(cfg_fd, 'w', encoding = 'utf-8') as cfg_file:
+                cfg_file.write(cfg_data)
+        except OSError:
+            os.remove(enc_cfg_path)
+            raise
+
+    @property
+    def header_bytes(self):
+        ''' Per-file header size
+        '''
+        return 8 if self.unique_iv else 0
+
+    def info_lines(self):
+        ''' Human-readable summary, along the lines of "encfsctl info"
+        '''
+        lines = ['Version 6 configuration; created by {0} (revision {1})'.format(self.creator, self.version),
+                 'Filesystem cipher: "{0}", version {1}:{2}'.format(self.cipher_name, *self.cipher_version),
+                 'Filename encoding: "{0}", version {1}:{2}'.format(self.name_alg, *self.name_version),
+                 'Key Size: {} bits'.format(self.key_size),
+                 'Using PBKDF2, with {} iterations'.format(self.kdf_iterations),
+                 'Salt Size: {} bits'.format(len(self.salt) * 8),
+                 'Block Size: {} bytes'.format(self.block_size)]
+        if self.block_mac_bytes or self.block_mac_rand_bytes:
+            lines[-1] += ', including {} byte MAC header'.format(self.block_mac_bytes + self.block_mac_rand_bytes)
+        if self.unique_iv:
+            lines.append('Each file contains {} byte header with unique IV data.'.format(self.header_bytes))
+        if self.chained_name_iv:
+            lines.append('Filenames encoded using IV chaining mode.')
+        if self.external_iv_chaining:
+            lines.append('File data IV is chained to filename IV.')
+        if self.allow_holes:
+            lines.append('File holes passed through to ciphertext.')
+        return lines
+
 
 @unique
 class EncFSAlgorithms(Enum):
@@ -77,6 +264,18 @@ class EncFSCipherAlg(EncFSAlgorithms):
     AES = 1
     Blowfish = 2
 
+    @classmethod
+    def iface_name(cls, alg_type):
+        ''' Cipher interface name, as stored in the conf/key file
+        '''
+        return {cls.AES.value: 'ssl/aes', cls.Blowfish.value: 'ssl/blowfish'}.get(int(alg_type))
+
+    @classmethod
+    def iface_version(cls, alg_type):
+        ''' Cipher interface (major, minor) version, as written by current EncFS
+        '''
+        return (3, 0)
+
     @staticmethod
     def default_key_size():
         return 256
@@ -134,6 +333,20 @@ class EncFSNameAlg(EncFSAlgorithms):
     Plain  = 3
     Stream  = 4
 
+    @classmethod
+    def iface_name(cls, alg_type):
+        ''' Filename encoding interface name, as stored in the conf/key file
+        '''
+        return {cls.Block.value: 'nameio/block', cls.Block32.value: 'nameio/block32',
+                cls.Plain.value: 'nameio/null', cls.Stream.value: 'nameio/stream'}.get(int(alg_type))
+
+    @classmethod
+    def iface_version(cls, alg_type):
+        ''' Filename encoding interface (major, minor) version, as written by current EncFS
+        '''
+        return {cls.Block.value: (4, 0), cls.Block32.value: (4, 0),
+                cls.Plain.value: (1, 0), cls.Stream.value: (2, 1)}.get(int(alg_type))
+
 
 class EncFSUtils:
     ''' EncFS Utils
@@ -11,89 +11,144 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import sys, shlex, pexpect, io
-from distutils.util import strtobool
+import sys, shlex, io
+from collections import namedtuple
+from contextlib import contextmanager
 from efst.encfs.encfs_cfg import EncFSNameAlg, EncFSCFG
 from efst.config.efst_config import config_handler
+from efst.utils.efst_utils import CmdWatchdog, CmdProcessingError, strtobool
 
 ''' EncFS Commands Helpers
 '''
 
 class EncFSCommands:
+    ''' EncFS commands are built as argv lists, along with the environment
+        and the stdin input they need, and run directly with no shell in between.
+        Passwords go to the commands via stdin or via the environment,
+        so that they do not show up in the process list
+    '''
+    Cmd = namedtuple('Cmd', ['argv', 'env', 'input'])
+
+    # encfsctl reads names from stdin, so its password comes from an --extpass program
+    EXTPASS_ENV = 'EFST_EXTPASS'
+    EXTPASS_CMD = 'printenv {}'.format(EXTPASS_ENV)
+
     @staticmethod
     def build_cmd(encfs_dir_path, mount_dir_path, unmount_on_idle = None,
                             reverse = False, enc_cfg_path = None, mount_name = None, pwd = None):
         ''' Builds appropriate EnFS command
         '''
-        cmd = ''.join((
-                        'echo {} | '.format(shlex.quote(pwd)) if pwd else '',
-                        ' {0}={1}'.format(EncFSCFG.ENCFS_CONFIG, shlex.quote(enc_cfg_path)) if enc_cfg_path else '',
-                        ' encfs',
-                        ' -S' if pwd else '',
-                        ' --reverse' if reverse else '',
-                        ' --idle {}'.format(unmount_on_idle) if unmount_on_idle else '',
-                        ' {}'.format(shlex.quote(encfs_dir_path)),
-                        ' {}'.format(shlex.quote(mount_dir_path)),
-                        ' {0}{1}'.format(config_handler.os_config.volname_cmd, shlex.quote(mount_name)) \
-                                                if (config_handler.os_config.volname_cmd and mount_name) else ''
-                        ))
-        return cmd.strip()
+        argv = ['encfs']
+        if pwd:
+            argv.append('-S')
+        if reverse:
+            argv.append('--reverse')
+        if unmount_on_idle:
+            argv.extend(('--idle', str(unmount_on_idle)))
+        argv.extend((encfs_dir_path, mount_dir_path))
+        if config_handler.os_config.volname_cmd and mount_name:
+            argv.extend(shlex.split('{0}{1}'.format(config_handler.os_config.volname_cmd, shlex.quote(mount_name))))
+
+        return EncFSCommands.Cmd(argv, EncFSCommands._cfg_env(enc_cfg_path),
+                                                        '{}\n'.format(pwd) if pwd else None)
 
+    @staticmethod
+    def build_create_cmd(encfs_dir_path, mount_dir_path, cfg_entry, pwd):
+        ''' Builds non-interactive EnFS create command
+            With -S, encfs reads both the expert mode configuration answers and the password from stdin.
+            The filename encoding answer assumes Block32 is listed among the algorithms
+        '''
+        answers = ['x', cfg_entry.cipherAlg, cfg_entry.keySize, cfg_entry.blockSize, cfg_entry.nameAlg,
+                                                                cfg_entry.chainedNameIV, cfg_entry.uniqueIV]
+        if strtobool(cfg_entry.chainedNameIV) and strtobool(cfg_entry.uniqueIV):
+            # filename to IV header chaining
+            answers.append('n')
+        answers.extend((cfg_entry.blockMACBytes, cfg_entry.blockMACRandBytes, cfg_entry.allowHoles, pwd))
+
+        return EncFSCommands.Cmd(['encfs', '-S', encfs_dir_path, mount_dir_path], {},
+                                                        ''.join('{}\n'.format(answer) for answer in answers))
 
     @staticmethod
     def build_ctl_show_info_cmd(encfs_dir_path, enc_cfg_path = None):
         ''' Builds EnFSCtl info command
         '''
-        return ''.join((
-                        '{0}={1}'.format(EncFSCFG.ENCFS_CONFIG, shlex.quote(enc_cfg_path)) if enc_cfg_path else '',
-                        ' encfsctl info {}'.format(shlex.quote(encfs_dir_path))
-                        )).strip()
+        return EncFSCommands.Cmd(['encfsctl', 'info', encfs_dir_path], EncFSCommands._cfg_env(enc_cfg_path), None)
 
     @staticmethod
     def build_ctl_show_key_cmd(encfs_dir_path):
         ''' Builds EnFSCtl showKey command
+            showKey has no --extpass option and always prompts for the password
         '''
-        return 'encfsctl showKey {}'.format(shlex.quote(encfs_dir_path)).strip()
-
-
-    @staticmethod
-    def build_ctl_show_cruft_cmd(encfs_dir_path, cruft_path = None):
-        ''' Builds EnFSCtl showcruft command
-        '''
-        return ''.join(('/bin/bash -c "',
-                       'encfsctl showcruft {}'.format(shlex.quote(encfs_dir_path)),
-                       ' >> {}"'.format(shlex.quote(cruft_path)) if cruft_path else '"'
-                       )).strip()
+        return EncFSCommands.Cmd(['encfsctl', 'showKey', encfs_dir_path], {}, None)
 
     @staticmethod
     def build_ctl_encode_cmd(encfs_dir_path, enc_cfg_path, filename, pwd):
         ''' Builds EnFSCtl encode command
+            If no filename is given, encfsctl reads the names from stdin
         '''
-        return ''.join((
-                        '{0}={1}'.format(EncFSCFG.ENCFS_CONFIG, shlex.quote(enc_cfg_path)) if enc_cfg_path else '',
-                        ' encfsctl encode {}'.format(shlex.quote(encfs_dir_path)),
-                        ' {}'.format(shlex.quote(filename)),
-                        ' --extpass="echo {}"'.format(shlex.quote(pwd)),
-                        )).strip()
+        return EncFSCommands._build_ctl_translate_cmd('encode', encfs_dir_path, enc_cfg_path, filename, pwd)
 
     @staticmethod
     def build_ctl_decode_cmd(encfs_dir_path, enc_cfg_path, filename, pwd):
         ''' Builds EnFSCtl decode command
+            If no filename is given, encfsctl reads the names from stdin
+        '''
+        return EncFSCommands._build_ctl_translate_cmd('decode', encfs_dir_path, enc_cfg_path, filename, pwd)
+
+    @staticmethod
+    def run_expectant_cmd(cmd, cfg_entry, pwd, env = None, timeout = None, cancel = None):
+        ''' Creates new EncFS conf/key file, answering the interactive prompts
+        '''
+        with EncFSCommands._spawned(cmd, env = env, timeout = timeout, cancel = cancel) as child:
+            return EncFSCommands._answer_create_prompts(child, cfg_entry, pwd)
+
+    @staticmethod
+    def expectant_pwd(cmd, pwd, env = None, timeout = None, cancel = None):
+        ''' Extracts EncFS key value in plaintext
         '''
-        return ''.join((
-                        '{0}={1}'.format(EncFSCFG.ENCFS_CONFIG, shlex.quote(enc_cfg_path)) if enc_cfg_path else '',
-                        ' encfsctl decode {}'.format(shlex.quote(encfs_dir_path)),
-                        ' {}'.format(shlex.quote(filename)),
-                        ' --extpass="echo {}"'.format(shlex.quote(pwd)),
-                        )).strip()
+        import pexpect
+        with EncFSCommands._spawned(cmd, env = env, timeout = timeout, cancel = cancel) as child:
+            child.expect('EncFS Password')
 
+            output = io.StringIO()
+            child.logfile_read = output
+            child.sendline(pwd)
+
+            child.expect(pexpect.EOF)
+            child.close()
+
+            if child.exitstatus == 0:
+                return output.getvalue()
+
+            return None
+
+    # Helpers
     @staticmethod
-    def run_expectant_cmd(cmd, cfg_entry, pwd):
-        ''' Creates new EncFS conf/key file
+    @contextmanager
+    def _spawned(cmd, env = None, timeout = None, cancel = None):
+        ''' Spawns a command on a pseudo-terminal, to be killed once it runs out of time or gets cancelled
+            Unexpected output shows up as CmdProcessingError
         '''
-        print('Creating EncFS backend store...')
-        child = pexpect.spawnu(cmd)
+        import pexpect
+        child = pexpect.spawnu(cmd.argv[0], cmd.argv[1:], env = env, timeout = None)
+        try:
+            error = None
+            with CmdWatchdog(child.pid, timeout = timeout, cancel = cancel) as watchdog:
+                try:
+                    yield child
+                except pexpect.ExceptionPexpect as e:
+                    error = e
+            watchdog.check()
+            if error:
+                raise CmdProcessingError('Unexpected {0} output: {1}'.format(cmd.argv[0],
+                                                                    'end of output' if isinstance(error, pexpect.EOF)
+                                                                                    else type(error).__name__))
+        finally:
+            child.close(force = True)
 
+    @staticmethod
+    def _answer_create_prompts(child, cfg_entry, pwd):
+        import pexpect
         child.expect('>')
         child.sendline('x')
 
@@ -152,7 +207,7 @@ class EncFSCommands:
         child.expect('Verify Encfs Password')
         child.sendline(pwd)
 
-        child.expect(pexpect.EOF, timeout=None)
+        child.expect(pexpect.EOF)
         child.close()
 
         if child.exitstatus == 0:
@@ -161,22 +216,17 @@ class EncFSCommands:
         return False
 
     @staticmethod
-    def expectant_pwd(cmd, pwd):
-        ''' Extracts EncFS key value in plaintext
-        '''
-        child = pexpect.spawnu(cmd)
+    def _build_ctl_translate_cmd(op, encfs_dir_path, enc_cfg_path, filename, pwd):
+        argv = ['encfsctl', op, encfs_dir_path]
+        if filename:
+            argv.append(filename)
+        argv.append('--extpass={}'.format(EncFSCommands.EXTPASS_CMD))
 
-        child.expect('EncFS Password')
-
-        output = io.StringIO()
-        child.logfile_read = output
-        child.sendline(pwd)
-
-        child.expect(pexpect.EOF, timeout=None)
-        child.close()
-
-        if child.exitstatus == 0:
-            return output.getvalue()
-
-        return None
+        env = EncFSCommands._cfg_env(enc_cfg_path)
+        if pwd:
+            env[EncFSCommands.EXTPASS_ENV] = pwd
+        return EncFSCommands.Cmd(argv, env, None)
 
+    @staticmethod
+    def _cfg_env(enc_cfg_path):
+        return {EncFSCFG.ENCFS_CONFIG: enc_cfg_path} if enc_cfg_path else {}
@@ -0,0 +1,412 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, time, hashlib, hmac, struct
+from efst.encfs.encfs_cfg import EncFSCFG, EncFSCfgError
+
+# the "cryptography" primitives, imported on first use
+Cipher = algorithms = modes = default_backend = Blowfish = CFB = None
+_crypto_loaded = False
+
+def _load_crypto():
+    ''' Imports the "cryptography" primitives, if installed
+    '''
+    global Cipher, algorithms, modes, default_backend, Blowfish, CFB, _crypto_loaded
+    if not _crypto_loaded:
+        try:
+            from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+            from cryptography.hazmat.backends import default_backend
+            try:
+                from cryptography.hazmat.decrepit.ciphers.algorithms import Blowfish
+                from cryptography.hazmat.decrepit.ciphers.modes import CFB
+            except ImportError:
+                Blowfish, CFB = algorithms.Blowfish, modes.CFB
+        except ImportError:
+            Cipher = None
+        _crypto_loaded = True
+    return Cipher is not None
+
+
+''' In-process EncFS filename codec,
+    compatible with EncFS v6 volumes (ssl/aes, ssl/blowfish ciphers and
+    nameio/block, nameio/block32, nameio/stream, nameio/null name algorithms)
+'''
+
+class EncFSCodecError(Exception):
+    ''' Filename could not be encoded / decoded
+    '''
+    pass
+
+class EncFSCodecNotSupported(EncFSCodecError):
+    ''' The volume configuration is not supported by the in-process codec
+    '''
+    pass
+
+
+class EncFSCipher:
+    ''' EncFS SSL_Cipher primitives (interface version 3)
+    '''
+    KEY_CHECKSUM_BYTES = 4
+
+    BLOCK_SIZES = {'ssl/aes': 16, 'ssl/blowfish': 8}
+
+    def __init__(self, cipher_name, key_size):
+        if not _load_crypto():
+            raise EncFSCodecNotSupported('The "cryptography" package is required for the in-process codec')
+        if cipher_name == 'ssl/aes':
+            self._algorithm = algorithms.AES
+        elif cipher_name == 'ssl/blowfish':
+            self._algorithm = Blowfish
+        else:
+            raise EncFSCodecNotSupported('Cipher algorithm not supported: {}'.format(cipher_name))
+        self.block_size = self.BLOCK_SIZES[cipher_name]
+        self.key_len = key_size // 8
+        self.iv_len = self.block_size
+
+    def key_from_password(self, pwd, salt, iterations):
+        ''' Derives the user key from password via PBKDF2
+        '''
+        if not iterations:
+            raise EncFSCodecNotSupported('Legacy (non-PBKDF2) key derivation not supported')
+        return EncFSKey(self, hashlib.pbkdf2_hmac('sha1', pwd.encode('utf-8'), salt,
+                                                            iterations, self.key_len + self.iv_len))
+
+    def timed_key_from_password(self, pwd, salt, duration_ms):
+        ''' Derives the user key from password via PBKDF2,
+            with the number of iterations calibrated to take about the desired duration, as EncFS does
+            Returns the user key along with the number of iterations
+        '''
+        key_data, iterations, _ = self.timed_pbkdf2(pwd, salt, self.key_len + self.iv_len, duration_ms)
+        return EncFSKey(self, key_data), iterations
+
+    @staticmethod
+    def timed_pbkdf2(pwd, salt, key_len, duration_ms):
+        ''' Runs PBKDF2 with a growing number of iterations until it takes about the desired duration
+            Returns the derived key data, the number of iterations and the time it took (s)
+        '''
+        iterations, duration = 1000, duration_ms / 1000
+        while True:
+            start = time.perf_counter()
+            key_data = hashlib.pbkdf2_hmac('sha1', pwd.encode('utf-8'), salt, iterations, key_len)
+            elapsed = max(time.perf_counter() - start, 1e-6)
+            if elapsed < duration / 8:
+                iterations *= 4
+            elif elapsed < duration * 5 / 6:
+                iterations = int(iterations * duration / elapsed)
+            else:
+                return key_data, iterations, elapsed
+
+    def new_key(self):
+        ''' Random volume key
+        '''
+        return EncFSKey(self, os.urandom(self.key_len + self.iv_len))
+
+    def write_key(self, key, user_key):
+        ''' Encrypts the volume key with the user key, prefixed with the key checksum
+        '''
+        key_data = key.key + key.iv
+        checksum = user_key.mac_32(key_data)
+        return checksum.to_bytes(self.KEY_CHECKSUM_BYTES, 'big') + bytes(user_key.stream_encode(key_data, checksum))
+
+    def read_key(self, encoded_key, user_key):
+        ''' Decrypts the volume key with the user key, checking the key checksum
+        '''
+        checksum = int.from_bytes(encoded_key[:self.KEY_CHECKSUM_BYTES], 'big')
+        key_data = user_key.stream_decode(encoded_key[self.KEY_CHECKSUM_BYTES:
+                                                self.KEY_CHECKSUM_BYTES + self.key_len + self.iv_len], checksum)
+        if user_key.mac_32(key_data) != checksum:
+            raise EncFSCodecError('Invalid password')
+        return EncFSKey(self, key_data)
+
+
+class EncFSKey:
+    ''' EncFS cipher key, i.e. key bytes followed by IV bytes
+    '''
+    def __init__(self, cipher, key_data):
+        self._cipher = cipher
+        self.key = key_data[:cipher.key_len]
+        self.iv = key_data[cipher.key_len:cipher.key_len + cipher.iv_len]
+        self._algorithm = cipher._algorithm(self.key)
+        self._mac = hmac.new(self.key, digestmod = hashlib.sha1)
+
+    # MACs
+    def mac_64(self, data, chained_iv = None):
+        mac = self._mac.copy()
+        mac.update(data)
+        if chained_iv is not None:
+            mac.update(struct.pack('<Q', chained_iv))
+        md = mac.digest()
+
+        # fold the digest (minus its last byte) into 64 bits
+        folded = bytearray(8)
+        for i in range(len(md) - 1):
+            folded[i % 8] ^= md[i]
+        return int.from_bytes(folded, 'big')
+
+    def mac_32(self, data, chained_iv = None):
+        mac64 = self.mac_64(data, chained_iv)
+        return ((mac64 >> 32) ^ mac64) & 0xffffffff
+
+    def mac_16(self, data, chained_iv = None):
+        mac64 = self.mac_64(data, chained_iv)
+        mac32 = ((mac64 >> 32) ^ mac64) & 0xffffffff
+        return mac64, ((mac32 >> 16) ^ mac32) & 0xffff
+
+    # Stream / block coding
+    def stream_encode(self, data, iv64):
+        data = self._shuffle(data)
+        data = self._crypt(CFB, data, iv64, encrypt = True)
+        data = self._shuffle(self._flip(data))
+        return self._crypt(CFB, data, iv64 + 1, encrypt = True)
+
+    def stream_decode(self, data, iv64):
+        data = self._crypt(CFB, data, iv64 + 1, encrypt = False)
+        data = self._flip(self._unshuffle(data))
+        data = self._crypt(CFB, data, iv64, encrypt = False)
+        return self._unshuffle(data)
+
+    def block_encode(self, data, iv64):
+        return self._crypt(modes.CBC, data, iv64, encrypt = True)
+
+    def block_decode(self, data, iv64):
+        return self._crypt(modes.CBC, data, iv64, encrypt = False)
+
+    # Helpers
+    def _ivec(self, seed):
+        mac = self._mac.copy()
+        mac.update(self.iv)
+        mac.update(struct.pack('<Q', seed & 0xffffffffffffffff))
+        return mac.digest()[:self._cipher.iv_len]
+
+    def _crypt(self, mode, data, iv64, encrypt):
+        cipher = Cipher(self._algorithm, mode(self._ivec(iv64)), backend = default_backend())
+        ctx = cipher.encryptor() if encrypt else cipher.decryptor()
+        return ctx.update(bytes(data)) + ctx.finalize()
+
+    @staticmethod
+    def _shuffle(data):
+        data = bytearray(data)
+        for i in range(len(data) - 1):
+            data[i + 1] ^= data[i]
+        return data
+
+    @staticmethod
+    def _unshuffle(data):
+        data = bytearray(data)
+        for i in range(len(data) - 1, 0, -1):
+            data[i] ^= data[i - 1]
+        return data
+
+    @staticmethod
+    def _flip(data):
+        # reverses the bytes order within each 64-byte chunk
+        return bytearray(b''.join(bytes(data[i:i + 64])[::-1] for i in range(0, len(data), 64)))
+
+
+class EncFSNameCodec:
+    ''' EncFS filename codec
+        Unwraps the volume key once, after which names are encoded / decoded in-process
+    '''
+    _B64_ALPHABET = ',-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+    _B32_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+
+    def __init__(self, enc_cfg_path, pwd):
+        if not self.available():
+            raise EncFSCodecNotSupported('The "cryptography" package is required for in-process name coding')
+
+        cfg = self._read_cfg(enc_cfg_path)
+        self._cipher = EncFSCipher(cfg.cipher_name, cfg.key_size)
+        self._chained_iv = cfg.chained_name_iv
+
+        self._name_alg, self._name_major = cfg.name_alg, cfg.name_version[0]
+        if self._name_alg not in ('nameio/block', 'nameio/block32', 'nameio/stream', 'nameio/null'):
+            raise EncFSCodecNotSupported('Filename encoding not supported: {}'.format(self._name_alg))
+        if self._name_alg == 'nameio/stream' and self._name_major < 1:
+            raise EncFSCodecNotSupported('Legacy stream filename encoding not supported')
+
+        user_key = self._cipher.key_from_password(pwd, cfg.salt, cfg.kdf_iterations)
+        self._key = self._cipher.read_key(cfg.encoded_key, user_key)
+
+    @staticmethod
+    def available():
+        ''' Checks if in-process name coding is available
+        '''
+        return _load_crypto()
+
+    def encode(self, path):
+        ''' Encodes a (relative) plaintext path
+        '''
+        return self._recode_path(path, self.encode_name)
+
+    def decode(self, path):
+        ''' Decodes a (relative) ciphertext path
+        '''
+        return self._recode_path(path, self.decode_name)
+
+    def encode_many(self, paths):
+        ''' Yields (path, encoded) pairs, with encoded set to None for paths that could not be encoded
+        '''
+        return self._recode_many(paths, self.encode)
+
+    def decode_many(self, paths):
+        ''' Yields (path, decoded) pairs, with decoded set to None for paths that could not be decoded
+        '''
+        return self._recode_many(paths, self.decode)
+
+    def encode_name(self, name, iv = None):
+        ''' Encodes a single path element
+            Returns the encoded name along with the next chained IV
+        '''
+        if self._name_alg == 'nameio/null':
+            return name, iv
+        data = name.encode('utf-8')
+        if self._name_alg == 'nameio/stream':
+            return self._stream_encode(data, iv)
+        return self._block_encode(data, iv)
+
+    def decode_name(self, name, iv = None):
+        ''' Decodes a single path element
+            Returns the decoded name along with the next chained IV
+        '''
+        if self._name_alg == 'nameio/null':
+            return name, iv
+        if self._name_alg == 'nameio/stream':
+            data, iv = self._stream_decode(name, iv)
+        else:
+            data, iv = self._block_decode(name, iv)
+        try:
+            return data.decode('utf-8'), iv
+        except UnicodeDecodeError:
+            raise EncFSCodecError('Decoded name is not valid utf-8')
+
+    # Name algorithms
+    def _stream_encode(self, data, iv):
+        tmp_iv = iv if (iv is not None and self._name_major >= 2) else 0
+        next_iv, mac = self._key.mac_16(data, iv)
+        encoded = mac.to_bytes(2, 'big') + self._key.stream_encode(data, mac ^ tmp_iv)
+        return self._to_b64(encoded), self._next_iv(iv, next_iv)
+
+    def _stream_decode(self, name, iv):
+        data = self._from_b64(name)
+        if len(data) <= 2:
+            raise EncFSCodecError('Filename too small to decode')
+        mac = int.from_bytes(data[:2], 'big')
+        tmp_iv = iv if (iv is not None and self._name_major >= 2) else 0
+        decoded = bytes(self._key.stream_decode(data[2:], mac ^ tmp_iv))
+        next_iv, mac2 = self._key.mac_16(decoded, iv)
+        if mac2 != mac:
+            raise EncFSCodecError('Checksum mismatch in filename decode')
+        return decoded, self._next_iv(iv, next_iv)
+
+    def _block_encode(self, data, iv):
+        bs = self._cipher.block_size
+        padding = bs - len(data) % bs
+        padded = data + bytes((padding,)) * padding
+        tmp_iv = iv if (iv is not None and self._name_major >= 3) else 0
+        next_iv, mac = self._key.mac_16(padded, iv)
+        encoded = mac.to_bytes(2, 'big') + self._key.block_encode(padded, mac ^ tmp_iv)
+        if self._name_alg == 'nameio/block32':
+            return self._to_b32(encoded), self._next_iv(iv, next_iv)
+        return self._to_b64(encoded), self._next_iv(iv, next_iv)
+
+    def _block_decode(self, name, iv):
+        bs = self._cipher.block_size
+        data = self._from_b32(name) if self._name_alg == 'nameio/block32' else self._from_b64(name)
+        if len(data) - 2 < bs or (len(data) - 2) % bs:
+            raise EncFSCodecError('Filename too small to decode')
+        mac = int.from_bytes(data[:2], 'big')
+        tmp_iv = iv if (iv is not None and self._name_major >= 3) else 0
+        decoded = bytes(self._key.block_decode(data[2:], mac ^ tmp_iv))
+        padding = decoded[-1]
+        if padding > bs or padding > len(decoded):
+            raise EncFSCodecError('Invalid padding size')
+        next_iv, mac2 = self._key.mac_16(decoded, iv)
+        if mac2 != mac:
+            raise EncFSCodecError('Checksum mismatch in filename decode')
+        return decoded[:len(decoded) - padding], self._next_iv(iv, next_iv)
+
+    # Helpers
+    @staticmethod
+    def _recode_many(paths, recode):
+        for path in paths:
+            try:
+                yield path, recode(path)
+            except EncFSCodecError:
+                yield path, None
+
+    def _recode_path(self, path, recode_name):
+        iv = 0 if self._chained_iv else None
+        recoded = []
+        for name in path.split('/'):
+            if not name:
+                continue
+            if name in ('.', '..'):
+                recoded.append(name)
+                continue
+            name, iv = recode_name(name, iv)
+            recoded.append(name)
+        return '/'.join(recoded)
+
+    @staticmethod
+    def _next_iv(iv, mac64):
+        # the chained IV is only carried over when IV chaining is on
+        return None if iv is None else mac64
+
+    @staticmethod
+    def _change_base2(data, src_bits, dst_bits, partial_last):
+        work = work_bits = 0
+        mask = (1 << dst_bits) - 1
+        output = bytearray()
+        for value in data:
+            work |= value << work_bits
+            work_bits += src_bits
+            while work_bits >= dst_bits:
+                output.append(work & mask)
+                work >>= dst_bits
+                work_bits -= dst_bits
+        if partial_last and work_bits > 0:
+            output.append(work & mask)
+        return output
+
+    @classmethod
+    def _to_b64(cls, data):
+        return ''.join(cls._B64_ALPHABET[value] for value in cls._change_base2(data, 8, 6, True))
+
+    @classmethod
+    def _from_b64(cls, name):
+        try:
+            values = [cls._B64_ALPHABET.index(ch) for ch in name]
+        except ValueError:
+            raise EncFSCodecError('Not a valid encoded name: {}'.format(name))
+        return bytes(cls._change_base2(values, 6, 8, False))
+
+    @classmethod
+    def _to_b32(cls, data):
+        return ''.join(cls._B32_ALPHABET[value] for value in cls._change_base2(data, 8, 5, True))
+
+    @classmethod
+    def _from_b32(cls, name):
+        try:
+            values = [cls._B32_ALPHABET.index(ch) for ch in name.upper()]
+        except ValueError:
+            raise EncFSCodecError('Not a valid encoded name: {}'.format(name))
+        return bytes(cls._change_base2(values, 5, 8, False))
+
+    @staticmethod
+    def _read_cfg(enc_cfg_path):
+        ''' Reads the conf/key file
+        '''
+        try:
+            return EncFSCFG.read_cfg_file(enc_cfg_path)
+        except EncFSCfgError as e:
+            raise EncFSCodecNotSupported(e.args[0])
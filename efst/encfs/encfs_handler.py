@@ -11,102 +11,374 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os, shlex, shutil, copy
-from efst.encfs.encfs_cfg import EncFSCFG
+import os, sys, time, errno, shlex, subprocess, shutil, json, queue, hashlib, threading
+from collections import namedtuple, deque, defaultdict
+from contextlib import contextmanager
+from efst.encfs.encfs_cfg import EncFSCFG, EncFSCfgError, EncFSCipherAlg, EncFSNameAlg
 from efst.encfs.encfs_cmd import EncFSCommands
-from efst.utils.efst_utils import run_cmd, CmdProcessingError, temp_dir, FSHelper
-from efst.config.efst_config import config_handler
+from efst.encfs.encfs_session import EncFSSession
+from efst.encfs.encfs_codec import EncFSNameCodec, EncFSCodecError, EncFSCodecNotSupported
+from efst.encfs.encfs_keygen import EncFSKeyGenerator
+from efst.encfs.encfs_cache import EncFSNameCache, EncFSCruftState
+from efst.encfs.encfs_agent_client import EncFSAgentClient, EncFSAgentCodec, EncFSAgentError
+from efst.utils.efst_mounts import MountTable
+from efst.utils.efst_utils import run_cmd, CmdProcessingError, CmdTimeoutError, CmdCancelledError, temp_dir, FSHelper
+from efst.config.efst_config import config_handler, CmdTimeouts
 
 
 class EncFSHandler:
     ''' EncFS operations handler
     '''
+    _name_codecs = {}
+    _name_codecs_lock = threading.Lock()
+    _name_caches = {}
+    _name_caches_lock = threading.Lock()
+
+    CruftScanProgress = namedtuple('CruftScanProgress', ['resumed_dirs', 'unchanged_dirs', 'scanned_dirs',
+                                                        'pending_dirs', 'scanned_entries', 'cruft_entries'])
+    MountRequest = namedtuple('MountRequest', ['name', 'pwd', 'enc_cfg_path', 'encfs_dir_path', 'mount_dir_path',
+                                                                'mount_name', 'reverse', 'unmount_on_idle'])
+    MountResult = namedtuple('MountResult', ['name', 'mount_dir_path', 'mounted', 'message', 'elapsed'])
+    UmountResult = namedtuple('UmountResult', ['name', 'mount_dir_path', 'unmounted', 'lazy', 'message', 'elapsed'])
+    ProbeResult = namedtuple('ProbeResult', ['name', 'mount_dir_path', 'state', 'latency', 'message'])
+    CreateRequest = namedtuple('CreateRequest', ['name', 'pwd', 'cfg_entry', 'cfg_target_path'])
+    CreateResult = namedtuple('CreateResult', ['name', 'cfg_target_path', 'created', 'message', 'elapsed'])
+    MOUNT_WORKERS = 8
+    CREATE_WORKERS = os.cpu_count() or 4
+
+    PROBE_HEALTHY, PROBE_SLOW, PROBE_STALE = 'healthy', 'slow', 'stale'
+    PROBE_SLOW_THRESHOLD = 1.0
+    _PROBE_SCRIPT = 'import os, sys, time; start = time.time(); os.listdir(sys.argv[1]); print(time.time() - start)'
+
     @classmethod
-    def create_cfg_file(cls, pwd, cfg_entry, cfg_target_path):
+    def create_cfg_file(cls, pwd, cfg_entry, cfg_target_path, kdf_iterations = None,
+                                                                timeout = None, cancel = None, quiet = False):
         ''' Creates EncFS Conf/Key file at a given target path
+            The conf/key file is generated in-process when possible,
+            otherwise it is created by encfs on a temporary backend store
         '''
-        with temp_dir() as tmp_encfs:
-            with temp_dir() as tmp_mount:
-                cmd = EncFSCommands.build_cmd(encfs_dir_path = tmp_encfs, mount_dir_path = tmp_mount)
+        result, message = cls._create_cfg_file(pwd, cfg_entry, cfg_target_path, kdf_iterations = kdf_iterations,
+                                                            timeout = timeout, cancel = cancel, quiet = quiet)
+        if message and not quiet:
+            print(message)
+        return result
 
-                # if needed, temporarily reset the ENCFS6_CONFIG env variable
-                encfs6_config_backup = cls._encfs6_config_backup_and_reset()
+    @classmethod
+    def create_cfg_files(cls, create_requests, workers = None, timeout = None, cancel = None):
+        ''' Creates a batch of EncFS Conf/Key files concurrently
+            In-process generated files use the PBKDF2 iterations stored with their configuration entry,
+            or calibrated once per configuration entry
+            Once cancelled, running encfs commands are killed and the rest are not started
+            Yields CreateResult tuples as the conf/key files get created
+        '''
+        cancel = cancel or threading.Event()
+        create_requests = list(create_requests)
 
-                EncFSCommands.run_expectant_cmd(cmd, cfg_entry, pwd)
-                cls.umount(tmp_mount, quiet = True)
+        kdf_iterations = {}
+        if EncFSKeyGenerator.available():
+            for request in create_requests:
+                if request.cfg_entry not in kdf_iterations:
+                    try:
+                        kdf_iterations[request.cfg_entry] = EncFSKeyGenerator.kdf_iterations(request.cfg_entry)
+                    except EncFSCodecNotSupported:
+                        kdf_iterations[request.cfg_entry] = None
 
-                # if needed, restore the ENCFS6_CONFIG env variable
-                cls._encfs6_config_restore(encfs6_config_backup)
+        def create_request(request):
+            start = time.time()
+            if cancel.is_set():
+                return cls.CreateResult(request.name, request.cfg_target_path, False, 'Cancelled', 0.0)
+            try:
+                created, message = cls._create_cfg_file(request.pwd, request.cfg_entry, request.cfg_target_path,
+                                                    kdf_iterations = kdf_iterations.get(request.cfg_entry),
+                                                                timeout = timeout, cancel = cancel, quiet = True)
+            except OSError as e:
+                created, message = False, 'Error while creating conf/key file: {}'.format(e)
+            return cls.CreateResult(request.name, request.cfg_target_path, created, message, time.time() - start)
 
-                cfg_name = os.path.join(tmp_encfs, EncFSCFG.DEFAULT_CFG_FNAME)
-                if os.path.exists(cfg_name):
-                    if os.path.isdir(cfg_target_path):
-                        # if target path is directory,
-                        # compile default file name
-                        cfg_target_path = os.path.join(cfg_target_path, EncFSCFG.DEFAULT_CFG_FNAME)
+        # PBKDF2 runs outside of the GIL, and encfs in its own processes
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(max_workers = workers or cls.CREATE_WORKERS) as executor:
+            try:
+                for future in as_completed([executor.submit(create_request, request) for request in create_requests]):
+                    yield future.result()
+            except BaseException:
+                cancel.set()
+                raise
 
-                    if FSHelper.move_FS_entry(cfg_name, cfg_target_path, quiet = True):
-                        return True
-        return False
+    @classmethod
+    @contextmanager
+    def throwaway_volume(cls, cfg_entry, work_dir = None, timeout = None):
+        ''' Creates and mounts a temporary EncFS volume for a configuration entry, e.g. for benchmarking
+            Yields the mount folder path, with the volume un-mounted and removed afterwards
+        '''
+        pwd = os.urandom(16).hex()
+        with temp_dir(dir = work_dir) as tmp_encfs:
+            with temp_dir(dir = work_dir) as tmp_mount:
+                enc_cfg_path = os.path.join(tmp_encfs, EncFSCFG.DEFAULT_CFG_FNAME)
+                # no point in an expensive key derivation for a throwaway volume
+                created, message = cls._create_cfg_file(pwd, cfg_entry, enc_cfg_path,
+                                        kdf_iterations = EncFSKeyGenerator.MIN_KDF_ITERATIONS, quiet = True)
+                if not created:
+                    raise CmdProcessingError(message)
+                mounted, message = cls._mount(pwd, enc_cfg_path, tmp_encfs, tmp_mount, os.path.basename(tmp_mount),
+                                                                                                timeout = timeout)
+                if not mounted:
+                    raise CmdProcessingError(message)
+                try:
+                    yield tmp_mount
+                finally:
+                    cls._umount(tmp_mount, lazy_fallback = True)
 
     @classmethod
-    def mount(cls, pwd, enc_cfg_path, encfs_dir_path, mount_dir_path,
-                                    mount_name, reverse = False, unmount_on_idle = None, quiet = False):
+    def mount(cls, pwd, enc_cfg_path, encfs_dir_path, mount_dir_path, mount_name, reverse = False,
+                                        unmount_on_idle = None, timeout = None, cancel = None, quiet = False):
         ''' Mounts an exisiting EncFS backened
         '''
-        # validate inputs
-        result = False
-        if not cls._check_args(encfs_dir_path = encfs_dir_path,
-                                                enc_cfg_path = enc_cfg_path, quiet = quiet):
-            return result
+        result, message = cls._mount(pwd, enc_cfg_path, encfs_dir_path, mount_dir_path,
+                                        mount_name, reverse = reverse, unmount_on_idle = unmount_on_idle,
+                                                                            timeout = timeout, cancel = cancel)
+        if message and not quiet:
+            print(message)
+        return result
 
-        if not os.path.exists(mount_dir_path):
-            os.mkdir(mount_dir_path)
-        elif os.path.ismount(mount_dir_path):
-            if not quiet:
-                print('Already Mounted: {}'.format(mount_dir_path))
-            return result
+    @classmethod
+    def mount_many(cls, mount_requests, workers = None, timeout = None, cancel = None):
+        ''' Mounts a batch of EncFS backends concurrently
+            Nested mount points are only mounted once their parent mount point is mounted,
+            with the ones under a parent that failed to mount skipped
+            Once cancelled, running mounts are killed and the rest are not started
+            Yields MountResult tuples as the mounts complete
+        '''
+        cancel = cancel or threading.Event()
+        mount_requests = list(mount_requests)
+        mount_paths = [os.path.realpath(request.mount_dir_path) for request in mount_requests]
+        children, roots = defaultdict(list), []
+        for idx, parent_idx in enumerate(cls._parent_mount_points(mount_paths)):
+            if parent_idx is None:
+                roots.append(idx)
+            else:
+                children[parent_idx].append(idx)
 
-        cmd = EncFSCommands.build_cmd(encfs_dir_path = encfs_dir_path,
-                              mount_dir_path = mount_dir_path,
-                              reverse = reverse, unmount_on_idle = unmount_on_idle,
-                              enc_cfg_path = enc_cfg_path,
-                              mount_name = mount_name, pwd = pwd)
-        try:
-            run_cmd(cmd, shell = True)
-        except CmdProcessingError as e:
-            if not quiet:
-                print ('Error while mounting: {}'.format(e.args[0]))
-        else:
-            if not quiet:
-                print('Mounted: {}'.format(mount_dir_path))
-            result = True
+        def mount_request(idx):
+            start, request = time.time(), mount_requests[idx]
+            if cancel.is_set():
+                return idx, cls.MountResult(request.name, request.mount_dir_path, False, 'Cancelled', 0.0)
+            try:
+                mounted, message = cls._mount(request.pwd, request.enc_cfg_path, request.encfs_dir_path,
+                                                request.mount_dir_path, request.mount_name,
+                                                reverse = request.reverse, unmount_on_idle = request.unmount_on_idle,
+                                                                                timeout = timeout, cancel = cancel)
+            except OSError as e:
+                mounted, message = False, 'Error while mounting: {}'.format(e)
+            return idx, cls.MountResult(request.name, request.mount_dir_path, mounted, message, time.time() - start)
 
-        return result
+        def skipped(idx, parent_path):
+            for child_idx in children[idx]:
+                request = mount_requests[child_idx]
+                yield cls.MountResult(request.name, request.mount_dir_path, False,
+                                        'Skipped, parent mount point not mounted: {}'.format(parent_path), 0.0)
+                yield from skipped(child_idx, parent_path)
 
-    @staticmethod
-    def umount(mount_dir_path, quiet = False):
+        # mounting mostly waits on encfs start-up, rather than on the CPU
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        with ThreadPoolExecutor(max_workers = workers or cls.MOUNT_WORKERS) as executor:
+            try:
+                pending = set(executor.submit(mount_request, idx) for idx in roots)
+                while pending:
+                    done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        idx, result = future.result()
+                        yield result
+                        # already mounted parents are just as good
+                        if result.mounted or MountTable.is_mount(mount_paths[idx]):
+                            pending.update(executor.submit(mount_request, child_idx) for child_idx in children[idx])
+                        else:
+                            yield from skipped(idx, result.mount_dir_path)
+            except BaseException:
+                # interrupted, or the caller is done: no need to wait for the running mounts
+                cancel.set()
+                raise
+
+    @classmethod
+    def umount(cls, mount_dir_path, quiet = False, timeout = None, lazy_fallback = False, cancel = None):
         ''' Un-mounts a mounted EncFS backened
         '''
-        if not (os.path.exists(mount_dir_path) and os.path.ismount(mount_dir_path)):
-            if not quiet:
-                print('Not Mounted: {}'.format(mount_dir_path))
-            return False
+        result, lazy, message = cls._umount(mount_dir_path, timeout = timeout,
+                                                            lazy_fallback = lazy_fallback, cancel = cancel)
+        if message and not quiet:
+            print(message)
+        return result
 
-        cmd = '{0} {1}'.format(config_handler.os_config.umount_cmd, shlex.quote(mount_dir_path))
+    @classmethod
+    def umount_many(cls, umount_requests, workers = None, timeout = None, lazy_fallback = True, cancel = None):
+        ''' Un-mounts a batch of (name, mount folder path) entries concurrently
+            Each un-mount is given a deadline, after which (as well as for stale mounts)
+            it falls back to a lazy un-mount. Nested mount points are un-mounted before their parents
+            Once cancelled, running un-mounts are killed and the rest are not started
+            Yields UmountResult tuples as the un-mounts complete, within a bounded time
+        '''
+        timeout = config_handler.cmd_timeout(CmdTimeouts.UMOUNT, timeout)
+        cancel = cancel or threading.Event()
+        umount_requests = list(umount_requests)
+        mount_paths = [os.path.realpath(mount_dir_path) for _, mount_dir_path in umount_requests]
+        parents = cls._parent_mount_points(mount_paths)
+        waiting_on = defaultdict(int)
+        for parent_idx in parents:
+            if parent_idx is not None:
+                waiting_on[parent_idx] += 1
+
+        # plain daemon threads, so that hung un-mounts can be left behind
+        ready, done, started = queue.Queue(), queue.Queue(), {}
+        def umount_worker():
+            while True:
+                idx = ready.get()
+                started[idx] = time.time()
+                name, mount_dir_path = umount_requests[idx]
+                if cancel.is_set():
+                    done.put((idx, cls.UmountResult(name, mount_dir_path, False, False, 'Cancelled', 0.0)))
+                    continue
+                try:
+                    unmounted, lazy, message = cls._umount(mount_dir_path, timeout = timeout,
+                                                                lazy_fallback = lazy_fallback, cancel = cancel)
+                except OSError as e:
+                    unmounted, lazy, message = False, False, 'Error while unmounting: {}'.format(e)
+                done.put((idx, cls.UmountResult(name, mount_dir_path, unmounted, lazy, message,
+                                                                            time.time() - started[idx])))
+        def start_worker():
+            threading.Thread(target = umount_worker, daemon = True).start()
+
+        for _ in range(min(workers or cls.MOUNT_WORKERS, len(umount_requests))):
+            start_worker()
+        for idx in range(len(umount_requests)):
+            if not waiting_on[idx]:
+                ready.put(idx)
+
+        # regular and lazy un-mount attempts, plus a bit of slack
+        deadline = 2 * timeout + 1 if timeout else None
+        remaining = set(range(len(umount_requests)))
         try:
-            run_cmd(cmd, shell = True)
-        except CmdProcessingError as e:
-            if not quiet:
-                print ('Error while unmounting: {}'.format(e.args[0]))
-            return False
+            while remaining:
+                results = []
+                try:
+                    results.append(done.get(timeout = 0.1))
+                except queue.Empty:
+                    now = time.time()
+                    for idx in [idx for idx in remaining
+                                        if deadline and idx in started and now - started[idx] > deadline]:
+                        name, mount_dir_path = umount_requests[idx]
+                        results.append((idx, cls.UmountResult(name, mount_dir_path, False, False,
+                                            'Error while unmounting: timed out after {}s'.format(deadline),
+                                                                                        now - started[idx])))
+                        # replace the stuck worker
+                        start_worker()
+                for idx, result in results:
+                    if idx not in remaining:
+                        # already reported as timed out
+                        continue
+                    remaining.discard(idx)
+                    yield result
+                    parent_idx = parents[idx]
+                    if parent_idx is not None:
+                        waiting_on[parent_idx] -= 1
+                        if not waiting_on[parent_idx]:
+                            ready.put(parent_idx)
+        except BaseException:
+            # interrupted, or the caller is done: no need to wait for the running un-mounts
+            cancel.set()
+            raise
+
+    @classmethod
+    def probe_mounts(cls, probe_requests, workers = None, timeout = None,
+                                                            slow_threshold = PROBE_SLOW_THRESHOLD):
+        ''' Probes a batch of (name, mount folder path) mounts for responsiveness, concurrently
+            Each probe lists the mount folder from a child process, which is killed
+            if it does not respond in time, so that the probes finish within the timeout.
+            Yields ProbeResult tuples as the probes complete, with mounts classified as
+            healthy, slow (over the slow threshold) or stale (erroring out or not responding)
+        '''
+        timeout = config_handler.cmd_timeout(CmdTimeouts.PROBE, timeout)
+        def probe(name, mount_dir_path):
+            start = time.time()
+            proc = subprocess.Popen([sys.executable, '-S', '-c', cls._PROBE_SCRIPT, mount_dir_path],
+                                                    stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+            try:
+                output, errors = proc.communicate(timeout = timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                try:
+                    # processes stuck on a dead mount might take a while to go
+                    proc.wait(timeout = 1)
+                except subprocess.TimeoutExpired:
+                    pass
+                return cls.ProbeResult(name, mount_dir_path, cls.PROBE_STALE, time.time() - start,
+                                                                    'Not responding after {}s'.format(timeout))
+            if proc.returncode != 0:
+                error = next((line for line in reversed(errors.decode('utf-8').splitlines()) if line.strip()),
+                                                                                            'Probe failed')
+                return cls.ProbeResult(name, mount_dir_path, cls.PROBE_STALE, time.time() - start, error)
+
+            latency = float(output)
+            return cls.ProbeResult(name, mount_dir_path,
+                                    cls.PROBE_SLOW if latency > slow_threshold else cls.PROBE_HEALTHY, latency,
+                                            'Responded in {:.3f}s'.format(latency))
+
+        probe_requests = list(probe_requests)
+        if not probe_requests:
+            return
+        # all at once by default, to answer within the timeout
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(max_workers = workers or len(probe_requests)) as executor:
+            for future in as_completed([executor.submit(probe, name, mount_dir_path)
+                                                            for name, mount_dir_path in probe_requests]):
+                yield future.result()
+
+    @staticmethod
+    def encfs_pids():
+        ''' Running encfs processes, as a dictionary of their path arguments
+            (i.e. backend store and mount folder paths) to process ids
+        '''
+        encfs_pids = {}
+        if os.path.isdir('/proc'):
+            for pid in (pid for pid in os.listdir('/proc') if pid.isdigit()):
+                try:
+                    with open(os.path.join('/proc', pid, 'cmdline'), 'rb') as cmdline:
+                        args = cmdline.read().decode('utf-8', 'surrogateescape').split('\0')
+                except OSError:
+                    # gone already, or not ours to look at
+                    continue
+                if os.path.basename(args[0]) == 'encfs':
+                    encfs_pids.update((os.path.normpath(arg), int(pid)) for arg in args[1:] if os.path.isabs(arg))
         else:
+            try:
+                output = run_cmd('ps -axo pid=,command=')
+            except CmdProcessingError:
+                return encfs_pids
+            for line in output.splitlines():
+                pid, *args = line.split()
+                if args and os.path.basename(args[0]) == 'encfs':
+                    encfs_pids.update((os.path.normpath(arg), int(pid)) for arg in args[1:] if os.path.isabs(arg))
+        return encfs_pids
+
+    @classmethod
+    def backend_cfg(cls, encfs_dir_path, enc_cfg_path, quiet = False):
+        ''' EncFS backened conf/key file settings, read directly from the file
+        '''
+        # validate inputs
+        if not cls._check_args(encfs_dir_path = encfs_dir_path,
+                                                enc_cfg_path = enc_cfg_path, quiet = quiet):
+            return None
+
+        if not enc_cfg_path:
+            enc_cfg_path = os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME)
+        try:
+            return EncFSCFG.read_cfg_file(enc_cfg_path)
+        except EncFSCfgError as e:
             if not quiet:
-                print('Unmounted: {}'.format(mount_dir_path))
-            return True
+                print ('Error while getting EncFS backend info: {}'.format(e.args[0]))
+            return None
 
     @classmethod
-    def backend_info(cls, encfs_dir_path, enc_cfg_path, quiet = False):
+    def backend_info(cls, encfs_dir_path, enc_cfg_path, timeout = None, cancel = None, quiet = False):
         ''' EncFS backened general info
         '''
         # validate inputs
@@ -114,9 +386,16 @@ class EncFSHandler:
                                                 enc_cfg_path = enc_cfg_path, quiet = quiet):
             return None
 
+        # v6 conf/key files can be read directly,
+        # for anything else fall back to encfsctl
+        backend_cfg = cls.backend_cfg(encfs_dir_path, enc_cfg_path, quiet = True)
+        if backend_cfg:
+            return '\n'.join(backend_cfg.info_lines())
+
         cmd = EncFSCommands.build_ctl_show_info_cmd(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path)
         try:
-            output = run_cmd(cmd, shell = True)
+            output = EncFSSession(encfs_dir_path, enc_cfg_path).run_cmd(cmd,
+                                        timeout = config_handler.cmd_timeout(CmdTimeouts.CTL, timeout), cancel = cancel)
         except CmdProcessingError as e:
             if not quiet:
                 print ('Error while getting EncFS backend info: {}'.format(e.args[0]))
@@ -125,9 +404,10 @@ class EncFSHandler:
             return output
 
     @classmethod
-    def key_info(cls, encfs_dir_path, enc_cfg_path, pwd = None, quiet = False):
+    def key_info(cls, encfs_dir_path, enc_cfg_path, pwd = None, timeout = None, cancel = None, quiet = False):
         ''' EncFS key plaintext value
         '''
+        timeout = config_handler.cmd_timeout(CmdTimeouts.CTL, timeout)
         # validate inputs
         key_info = None
         if not cls._check_args(encfs_dir_path = encfs_dir_path,
@@ -137,57 +417,138 @@ class EncFSHandler:
         with temp_dir() as tmp_encfs:
             target_path = os.path.join(tmp_encfs, EncFSCFG.DEFAULT_CFG_FNAME)
             shutil.copy(enc_cfg_path, target_path)
+            # the conf/key file copy in the temp backend folder gets used
+            session = EncFSSession(tmp_encfs)
+            # showKey reads the password from the terminal only, so it gets answered via a pseudo-terminal
             cmd = EncFSCommands.build_ctl_show_key_cmd(encfs_dir_path = tmp_encfs)
             try:
-                # if needed, temporarily reset the ENCFS6_CONFIG env variable
-                encfs6_config_backup = cls._encfs6_config_backup_and_reset()
-
-                output = EncFSCommands.expectant_pwd(cmd, pwd)
+                output = session.expectant_pwd(cmd, pwd, timeout = timeout, cancel = cancel)
             except CmdProcessingError as e:
                 if not quiet:
                     print ('Error while getting EncFS key value info: {}'.format(e.args[0]))
             else:
                 key_info = cls._first_printable_line(output)
-            finally:
-                # if needed, restore the ENCFS6_CONFIG env variable
-                cls._encfs6_config_restore(encfs6_config_backup)
 
         return key_info
 
 
     @classmethod
-    def cruft_info(cls, encfs_dir_path, enc_cfg_path, target_cruft_path = None, pwd = None, quiet = False):
+    def cruft_info(cls, encfs_dir_path, enc_cfg_path, target_cruft_path = None, pwd = None,
+                                                                            state_path = None, quiet = False):
         ''' EncFS un-decodable filenames
+            Returns a summary line, with the detailed list optionally stored at target_cruft_path
+            With a state path, only directories changed since the previous scan are re-scanned
         '''
         # validate inputs
-        cruft_info = None
         if not cls._check_args(encfs_dir_path = encfs_dir_path,
                                                 enc_cfg_path = enc_cfg_path, quiet = quiet):
-            return cruft_info
+            return None
 
-        with temp_dir() as tmp_encfs:
-            tmp_cruft_path = os.path.join(tmp_encfs, 'cruft')
-            cmd = EncFSCommands.build_ctl_show_cruft_cmd(encfs_dir_path = encfs_dir_path,
-                                                                    cruft_path = tmp_cruft_path)
-            try:
-                # if needed, temporarily reset the ENCFS6_CONFIG env variable
-                encfs6_config_backup = cls._encfs6_config_backup_and_reset(enc_cfg_path)
+        cruft_cnt = 0
+        cruft_file = open(target_cruft_path, 'w', encoding = 'utf-8') if target_cruft_path else None
+        try:
+            for cruft_path, is_dir in cls.scan_cruft(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path,
+                                                                pwd = pwd, state_path = state_path, quiet = quiet):
+                cruft_cnt += 1
+                if cruft_file:
+                    cruft_file.write('{}\n'.format(cruft_path))
+        except EncFSCodecError as e:
+            if not quiet:
+                print ('Error while getting EncFS cruft info: {}'.format(e.args[0]))
+            return None
+        finally:
+            if cruft_file:
+                cruft_file.close()
 
-                cruft_info = EncFSCommands.expectant_pwd(cmd, pwd).strip()
-            except CmdProcessingError as e:
-                if not quiet:
-                    print ('Error while getting EncFS cruft info: {}'.format(e.args[0]))
-            else:
-                if tmp_cruft_path and target_cruft_path and os.path.exists(tmp_cruft_path):
-                    shutil.copy(tmp_cruft_path, target_cruft_path)
-            finally:
-                # if needed, restore the ENCFS6_CONFIG env variable
-                cls._encfs6_config_restore(encfs6_config_backup)
+        return 'Found {} invalid file(s).'.format(cruft_cnt)
+
+    @classmethod
+    def scan_cruft(cls, encfs_dir_path, enc_cfg_path, pwd, reverse = False, workers = None,
+                                checkpoint_path = None, state_path = None, progress = None,
+                                                                    timeout = None, cancel = None, quiet = False):
+        ''' Walks an EncFS backend store for un-decodable file entry names
+            Yields (backend path, is_dir) tuples for cruft entries as soon as they are found,
+            calling progress with a CruftScanProgress after each scanned directory
+            With a checkpoint path, scanned directories are recorded there as the scan goes,
+            and a subsequent scan resumes from where it stopped. The checkpoint is removed once complete
+            With a state path, the cruft found in directories that did not change
+            since the previous scan is reported from there, without re-scanning them
+            Raises EncFSCodecError if the password is not valid
+        '''
+        # validate inputs
+        if not cls._check_args(encfs_dir_path = encfs_dir_path,
+                                                enc_cfg_path = enc_cfg_path, quiet = quiet):
+            return
+
+        # plaintext backends of reversed entries get encoded, ciphertext ones decoded
+        translate_many = cls.encode_many if reverse else cls.decode_many
+        def translate_dir(rel_paths):
+            rel_paths = list(rel_paths)
+            translated = dict(translate_many(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path,
+                                                        filenames = rel_paths, pwd = pwd, timeout = timeout,
+                                                                                cancel = cancel, quiet = quiet))
+            # missing names mean encfsctl failed, rather than found cruft
+            if len(translated) < len(rel_paths):
+                raise OSError('Could not translate the file entry names in: {}'.format(
+                                                                    os.path.dirname(rel_paths[0]) or encfs_dir_path))
+            return translated
+
+        # fail early on a wrong password, instead of reporting everything as cruft
+        # with no in-process codec, translating the root directory fails instead
+        cls._name_codec(encfs_dir_path, enc_cfg_path, pwd)
+
+        done_dirs = cls._read_cruft_checkpoint(checkpoint_path, encfs_dir_path) if checkpoint_path else set()
+        checkpoint = cls._open_cruft_checkpoint(checkpoint_path, encfs_dir_path, done_dirs) if checkpoint_path else None
 
-        return cruft_info.strip() if cruft_info else None
+        cruft_state = EncFSCruftState(state_path, encfs_dir_path,
+                                        enc_cfg_path or os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME)) \
+                                                                                            if state_path else None
+
+        scan_progress = cls.CruftScanProgress(resumed_dirs = len(done_dirs), unchanged_dirs = 0,
+                                                scanned_dirs = 0, pending_dirs = 1, scanned_entries = 0, cruft_entries = 0)
+        def dir_done(rel_dir_path, dir_stat, dir_entries, cached, pending_dirs):
+            nonlocal scan_progress
+            scan_progress = scan_progress._replace(pending_dirs = pending_dirs)
+            if rel_dir_path not in done_dirs:
+                if checkpoint:
+                    checkpoint.write('{}\n'.format(json.dumps(rel_dir_path)))
+                    checkpoint.flush()
+                if cached:
+                    scan_progress = scan_progress._replace(unchanged_dirs = scan_progress.unchanged_dirs + 1)
+                else:
+                    scan_progress = scan_progress._replace(scanned_dirs = scan_progress.scanned_dirs + 1,
+                                                    scanned_entries = scan_progress.scanned_entries + len(dir_entries))
+                if cruft_state:
+                    cruft_state.update(rel_dir_path, dir_stat, dir_entries)
+            if progress:
+                progress(scan_progress)
+
+        skip_paths = set((os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME), enc_cfg_path))
+        complete = False
+        try:
+            for rel_path, translated, is_dir in cls._walk_backend_tree(encfs_dir_path, translate_dir, skip_paths,
+                                                    workers, done_dirs = done_dirs, dir_done = dir_done, quiet = quiet,
+                                                    cached_dir = cruft_state.cached_entries if cruft_state else None):
+                if not translated:
+                    scan_progress = scan_progress._replace(cruft_entries = scan_progress.cruft_entries + 1)
+                    yield rel_path, is_dir
+            complete = True
+        finally:
+            if checkpoint:
+                checkpoint.close()
+            if cruft_state:
+                try:
+                    cruft_state.save(complete = complete)
+                except OSError as e:
+                    if not quiet:
+                        print('Error while saving the cruft scan state: {}'.format(e))
+
+        # all done
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
 
     @classmethod
-    def encode(cls, encfs_dir_path, enc_cfg_path, filename, pwd, quiet = False):
+    def encode(cls, encfs_dir_path, enc_cfg_path, filename, pwd, timeout = None, cancel = None, quiet = False):
         ''' Encodes file entry name
         '''
         # validate inputs
@@ -195,11 +556,28 @@ class EncFSHandler:
                                                 enc_cfg_path = enc_cfg_path, quiet = quiet):
             return None
 
+        # if available, use the in-process name codec
+        try:
+            codec = cls._name_codec(encfs_dir_path, enc_cfg_path, pwd)
+            if codec:
+                return codec.encode(filename)
+        except EncFSCodecError as e:
+            if not quiet:
+                print ('Error while encoding: {}'.format(e.args[0]))
+            return None
+
+        # otherwise, consult the names cache before running encfsctl
+        name_cache = cls._name_cache(encfs_dir_path, enc_cfg_path, pwd)
+        encoded = name_cache.encoded(filename) if name_cache else None
+        if encoded:
+            return encoded
+
         cmd = EncFSCommands.build_ctl_encode_cmd(encfs_dir_path = encfs_dir_path,
                                                             enc_cfg_path = enc_cfg_path,
                                                                     filename = filename, pwd = pwd)
         try:
-            output = run_cmd(cmd, shell = True)
+            output = EncFSSession(encfs_dir_path, enc_cfg_path).run_cmd(cmd,
+                                        timeout = config_handler.cmd_timeout(CmdTimeouts.CTL, timeout), cancel = cancel)
         except CmdProcessingError as e:
             if not quiet:
                 print ('Error while encoding: {}'.format(e.args[0]))
@@ -207,12 +585,15 @@ class EncFSHandler:
         else:
             for encoded in output.splitlines():
                 if encoded:
+                    if name_cache:
+                        name_cache.store(filename, encoded)
+                        name_cache.save()
                     return encoded
 
         return None
 
     @classmethod
-    def decode(cls, encfs_dir_path, enc_cfg_path, filename, pwd, quiet = False):
+    def decode(cls, encfs_dir_path, enc_cfg_path, filename, pwd, timeout = None, cancel = None, quiet = False):
         ''' Decodes file entry name
         '''
 
@@ -220,11 +601,29 @@ class EncFSHandler:
         if not cls._check_args(encfs_dir_path = encfs_dir_path,
                                                 enc_cfg_path = enc_cfg_path, quiet = quiet):
             return None
+
+        # if available, use the in-process name codec
+        try:
+            codec = cls._name_codec(encfs_dir_path, enc_cfg_path, pwd)
+            if codec:
+                return codec.decode(filename)
+        except EncFSCodecError as e:
+            if not quiet:
+                print ('Error while decoding: {}'.format(e.args[0]))
+            return None
+
+        # otherwise, consult the names cache before running encfsctl
+        name_cache = cls._name_cache(encfs_dir_path, enc_cfg_path, pwd)
+        decoded = name_cache.decoded(filename) if name_cache else None
+        if decoded:
+            return decoded
+
         cmd = EncFSCommands.build_ctl_decode_cmd(encfs_dir_path = encfs_dir_path,
                                                             enc_cfg_path = enc_cfg_path,
                                                                     filename = filename, pwd = pwd)
         try:
-            output = run_cmd(cmd, shell = True)
+            output = EncFSSession(encfs_dir_path, enc_cfg_path).run_cmd(cmd,
+                                        timeout = config_handler.cmd_timeout(CmdTimeouts.CTL, timeout), cancel = cancel)
         except CmdProcessingError as e:
             if not quiet:
                 print ('Error while decoding: {}'.format(e.args[0]))
@@ -232,55 +631,493 @@ class EncFSHandler:
         else:
             for decoded in output.splitlines():
                 if decoded:
+                    if name_cache:
+                        name_cache.store(decoded, filename)
+                        name_cache.save()
                     return decoded
 
         return None
 
-    # Helpers
-    @staticmethod
-    def _check_args(encfs_dir_path = None, enc_cfg_path = None, quiet = False):
-        if enc_cfg_path and not (os.path.exists(enc_cfg_path) and os.path.isfile(enc_cfg_path)):
+    @classmethod
+    def encode_many(cls, encfs_dir_path, enc_cfg_path, filenames, pwd, timeout = None, cancel = None, quiet = False):
+        ''' Encodes a batch of file entry names, in-process or in a single encfsctl run
+            Yields (filename, encoded) pairs as they become available,
+            with encoded set to None for names that could not be encoded
+        '''
+        # validate inputs
+        if not cls._check_args(encfs_dir_path = encfs_dir_path,
+                                                enc_cfg_path = enc_cfg_path, quiet = quiet):
+            return iter(())
+
+        # if available, use the in-process name codec
+        try:
+            codec = cls._name_codec(encfs_dir_path, enc_cfg_path, pwd)
+        except EncFSCodecError as e:
             if not quiet:
-                print('Wrong conf/key path: {}'.format(enc_cfg_path))
-            return False
+                print ('Error while encoding: {}'.format(e.args[0]))
+            return iter(())
+        if codec:
+            return codec.encode_many(filenames)
 
-        if encfs_dir_path and not (os.path.exists(encfs_dir_path) and os.path.isdir(encfs_dir_path)):
+        cmd = EncFSCommands.build_ctl_encode_cmd(encfs_dir_path = encfs_dir_path,
+                                                            enc_cfg_path = enc_cfg_path,
+                                                                    filename = None, pwd = pwd)
+        name_cache = cls._name_cache(encfs_dir_path, enc_cfg_path, pwd)
+        return cls._translate_many(EncFSSession(encfs_dir_path, enc_cfg_path), cmd, filenames, 'encoding',
+                                    name_cache = name_cache, encode = True, quiet = quiet,
+                                        timeout = config_handler.cmd_timeout(CmdTimeouts.CTL, timeout), cancel = cancel)
+
+    @classmethod
+    def decode_many(cls, encfs_dir_path, enc_cfg_path, filenames, pwd, timeout = None, cancel = None, quiet = False):
+        ''' Decodes a batch of file entry names, in-process or in a single encfsctl run
+            Yields (filename, decoded) pairs as they become available,
+            with decoded set to None for names that could not be decoded
+        '''
+        # validate inputs
+        if not cls._check_args(encfs_dir_path = encfs_dir_path,
+                                                enc_cfg_path = enc_cfg_path, quiet = quiet):
+            return iter(())
+
+        # if available, use the in-process name codec
+        try:
+            codec = cls._name_codec(encfs_dir_path, enc_cfg_path, pwd)
+        except EncFSCodecError as e:
             if not quiet:
-                print('Wrong backend folder path: {}'.format(encfs_dir_path))
+                print ('Error while decoding: {}'.format(e.args[0]))
+            return iter(())
+        if codec:
+            return codec.decode_many(filenames)
+
+        cmd = EncFSCommands.build_ctl_decode_cmd(encfs_dir_path = encfs_dir_path,
+                                                            enc_cfg_path = enc_cfg_path,
+                                                                    filename = None, pwd = pwd)
+        name_cache = cls._name_cache(encfs_dir_path, enc_cfg_path, pwd)
+        return cls._translate_many(EncFSSession(encfs_dir_path, enc_cfg_path), cmd, filenames, 'decoding',
+                                    name_cache = name_cache, encode = False, quiet = quiet,
+                                        timeout = config_handler.cmd_timeout(CmdTimeouts.CTL, timeout), cancel = cancel)
+
+    @classmethod
+    def backend_tree(cls, encfs_dir_path, enc_cfg_path, pwd, reverse = False, workers = None,
+                                                                    timeout = None, cancel = None, quiet = False):
+        ''' Walks an EncFS backend store, translating all of its file entry names
+            Directories are processed concurrently, each one via a single batch encfsctl run
+            Yields (backend path, translated path, is_dir) tuples as they become available,
+            with translated path set to None for un-translatable entries
+        '''
+        # validate inputs
+        if not cls._check_args(encfs_dir_path = encfs_dir_path,
+                                                enc_cfg_path = enc_cfg_path, quiet = quiet):
+            return iter(())
+
+        # plaintext backends of reversed entries get encoded, ciphertext ones decoded
+        translate_many = cls.encode_many if reverse else cls.decode_many
+        def translate_dir(rel_paths):
+            return translate_many(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path, filenames = rel_paths,
+                                                pwd = pwd, timeout = timeout, cancel = cancel, quiet = quiet)
+
+        skip_paths = set((os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME), enc_cfg_path))
+        return cls._walk_backend_tree(encfs_dir_path, translate_dir, skip_paths, workers, quiet = quiet)
+
+    @classmethod
+    def check_pwd(cls, encfs_dir_path, enc_cfg_path, pwd):
+        ''' Checks a volume password by unwrapping the volume key
+            Returns None when the password can not be checked in-process
+        '''
+        if not pwd:
+            return False
+        try:
+            codec = cls._name_codec(encfs_dir_path, enc_cfg_path, pwd)
+        except EncFSCodecError:
             return False
+        return True if codec else None
 
-        return True
+    @classmethod
+    def forget_volume(cls, enc_cfg_path):
+        ''' Drops the cached name codecs and names caches of a volume
+        '''
+        enc_cfg_path = os.path.realpath(enc_cfg_path)
+        with cls._name_codecs_lock:
+            for codec_key in [codec_key for codec_key in cls._name_codecs if codec_key[0] == enc_cfg_path]:
+                del cls._name_codecs[codec_key]
+        with cls._name_caches_lock:
+            for cache_key in [cache_key for cache_key in cls._name_caches if cache_key[0] == enc_cfg_path]:
+                cls._name_caches.pop(cache_key).save()
 
+    @classmethod
+    def name_cache_stats(cls):
+        ''' Names cache statistics, summed over the volumes used so far
+        '''
+        with cls._name_caches_lock:
+            stats = [name_cache.stats for name_cache in cls._name_caches.values()]
+        return EncFSNameCache.NameCacheStats(*(sum(values) for values in zip(*stats))) if stats else None
 
-    @staticmethod
-    def _first_printable_line(lines):
-        if not lines:
+    # Helpers
+    @classmethod
+    def _name_codec(cls, encfs_dir_path, enc_cfg_path, pwd):
+        ''' In-process name codec for a given volume, or None when not available
+            Codecs are cached per conf/key file state and password,
+            so that the volume key is only unwrapped once.
+            With no password, volumes unlocked in the EFST agent are served by the agent
+        '''
+        if not enc_cfg_path:
+            enc_cfg_path = os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME)
+        if not pwd:
+            return EncFSAgentCodec.for_volume(encfs_dir_path, enc_cfg_path)
+        if not EncFSNameCodec.available():
+            return None
+        try:
+            cfg_stat = os.stat(enc_cfg_path)
+        except OSError:
             return None
+
+        codec_key = (os.path.realpath(enc_cfg_path), cfg_stat.st_mtime_ns, cfg_stat.st_size,
+                                                        hashlib.sha256(pwd.encode('utf-8')).digest())
+        with cls._name_codecs_lock:
+            codec = cls._name_codecs.get(codec_key)
+            if not codec:
+                try:
+                    codec = EncFSNameCodec(enc_cfg_path, pwd)
+                except EncFSCodecNotSupported:
+                    # fall back to encfsctl
+                    return None
+                cls._name_codecs[codec_key] = codec
+        return codec
+
+    @classmethod
+    def _name_cache(cls, encfs_dir_path, enc_cfg_path, pwd):
+        ''' Names cache for a given volume, or None when not available
+        '''
+        if not pwd:
+            return None
+        if not enc_cfg_path:
+            enc_cfg_path = os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME)
+
+        cache_key = (os.path.realpath(enc_cfg_path), hashlib.sha256(pwd.encode('utf-8')).digest())
+        with cls._name_caches_lock:
+            name_cache = cls._name_caches.get(cache_key)
+            if not name_cache:
+                try:
+                    name_cache = EncFSNameCache(config_handler.os_config.efst_cache_dir_path, enc_cfg_path, pwd)
+                except OSError:
+                    return None
+                cls._name_caches[cache_key] = name_cache
+        return name_cache
+
+    @staticmethod
+    def _walk_backend_tree(encfs_dir_path, translate_dir, skip_paths, workers,
+                                        done_dirs = None, cached_dir = None, dir_done = None, quiet = False):
+        ''' Walks the backend directories over a worker pool
+            Full relative paths are translated, so that chained name IVs are respected.
+            Sub-directories are only scheduled once their parent translated successfully
+            Entries of directories in done_dirs are not yielded, with only their sub-directories translated.
+            cached_dir is called with a directory relative path and stat, and can return
+            its already known (rel path, translated, is_dir) entries instead of scanning it.
+            Once all entries of a directory have been yielded, dir_done is called with the directory
+            relative path, stat, entries, whether they were cached, and the number of directories still pending
+            Raises EncFSCodecError if the root directory could not be read or translated
+        '''
+        done_dirs = done_dirs or set()
+        processed_dirs, root_errors = queue.Queue(), []
+        def process_dir(rel_dir_path):
+            dir_stat, dir_entries, translated, cached = None, [], {}, None
+            try:
+                dir_stat = os.stat(os.path.join(encfs_dir_path, rel_dir_path))
+                cached = cached_dir(rel_dir_path, dir_stat) if cached_dir else None
+                if cached is not None:
+                    return
+                with os.scandir(os.path.join(encfs_dir_path, rel_dir_path)) as it:
+                    for dir_entry in it:
+                        if dir_entry.path in skip_paths:
+                            continue
+                        is_dir = dir_entry.is_dir(follow_symlinks = False)
+                        if rel_dir_path in done_dirs and not is_dir:
+                            continue
+                        rel_path = os.path.join(rel_dir_path, dir_entry.name) if rel_dir_path else dir_entry.name
+                        dir_entries.append((rel_path, is_dir))
+                translated = dict(translate_dir(rel_path for rel_path, _ in dir_entries))
+            except (OSError, EncFSCodecError) as e:
+                if not rel_dir_path:
+                    # nothing can be scanned without the root directory, e.g. on a wrong password
+                    root_errors.append(e)
+                elif not quiet:
+                    print('Error while reading directory: {}'.format(e))
+                dir_entries = None
+            finally:
+                if cached is not None:
+                    dir_entries = cached
+                elif dir_entries is not None:
+                    dir_entries = [(rel_path, translated.get(rel_path), is_dir) for rel_path, is_dir in dir_entries]
+                processed_dirs.put((rel_dir_path, dir_stat, dir_entries, cached is not None))
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers = workers or os.cpu_count()) as executor:
+            executor.submit(process_dir, '')
+            pending_dirs = 1
+            while pending_dirs:
+                rel_dir_path, dir_stat, dir_entries, cached = processed_dirs.get()
+                pending_dirs -= 1
+                if dir_entries is None:
+                    if root_errors:
+                        raise EncFSCodecError('Could not read the EncFS backend store: {}'.format(root_errors[0]))
+                    # could not be read
+                    continue
+                for rel_path, translated, is_dir in sorted(dir_entries):
+                    if is_dir and translated:
+                        executor.submit(process_dir, rel_path)
+                        pending_dirs += 1
+                    if rel_dir_path not in done_dirs:
+                        yield rel_path, translated, is_dir
+                if dir_done:
+                    dir_done(rel_dir_path, dir_stat, dir_entries, cached, pending_dirs)
+
+    @staticmethod
+    def _translate_many(session, cmd, filenames, op_desc, name_cache = None, encode = True, quiet = False,
+                                                                                    timeout = None, cancel = None):
+        ''' Streams file entry names through a single encfsctl encode / decode process
+            Names found in the names cache are served directly,
+            and encfsctl is only started on the first cache miss
+        '''
+        filenames = iter(filenames)
+        lookup = (name_cache.encoded if encode else name_cache.decoded) if name_cache else (lambda name: None)
+        def store(filename, translated):
+            if name_cache and translated:
+                name_cache.store(*((filename, translated) if encode else (translated, filename)))
+
+        for filename in filenames:
+            translated = lookup(filename)
+            if not translated:
+                break
+            yield filename, translated
         else:
-            for line in lines.splitlines():
-                if (line):
-                    return line
+            return
+
+        # cache hits past the first miss are queued from the feeding thread
+        cache_hits = deque()
+        def cache_misses(first_miss):
+            yield first_miss
+            for filename in filenames:
+                translated = lookup(filename)
+                if translated:
+                    cache_hits.append((filename, translated))
+                else:
+                    yield filename
+        try:
+            for filename, translated in session.run_cmd_lines(cmd, cache_misses(filename),
+                                                                                timeout = timeout, cancel = cancel):
+                while cache_hits:
+                    yield cache_hits.popleft()
+                store(filename, translated)
+                yield filename, translated if translated else None
+            while cache_hits:
+                yield cache_hits.popleft()
+        except CmdProcessingError as e:
+            if not quiet:
+                print ('Error while {0}: {1}'.format(op_desc, e.args[0]))
+        finally:
+            if name_cache:
+                name_cache.save()
 
     @staticmethod
-    def _encfs6_config_backup_and_reset(encfs6_config_new = None):
-        encfs6_config_backup = None
-        if os.environ.get(EncFSCFG.ENCFS_CONFIG):
-            encfs6_config_backup = copy.copy(os.environ.get(EncFSCFG.ENCFS_CONFIG))
+    def _read_cruft_checkpoint(checkpoint_path, encfs_dir_path):
+        ''' Directories already scanned, as recorded in a cruft scan checkpoint
+        '''
+        try:
+            with open(checkpoint_path, encoding = 'utf-8') as checkpoint:
+                header = json.loads(checkpoint.readline())
+                if header.get('encfs_dir_path') != os.path.realpath(encfs_dir_path):
+                    return set()
+                return set(json.loads(line) for line in checkpoint if line.endswith('\n'))
+        except (OSError, ValueError, AttributeError):
+            return set()
 
-            if not encfs6_config_new:
-                del os.environ[EncFSCFG.ENCFS_CONFIG]
+    @staticmethod
+    def _open_cruft_checkpoint(checkpoint_path, encfs_dir_path, done_dirs):
+        if done_dirs:
+            return open(checkpoint_path, 'a', encoding = 'utf-8')
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok = True)
+        checkpoint = open(checkpoint_path, 'w', encoding = 'utf-8')
+        checkpoint.write('{}\n'.format(json.dumps({'encfs_dir_path': os.path.realpath(encfs_dir_path)})))
+        checkpoint.flush()
+        return checkpoint
 
-        if encfs6_config_new:
-            os.environ[EncFSCFG.ENCFS_CONFIG] = encfs6_config_new
+    @classmethod
+    def _create_cfg_file(cls, pwd, cfg_entry, cfg_target_path, kdf_iterations = None,
+                                                                timeout = None, cancel = None, quiet = False):
+        ''' Creates EncFS Conf/Key file, returning the result along with a message
+        '''
+        try:
+            EncFSKeyGenerator.create_cfg_file(cfg_entry, pwd, cfg_target_path, kdf_iterations = kdf_iterations)
+        except EncFSCodecNotSupported:
+            pass
+        except EncFSCfgError as e:
+            return False, e.args[0]
+        else:
+            return True, None
 
-        return encfs6_config_backup
+        timeout = config_handler.cmd_timeout(CmdTimeouts.CREATE, timeout)
+        message = None
+        with temp_dir() as tmp_encfs:
+            with temp_dir() as tmp_mount:
+                # the new conf/key file goes to the temp backend folder
+                session = EncFSSession(tmp_encfs)
+                cfg_name = os.path.join(tmp_encfs, EncFSCFG.DEFAULT_CFG_FNAME)
+
+                # feed the answers via stdin, falling back to the interactive prompts if that did not work out
+                if not quiet:
+                    print('Creating EncFS backend store...')
+                cmd = EncFSCommands.build_create_cmd(encfs_dir_path = tmp_encfs, mount_dir_path = tmp_mount,
+                                                                                cfg_entry = cfg_entry, pwd = pwd)
+                try:
+                    session.run_cmd(cmd, timeout = timeout, cancel = cancel)
+                except CmdCancelledError:
+                    cls.umount(tmp_mount, quiet = True)
+                    return False, 'Cancelled'
+                except CmdProcessingError:
+                    pass
+                cls.umount(tmp_mount, quiet = True)
+                if not cls._cfg_file_matches(cfg_name, cfg_entry):
+                    if os.path.exists(cfg_name):
+                        os.remove(cfg_name)
+                    cmd = EncFSCommands.build_cmd(encfs_dir_path = tmp_encfs, mount_dir_path = tmp_mount)
+                    try:
+                        session.run_expectant_cmd(cmd, cfg_entry, pwd, timeout = timeout, cancel = cancel)
+                    except CmdProcessingError as e:
+                        message = 'Error while creating EncFS backend store: {}'.format(e.args[0])
+                    finally:
+                        cls.umount(tmp_mount, quiet = True)
+
+                if os.path.exists(cfg_name):
+                    if os.path.isdir(cfg_target_path):
+                        # if target path is directory,
+                        # compile default file name
+                        cfg_target_path = os.path.join(cfg_target_path, EncFSCFG.DEFAULT_CFG_FNAME)
+
+                    if FSHelper.move_FS_entry(cfg_name, cfg_target_path, quiet = True):
+                        return True, None
+        return False, message or 'Could not create conf/key file: {}'.format(cfg_target_path)
+
+    @classmethod
+    def _mount(cls, pwd, enc_cfg_path, encfs_dir_path, mount_dir_path,
+                            mount_name, reverse = False, unmount_on_idle = None, timeout = None, cancel = None):
+        ''' Mounts an exisiting EncFS backened, returning the result along with a message
+            With no password, volumes unlocked in the EFST agent are mounted by the agent
+        '''
+        # validate inputs
+        args_error = cls._args_error(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path)
+        if args_error:
+            return False, args_error
+
+        if MountTable.is_mount(mount_dir_path):
+            return False, 'Already Mounted: {}'.format(mount_dir_path)
+        elif not os.path.exists(mount_dir_path):
+            os.mkdir(mount_dir_path)
+
+        if not pwd:
+            agent_client = EncFSAgentClient()
+            if agent_client.unlocked(encfs_dir_path, enc_cfg_path):
+                try:
+                    return agent_client.mount(encfs_dir_path, enc_cfg_path, mount_dir_path, mount_name,
+                                                        reverse = reverse, unmount_on_idle = unmount_on_idle)
+                except EncFSAgentError as e:
+                    return False, 'Error while mounting via the EFST agent: {}'.format(e)
+
+        cmd = EncFSCommands.build_cmd(encfs_dir_path = encfs_dir_path,
+                              mount_dir_path = mount_dir_path,
+                              reverse = reverse, unmount_on_idle = unmount_on_idle,
+                              enc_cfg_path = enc_cfg_path,
+                              mount_name = mount_name, pwd = pwd)
+        try:
+            EncFSSession(encfs_dir_path, enc_cfg_path).run_cmd(cmd,
+                                    timeout = config_handler.cmd_timeout(CmdTimeouts.MOUNT, timeout), cancel = cancel)
+        except CmdProcessingError as e:
+            return False, 'Error while mounting: {}'.format(e.args[0])
+
+        return True, 'Mounted: {}'.format(mount_dir_path)
 
     @staticmethod
-    def _encfs6_config_restore(encfs6_config_backup):
-        if encfs6_config_backup:
-            os.environ[EncFSCFG.ENCFS_CONFIG] = encfs6_config_backup
+    def _umount(mount_dir_path, timeout = None, lazy_fallback = False, cancel = None):
+        ''' Un-mounts a mounted EncFS backened, returning the result,
+            whether a lazy un-mount was needed, and a message
+            Stale mounts, as well as the ones that time out, get lazily un-mounted if requested
+        '''
+        if not MountTable.is_mount(mount_dir_path):
+            return False, False, 'Not Mounted: {}'.format(mount_dir_path)
+
+        timeout = config_handler.cmd_timeout(CmdTimeouts.UMOUNT, timeout)
+        cmd = shlex.split(config_handler.os_config.umount_cmd) + [mount_dir_path]
+        try:
+            run_cmd(cmd, timeout = timeout, cancel = cancel)
+        except CmdCancelledError as e:
+            return False, False, e.args[0]
+        except CmdTimeoutError as e:
+            umount_error = e.args[0]
+        except CmdProcessingError as e:
+            umount_error = e.args[0]
+            if os.strerror(errno.ENOTCONN) not in umount_error:
+                return False, False, 'Error while unmounting: {}'.format(umount_error)
         else:
-            if os.environ.get(EncFSCFG.ENCFS_CONFIG):
-                del os.environ[EncFSCFG.ENCFS_CONFIG]
+            return True, False, 'Unmounted: {}'.format(mount_dir_path)
+
+        lazy_umount_cmd = config_handler.os_config.lazy_umount_cmd
+        if not (lazy_fallback and lazy_umount_cmd):
+            return False, False, 'Error while unmounting: {}'.format(umount_error)
+        cmd = shlex.split(lazy_umount_cmd) + [mount_dir_path]
+        try:
+            run_cmd(cmd, timeout = timeout, cancel = cancel)
+        except CmdProcessingError as e:
+            return False, True, 'Error while lazily unmounting: {}'.format(e.args[0])
+        return True, True, 'Lazily unmounted ({0}): {1}'.format(umount_error.strip(), mount_dir_path)
+
+    @staticmethod
+    def _cfg_file_matches(enc_cfg_path, cfg_entry):
+        ''' Checks if a newly created conf/key file has the requested settings
+        '''
+        try:
+            backend_cfg = EncFSCFG.read_cfg_file(enc_cfg_path)
+            return (backend_cfg.cipher_name == EncFSCipherAlg.iface_name(cfg_entry.cipherAlg) and
+                        backend_cfg.name_alg == EncFSNameAlg.iface_name(cfg_entry.nameAlg) and
+                            backend_cfg.key_size == int(cfg_entry.keySize) and
+                                backend_cfg.block_size == int(cfg_entry.blockSize))
+        except (EncFSCfgError, TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _parent_mount_points(mount_paths):
+        ''' For each of the mount paths, the index of its closest parent mount path or None
+        '''
+        is_sub_path = lambda path, parent_path: path != parent_path and \
+                                                    os.path.commonpath((path, parent_path)) == parent_path
+        parents = []
+        for mount_path in mount_paths:
+            parent_idxs = [parent_idx for parent_idx, parent_path in enumerate(mount_paths)
+                                                                if is_sub_path(mount_path, parent_path)]
+            parents.append(max(parent_idxs, key = lambda parent_idx: len(mount_paths[parent_idx]))
+                                                                                if parent_idxs else None)
+        return parents
+
+    @staticmethod
+    def _check_args(encfs_dir_path = None, enc_cfg_path = None, quiet = False):
+        args_error = EncFSHandler._args_error(encfs_dir_path = encfs_dir_path, enc_cfg_path = enc_cfg_path)
+        if args_error and not quiet:
+            print(args_error)
+        return not args_error
+
+    @staticmethod
+    def _args_error(encfs_dir_path = None, enc_cfg_path = None):
+        if enc_cfg_path and not (os.path.exists(enc_cfg_path) and os.path.isfile(enc_cfg_path)):
+            return 'Wrong conf/key path: {}'.format(enc_cfg_path)
+
+        if encfs_dir_path and not (os.path.exists(encfs_dir_path) and os.path.isdir(encfs_dir_path)):
+            return 'Wrong backend folder path: {}'.format(encfs_dir_path)
+
+        return None
 
 
+    @staticmethod
+    def _first_printable_line(lines):
+        if not lines:
+            return None
+        else:
+            for line in lines.splitlines():
+                if (line):
+                    return line
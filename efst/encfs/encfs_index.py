@@ -0,0 +1,224 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, time, queue, hashlib, sqlite3
+from collections import namedtuple
+from efst.encfs.encfs_cfg import EncFSCFG
+from efst.encfs.encfs_handler import EncFSHandler
+
+
+''' Searchable EncFS backend store paths index
+'''
+
+class EncFSIndex:
+    ''' On-disk (sqlite) index of the translated paths of an EncFS backend store,
+        along with the backend entries sizes and modification times
+        Refreshing the index only re-scans directories with changed mtimes,
+        so only new file entry names need to be translated
+    '''
+    IndexStats = namedtuple('IndexStats', ['entries', 'added', 'removed', 'scanned_dirs', 'total_dirs', 'elapsed'])
+    IndexEntry = namedtuple('IndexEntry', ['plain_path', 'cipher_path', 'is_dir', 'size', 'mtime'])
+
+    _COMMIT_INTERVAL = 1000
+
+    def __init__(self, index_dir_path, encfs_dir_path, enc_cfg_path = None, reverse = False):
+        self.encfs_dir_path = encfs_dir_path
+        self.reverse = reverse
+        self.enc_cfg_path = enc_cfg_path if enc_cfg_path else os.path.join(encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME)
+
+        backend_digest = hashlib.sha256(os.path.realpath(encfs_dir_path).encode('utf-8')).hexdigest()
+        self.index_path = os.path.join(index_dir_path, '{}.db'.format(backend_digest[:32]))
+
+    @property
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def refresh(self, pwd, full = False, workers = None, quiet = False):
+        ''' Creates or incrementally refreshes the index
+            Returns the IndexStats, or None if the index could not be created
+        '''
+        start = time.time()
+        with open(self.enc_cfg_path, 'rb') as cfg_file:
+            cfg_digest = hashlib.sha256(cfg_file.read()).hexdigest()
+
+        try:
+            conn = self._connect(create = True)
+        except (OSError, sqlite3.Error) as e:
+            if not quiet:
+                print('Error while opening the index: {}'.format(e))
+            return None
+        try:
+            # a different conf/key file means different names, start over
+            if full or self._meta(conn, 'cfg_digest') != cfg_digest:
+                with conn:
+                    conn.execute('DELETE FROM entries')
+                    conn.execute('DELETE FROM dirs')
+                    conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('cfg_digest', cfg_digest))
+
+            # plaintext backends of reversed entries get encoded, ciphertext ones decoded
+            translate_many = EncFSHandler.encode_many if self.reverse else EncFSHandler.decode_many
+            def translate_dir(rel_paths):
+                return dict(translate_many(encfs_dir_path = self.encfs_dir_path, enc_cfg_path = self.enc_cfg_path,
+                                                        filenames = rel_paths, pwd = pwd, quiet = quiet))
+
+            added, removed, scanned_dirs, total_dirs = self._walk(conn, translate_dir, workers, quiet = quiet)
+            entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        finally:
+            conn.close()
+
+        return self.IndexStats(entries, added, removed, scanned_dirs, total_dirs, time.time() - start)
+
+    def locate(self, pattern, ignore_case = False, limit = None):
+        ''' Yields IndexEntry tuples for PlainText paths matching a pattern
+            Patterns with no wildcards are matched as substrings of the path,
+            otherwise as shell-style globs against the full path
+        '''
+        if not self.exists:
+            return
+        if not any(wildcard in pattern for wildcard in '*?'):
+            pattern = '*{}*'.format(self._glob_escape(pattern))
+        # for reversed entries, the backend store paths are the PlainText ones
+        plain_column, cipher_column = ('path', 'translated_path') if self.reverse else ('translated_path', 'path')
+        query = 'LOWER({}) GLOB ?' if ignore_case else '{} GLOB ?'
+        if ignore_case:
+            pattern = pattern.lower()
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute('SELECT {0}, {1}, is_dir, size, mtime FROM entries '
+                                    'WHERE translated_path IS NOT NULL AND {2} ORDER BY {0} LIMIT ?'.format(
+                                            plain_column, cipher_column, query.format(plain_column)),
+                                                                        (pattern, limit if limit else -1))
+            for row in cursor:
+                yield self.IndexEntry(row[0], row[1], bool(row[2]), row[3], row[4])
+        finally:
+            conn.close()
+
+    # Helpers
+    def _connect(self, create = False):
+        if create:
+            os.makedirs(os.path.dirname(self.index_path), mode = 0o700, exist_ok = True)
+            # the index holds plaintext names, keep it private
+            os.close(os.open(self.index_path, os.O_WRONLY | os.O_CREAT, 0o600))
+        conn = sqlite3.connect(self.index_path)
+        if create:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+                conn.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER)')
+                conn.execute('CREATE TABLE IF NOT EXISTS entries (path TEXT PRIMARY KEY, parent TEXT, '
+                                        'translated_path TEXT, is_dir INTEGER, size INTEGER, mtime REAL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent)')
+        return conn
+
+    @staticmethod
+    def _meta(conn, key):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _walk(self, conn, translate_dir, workers, quiet = False):
+        ''' Walks the backend directories over a worker pool, same as EncFSHandler.backend_tree
+            Directories with unchanged mtimes are not scanned, and only the names not already
+            in the index get translated. All index updates happen on the calling thread
+        '''
+        skip_paths = set((os.path.join(self.encfs_dir_path, EncFSCFG.DEFAULT_CFG_FNAME), self.enc_cfg_path))
+        processed_dirs = queue.Queue()
+        def process_dir(rel_dir_path, known_mtime_ns, known_entries):
+            mtime_ns, dir_entries, translated = None, None, {}
+            try:
+                mtime_ns = os.stat(os.path.join(self.encfs_dir_path, rel_dir_path)).st_mtime_ns
+                if mtime_ns != known_mtime_ns:
+                    dir_entries = []
+                    with os.scandir(os.path.join(self.encfs_dir_path, rel_dir_path)) as it:
+                        for dir_entry in it:
+                            if dir_entry.path in skip_paths:
+                                continue
+                            rel_path = os.path.join(rel_dir_path, dir_entry.name) if rel_dir_path else dir_entry.name
+                            stat = dir_entry.stat(follow_symlinks = False)
+                            dir_entries.append((rel_path, dir_entry.is_dir(follow_symlinks = False),
+                                                                            stat.st_size, stat.st_mtime))
+                    # translate the new names, and retry the ones that failed before
+                    new_paths = [rel_path for rel_path, *_ in dir_entries
+                                                if not known_entries.get(rel_path, (None,))[0]]
+                    if new_paths:
+                        translated = translate_dir(new_paths)
+            except OSError as e:
+                mtime_ns = dir_entries = None
+                if not quiet:
+                    print('Error while reading directory: {}'.format(e))
+            finally:
+                processed_dirs.put((rel_dir_path, mtime_ns, known_entries, dir_entries, translated))
+
+        known_dirs = dict(conn.execute('SELECT path, mtime_ns FROM dirs'))
+        def submit(executor, rel_dir_path):
+            known_entries = {row[0]: (row[1], bool(row[2])) for row in conn.execute(
+                                'SELECT path, translated_path, is_dir FROM entries WHERE parent = ?', (rel_dir_path,))}
+            executor.submit(process_dir, rel_dir_path, known_dirs.get(rel_dir_path), known_entries)
+
+        added = removed = scanned_dirs = total_dirs = 0
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers = workers or os.cpu_count()) as executor:
+            submit(executor, '')
+            pending_dirs = 1
+            while pending_dirs:
+                rel_dir_path, mtime_ns, known_entries, dir_entries, translated = processed_dirs.get()
+                pending_dirs -= 1
+                total_dirs += 1
+                if mtime_ns is None:
+                    # could not read, keep what is already there
+                    continue
+
+                if dir_entries is None:
+                    # unchanged directory, descend into the known sub-directories
+                    sub_dirs = [rel_path for rel_path, (translated_path, is_dir) in known_entries.items()
+                                                                                if is_dir and translated_path]
+                else:
+                    scanned_dirs += 1
+                    scanned_paths = set(rel_path for rel_path, *_ in dir_entries)
+                    for rel_path in set(known_entries) - scanned_paths:
+                        removed += self._remove_entry(conn, rel_path)
+                    rows = []
+                    for rel_path, is_dir, size, mtime in dir_entries:
+                        if rel_path not in known_entries:
+                            added += 1
+                        translated_path = known_entries.get(rel_path, (None,))[0] or translated.get(rel_path)
+                        rows.append((rel_path, rel_dir_path, translated_path, is_dir, size, mtime))
+                    conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)', rows)
+                    # directories with un-translatable entries are re-scanned on the next refresh
+                    if all(row[2] for row in rows):
+                        conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)', (rel_dir_path, mtime_ns))
+                    else:
+                        conn.execute('DELETE FROM dirs WHERE path = ?', (rel_dir_path,))
+                    sub_dirs = [row[0] for row in rows if row[3] and row[2]]
+
+                for rel_path in sorted(sub_dirs):
+                    submit(executor, rel_path)
+                    pending_dirs += 1
+                if total_dirs % self._COMMIT_INTERVAL == 0:
+                    conn.commit()
+        conn.commit()
+
+        return added, removed, scanned_dirs, total_dirs
+
+    @staticmethod
+    def _remove_entry(conn, rel_path):
+        ''' Removes an entry along with everything indexed under it
+        '''
+        sub_path_pattern = '{}{}*'.format(EncFSIndex._glob_escape(rel_path), os.sep)
+        removed = conn.execute('DELETE FROM entries WHERE path = ? OR path GLOB ?',
+                                                                (rel_path, sub_path_pattern)).rowcount
+        conn.execute('DELETE FROM dirs WHERE path = ? OR path GLOB ?', (rel_path, sub_path_pattern))
+        return removed
+
+    @staticmethod
+    def _glob_escape(path):
+        return ''.join('[{}]'.format(char) if char in '*?[' else char for char in path)
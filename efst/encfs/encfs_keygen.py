@@ -0,0 +1,134 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os
+from collections import namedtuple
+from efst.encfs.encfs_cfg import EncFSCFG, EncFSCfgFile, EncFSCipherAlg, EncFSNameAlg
+from efst.utils.efst_utils import strtobool
+from efst.encfs.encfs_codec import EncFSCipher, EncFSNameCodec, EncFSCodecNotSupported
+
+
+''' In-process EncFS conf/key files generation
+'''
+
+class EncFSKeyGenerator:
+    ''' Generates EncFS v6 conf/key files from EncFS configuration entries,
+        without running encfs: a random volume key gets wrapped with the PBKDF2-derived user key
+        and serialized the same way EncFS does it
+    '''
+    KDFCalibration = namedtuple('KDFCalibration', ['kdf_iterations', 'kdf_duration', 'rate'])
+
+    SALT_BYTES = 20
+    BLOCK_MAC_BYTES = 8
+    DEFAULT_KDF_DURATION = 500
+    MIN_KDF_ITERATIONS = 1000
+    CREATOR = 'EFST'
+
+    @staticmethod
+    def available():
+        ''' Checks if in-process conf/key files generation is available
+        '''
+        return EncFSNameCodec.available()
+
+    @classmethod
+    def calibrate_kdf(cls, cfg_entry, kdf_duration = None):
+        ''' Benchmarks PBKDF2 on the current machine for the key size of a configuration entry,
+            proposing the number of iterations that takes about the desired KDF duration (ms)
+        '''
+        kdf_duration = int(kdf_duration or cls.DEFAULT_KDF_DURATION)
+        cipher_name, key_size = cls._cipher_settings(cfg_entry)
+        _, iterations, elapsed = EncFSCipher.timed_pbkdf2(os.urandom(cls.SALT_BYTES).hex(), os.urandom(cls.SALT_BYTES),
+                                                    key_size // 8 + EncFSCipher.BLOCK_SIZES[cipher_name], kdf_duration)
+        rate = iterations / elapsed
+        return cls.KDFCalibration(max(cls.MIN_KDF_ITERATIONS, int(rate * kdf_duration / 1000)), kdf_duration, rate)
+
+    @classmethod
+    def kdf_iterations(cls, cfg_entry):
+        ''' Number of PBKDF2 iterations for new conf/key files of a configuration entry,
+            either the stored one or calibrated on the spot
+        '''
+        if cfg_entry.kdfIterations:
+            return int(cfg_entry.kdfIterations)
+        return cls.calibrate_kdf(cfg_entry, cfg_entry.kdfDuration).kdf_iterations
+
+    @classmethod
+    def cfg_file(cls, cfg_entry, pwd, kdf_iterations = None, kdf_duration = None):
+        ''' Builds a new EncFSCfgFile for a configuration entry
+            Unless the number of PBKDF2 iterations is given or stored with the configuration entry,
+            it is calibrated to the desired KDF duration (ms)
+        '''
+        if not cls.available():
+            raise EncFSCodecNotSupported('The "cryptography" package is required for in-process conf/key generation')
+        cipher_name, key_size = cls._cipher_settings(cfg_entry)
+        try:
+            kdf_iterations = int(kdf_iterations or cfg_entry.kdfIterations or 0)
+            kdf_duration = int(kdf_duration or cfg_entry.kdfDuration or cls.DEFAULT_KDF_DURATION)
+            name_alg = int(cfg_entry.nameAlg)
+            block_size = int(cfg_entry.blockSize)
+            chained_name_iv, unique_iv = strtobool(cfg_entry.chainedNameIV), strtobool(cfg_entry.uniqueIV)
+            block_mac_bytes = cls.BLOCK_MAC_BYTES if strtobool(cfg_entry.blockMACBytes) else 0
+            block_mac_rand_bytes, allow_holes = int(cfg_entry.blockMACRandBytes), strtobool(cfg_entry.allowHoles)
+        except (TypeError, ValueError) as e:
+            raise EncFSCodecNotSupported('Invalid EncFS configuration entry: {}'.format(e))
+        cipher_alg = EncFSCipherAlg(int(cfg_entry.cipherAlg))
+        if not EncFSNameAlg.iface_name(name_alg):
+            raise EncFSCodecNotSupported('Filename encoding not supported: {}'.format(name_alg))
+        if block_size not in EncFSCipherAlg.block_sizes(cipher_alg):
+            raise EncFSCodecNotSupported('Block size not supported: {}'.format(block_size))
+
+        cipher = EncFSCipher(cipher_name, key_size)
+        salt = os.urandom(cls.SALT_BYTES)
+        if kdf_iterations:
+            user_key = cipher.key_from_password(pwd, salt, kdf_iterations)
+        else:
+            user_key, kdf_iterations = cipher.timed_key_from_password(pwd, salt, kdf_duration)
+
+        return EncFSCfgFile(version = EncFSCfgFile.CFG_VERSION, creator = cls.CREATOR,
+                            cipher_name = cipher_name, cipher_version = EncFSCipherAlg.iface_version(cipher_alg),
+                            name_alg = EncFSNameAlg.iface_name(name_alg),
+                            name_version = EncFSNameAlg.iface_version(name_alg),
+                            key_size = key_size, block_size = block_size,
+                            unique_iv = bool(unique_iv), chained_name_iv = bool(chained_name_iv),
+                            external_iv_chaining = False,
+                            block_mac_bytes = block_mac_bytes, block_mac_rand_bytes = block_mac_rand_bytes,
+                            allow_holes = bool(allow_holes),
+                            encoded_key = cipher.write_key(cipher.new_key(), user_key), salt = salt,
+                            kdf_iterations = kdf_iterations, desired_kdf_duration = kdf_duration)
+
+    @classmethod
+    def create_cfg_file(cls, cfg_entry, pwd, cfg_target_path, kdf_iterations = None, kdf_duration = None):
+        ''' Generates a new conf/key file at a given target path
+            If the target path is a directory, the default conf/key file name is used
+            Returns the written EncFSCfgFile
+        '''
+        if os.path.isdir(cfg_target_path):
+            cfg_target_path = os.path.join(cfg_target_path, EncFSCFG.DEFAULT_CFG_FNAME)
+        cfg_file = cls.cfg_file(cfg_entry, pwd, kdf_iterations = kdf_iterations, kdf_duration = kdf_duration)
+        cfg_file.write(cfg_target_path)
+        return cfg_file
+
+    # Helpers
+    @classmethod
+    def _cipher_settings(cls, cfg_entry):
+        ''' Cipher interface name and key size of a configuration entry
+        '''
+        try:
+            cipher_alg, key_size = int(cfg_entry.cipherAlg), int(cfg_entry.keySize)
+        except (TypeError, ValueError) as e:
+            raise EncFSCodecNotSupported('Invalid EncFS configuration entry: {}'.format(e))
+        cipher_name = EncFSCipherAlg.iface_name(cipher_alg)
+        if not cipher_name:
+            raise EncFSCodecNotSupported('Cipher algorithm not supported: {}'.format(cipher_alg))
+        if key_size not in EncFSCipherAlg.key_sizes(EncFSCipherAlg(cipher_alg)):
+            raise EncFSCodecNotSupported('Key size not supported: {}'.format(key_size))
+        return cipher_name, key_size
@@ -0,0 +1,55 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os
+from efst.encfs.encfs_cfg import EncFSCFG
+from efst.encfs.encfs_cmd import EncFSCommands
+from efst.utils.efst_utils import run_cmd, run_cmd_lines
+
+
+''' EncFS Commands Session
+'''
+
+class EncFSSession:
+    ''' Runs EncFS commands for a given volume
+        The session carries its own conf/key file path, handed over to the commands
+        via a per-process environment instead of os.environ.
+        With no conf/key file path, ENCFS6_CONFIG is cleared so that
+        the default conf/key file in the backend folder gets used
+    '''
+    def __init__(self, encfs_dir_path, enc_cfg_path = None):
+        self.encfs_dir_path = encfs_dir_path
+        self.enc_cfg_path = enc_cfg_path
+
+        self.env = dict(os.environ)
+        if enc_cfg_path:
+            self.env[EncFSCFG.ENCFS_CONFIG] = enc_cfg_path
+        else:
+            self.env.pop(EncFSCFG.ENCFS_CONFIG, None)
+
+    def run_cmd(self, cmd, timeout = None, cancel = None):
+        return run_cmd(cmd.argv, timeout = timeout, env = self._cmd_env(cmd), input = cmd.input, cancel = cancel)
+
+    def run_cmd_lines(self, cmd, lines, timeout = None, cancel = None):
+        return run_cmd_lines(cmd.argv, lines, env = self._cmd_env(cmd), timeout = timeout, cancel = cancel)
+
+    def run_expectant_cmd(self, cmd, cfg_entry, pwd, timeout = None, cancel = None):
+        return EncFSCommands.run_expectant_cmd(cmd, cfg_entry, pwd, env = self._cmd_env(cmd),
+                                                                        timeout = timeout, cancel = cancel)
+
+    def expectant_pwd(self, cmd, pwd, timeout = None, cancel = None):
+        return EncFSCommands.expectant_pwd(cmd, pwd, env = self._cmd_env(cmd), timeout = timeout, cancel = cancel)
+
+    # Helpers
+    def _cmd_env(self, cmd):
+        return dict(self.env, **cmd.env) if cmd.env else self.env
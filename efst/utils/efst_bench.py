@@ -0,0 +1,151 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, time, random
+from collections import namedtuple, OrderedDict
+
+
+''' File System I/O Benchmark
+'''
+
+class FSBenchmark:
+    ''' Runs file system workloads in a folder, e.g. a mounted EncFS volume:
+        sequential write / read, random reads and small files create / stat / delete
+        Before reading back, written files are dropped from the page cache where supported,
+        so that reads go through the file system rather than the cache
+    '''
+    WorkloadResult = namedtuple('WorkloadResult', ['workload', 'ops', 'size', 'elapsed', 'latencies'])
+
+    SEQ_WRITE, SEQ_READ, RANDOM_READ = 'seq_write', 'seq_read', 'random_read'
+    FILE_CREATE, FILE_STAT, FILE_DELETE = 'file_create', 'file_stat', 'file_delete'
+    WORKLOADS = (SEQ_WRITE, SEQ_READ, RANDOM_READ, FILE_CREATE, FILE_STAT, FILE_DELETE)
+
+    DEFAULT_FILE_SIZE_MB = 64
+    DEFAULT_SMALL_FILES = 500
+    DEFAULT_RANDOM_READS = 2000
+    CHUNK_SIZE = 1024 * 1024
+    READ_SIZE = 4096
+    SMALL_FILE_SIZE = 1024
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, dir_path, file_size_mb = DEFAULT_FILE_SIZE_MB,
+                            small_files = DEFAULT_SMALL_FILES, random_reads = DEFAULT_RANDOM_READS):
+        self.dir_path = dir_path
+        self.file_size = file_size_mb * 1024 * 1024
+        self.small_files = small_files
+        self.random_reads = random_reads
+
+    def run(self):
+        ''' Runs all workloads, returning their WorkloadResults
+        '''
+        bench_path = os.path.join(self.dir_path, 'efst_bench.dat')
+        results = [self.seq_write(bench_path), self.seq_read(bench_path), self.random_read(bench_path)]
+        os.remove(bench_path)
+        results.extend(self.small_files_ops(os.path.join(self.dir_path, 'efst_bench_files')))
+        return results
+
+    # Workloads
+    def seq_write(self, path):
+        chunk, latencies = os.urandom(self.CHUNK_SIZE), []
+        start = time.perf_counter()
+        with open(path, 'wb', buffering = 0) as bench_file:
+            for _ in range(self.file_size // self.CHUNK_SIZE):
+                latencies.append(self._timed(bench_file.write, chunk))
+            os.fsync(bench_file.fileno())
+        return self.WorkloadResult(self.SEQ_WRITE, len(latencies), self.file_size,
+                                                            time.perf_counter() - start, latencies)
+
+    def seq_read(self, path):
+        self._drop_cache(path)
+        latencies = []
+        start = time.perf_counter()
+        with open(path, 'rb', buffering = 0) as bench_file:
+            while True:
+                read_start = time.perf_counter()
+                if not bench_file.read(self.CHUNK_SIZE):
+                    break
+                latencies.append(time.perf_counter() - read_start)
+        return self.WorkloadResult(self.SEQ_READ, len(latencies), self.file_size,
+                                                            time.perf_counter() - start, latencies)
+
+    def random_read(self, path):
+        self._drop_cache(path)
+        offsets = [random.randrange(0, max(1, self.file_size - self.READ_SIZE)) for _ in range(self.random_reads)]
+        latencies = []
+        start = time.perf_counter()
+        with open(path, 'rb', buffering = 0) as bench_file:
+            for offset in offsets:
+                read_start = time.perf_counter()
+                bench_file.seek(offset)
+                bench_file.read(self.READ_SIZE)
+                latencies.append(time.perf_counter() - read_start)
+        return self.WorkloadResult(self.RANDOM_READ, len(latencies), len(latencies) * self.READ_SIZE,
+                                                            time.perf_counter() - start, latencies)
+
+    def small_files_ops(self, dir_path):
+        os.mkdir(dir_path)
+        paths = [os.path.join(dir_path, 'f{:06d}'.format(idx)) for idx in range(self.small_files)]
+        data = os.urandom(self.SMALL_FILE_SIZE)
+
+        def create(path):
+            with open(path, 'wb') as small_file:
+                small_file.write(data)
+
+        results = []
+        for workload, op in ((self.FILE_CREATE, create), (self.FILE_STAT, os.stat), (self.FILE_DELETE, os.remove)):
+            start = time.perf_counter()
+            latencies = [self._timed(op, path) for path in paths]
+            results.append(self.WorkloadResult(workload, len(latencies),
+                                                    len(latencies) * self.SMALL_FILE_SIZE if op is create else 0,
+                                                                        time.perf_counter() - start, latencies))
+        os.rmdir(dir_path)
+        return results
+
+    # Reporting
+    @classmethod
+    def metrics(cls, result):
+        ''' Throughput and latency percentiles of a workload result
+        '''
+        elapsed = max(result.elapsed, 1e-9)
+        metrics = OrderedDict([('mb_s', round(result.size / elapsed / (1024 * 1024), 2)),
+                               ('ops_s', round(result.ops / elapsed, 1))])
+        latencies = sorted(result.latencies)
+        for percentile in cls.PERCENTILES:
+            metrics['p{}_ms'.format(percentile)] = round(cls._percentile(latencies, percentile) * 1000, 3)
+        return metrics
+
+    # Helpers
+    @staticmethod
+    def _timed(op, *args):
+        start = time.perf_counter()
+        op(*args)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _percentile(sorted_values, percentile):
+        if not sorted_values:
+            return 0.0
+        idx = int(round(percentile / 100 * (len(sorted_values) - 1)))
+        return sorted_values[idx]
+
+    @staticmethod
+    def _drop_cache(path):
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,187 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, sys, time, shutil, tempfile
+from collections import OrderedDict
+from efst.config.efst_config import config_handler
+from efst.utils.efst_utils import run_cmd, encfs_version, efst_version, CmdProcessingError
+
+
+''' EFST CLI latency benchmark
+'''
+
+class CLIBenchmark:
+    ''' Measures the latency of EFST CLI invocations, each run in a separate process:
+        cold / warm startup of the entry points, name encode / decode and mount / unmount cycles
+        Cold runs start with an empty bytecode cache, as the first run after installing or upgrading EFST would.
+        Results can be compared against a stored baseline, flagging regressions
+    '''
+    ENTRY_POINTS = ('efst', 'efsc', 'efsm', 'efsb')
+    STARTUP_COMMANDS = OrderedDict([('help', ['-h']), ('version', ['version'])])
+
+    DEFAULT_RUNS = 10
+    DEFAULT_THRESHOLD = 20
+    DEFAULT_TIMEOUT = 60
+    BENCH_FILE_NAME = 'efst_bench_name.txt'
+    # metric compared against the baseline
+    REGRESSION_METRIC = 'p50_ms'
+    PERCENTILES = (50, 95)
+
+    def __init__(self, runs = DEFAULT_RUNS, entry_names = None, timeout = DEFAULT_TIMEOUT):
+        self.runs = runs
+        self.entry_names = entry_names or []
+        self.timeout = timeout
+
+    def run(self, quiet = False):
+        ''' Runs all benchmarks, returning their results by benchmark name
+        '''
+        results = OrderedDict()
+        for entry_point in self.ENTRY_POINTS:
+            for cmd_name, cmd_args in self.STARTUP_COMMANDS.items():
+                if not quiet:
+                    print('Benchmarking: {0} {1}'.format(entry_point, ' '.join(cmd_args)), flush = True)
+                cold, warm = self.startup(entry_point, cmd_args)
+                results['startup.{0}.{1}.cold'.format(entry_point, cmd_name)] = cold
+                results['startup.{0}.{1}.warm'.format(entry_point, cmd_name)] = warm
+
+        for entry_name in self.entry_names:
+            if not quiet:
+                print('Benchmarking: {}'.format(entry_name), flush = True)
+            encoded, encode_result = self.encode(entry_name)
+            results['encode.{}'.format(entry_name)] = encode_result
+            if encoded:
+                results['decode.{}'.format(entry_name)] = self.decode(entry_name, encoded)
+            results['mount_cycle.{}'.format(entry_name)] = self.mount_cycle(entry_name)
+        return results
+
+    # Benchmarks
+    def startup(self, entry_point, cmd_args):
+        ''' Cold and warm startup latencies of an entry point command
+        '''
+        with tempfile.TemporaryDirectory() as pycache_dir:
+            env = dict(os.environ, PYTHONPYCACHEPREFIX = pycache_dir)
+            cold = self._timed_runs(lambda: self._run(entry_point, cmd_args, env = env), 1)
+            warm = self._timed_runs(lambda: self._run(entry_point, cmd_args, env = env), self.runs)
+        return cold, warm
+
+    def encode(self, entry_name):
+        ''' Name encoding latency of a registered entry, returning the encoded name along with the results
+        '''
+        encoded = []
+        def encode():
+            output = self._run('efsb', ['encode', '-en', entry_name, '-fn', self.BENCH_FILE_NAME])
+            encoded.append(self._cmd_result(output, 'Encoded:'))
+        results = self._timed_runs(encode, self.runs)
+        return (encoded[0] if encoded else None), results
+
+    def decode(self, entry_name, encoded):
+        ''' Name decoding latency of a registered entry
+        '''
+        def decode():
+            output = self._run('efsb', ['decode', '-en', entry_name, '-fn', encoded])
+            self._cmd_result(output, 'Decoded:')
+        return self._timed_runs(decode, self.runs)
+
+    def mount_cycle(self, entry_name):
+        ''' Mount + unmount cycle time of a registered entry
+            As efsm reports mount errors rather than failing, the mount point gets checked as well
+        '''
+        mount_dir_path = config_handler.entry(entry_name).mount_dir_path
+        def mount_cycle():
+            try:
+                output = self._run('efsm', ['mount', '-en', entry_name])
+                if not os.path.ismount(mount_dir_path):
+                    raise CmdProcessingError(output)
+            finally:
+                self._run('efsm', ['umount', '-en', entry_name])
+        return self._timed_runs(mount_cycle, self.runs)
+
+    # Reporting
+    @staticmethod
+    def metadata():
+        ''' Environment the benchmark was run in
+        '''
+        import platform
+        encfs_ver = encfs_version(quiet = True)
+        return OrderedDict([('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S%z')),
+                            ('efst_version', efst_version()),
+                            ('encfs_version', encfs_ver if encfs_ver >= 0 else None),
+                            ('python_version', platform.python_version()),
+                            ('python_executable', sys.executable),
+                            ('platform', platform.platform()),
+                            ('machine', platform.machine()),
+                            ('cpu_count', os.cpu_count()),
+                            ('hostname', platform.node())])
+
+    @classmethod
+    def regressions(cls, results, baseline_results, threshold = DEFAULT_THRESHOLD):
+        ''' Benchmarks slower than in the baseline by more than the threshold (%),
+            as (name, baseline, current, change %) tuples
+        '''
+        regressions = []
+        for name, result in results.items():
+            baseline = baseline_results.get(name, {}).get(cls.REGRESSION_METRIC)
+            current = result.get(cls.REGRESSION_METRIC)
+            if not baseline or current is None:
+                continue
+            change = (current - baseline) / baseline * 100
+            if change > threshold:
+                regressions.append((name, baseline, current, round(change, 1)))
+        return regressions
+
+    # Helpers
+    def _run(self, entry_point, cmd_args, env = None):
+        ''' Runs an entry point command, with no stdin so that password prompts fail rather than wait
+        '''
+        return run_cmd(self._launcher(entry_point) + cmd_args, timeout = self.timeout, env = env, input = '')
+
+    @staticmethod
+    def _launcher(entry_point):
+        ''' The installed console script, or the entry point module run by the current interpreter
+        '''
+        script_path = shutil.which(entry_point)
+        if script_path:
+            return [script_path]
+        return [sys.executable, '-c',
+                    'from efst.cli.{0}.{0}_dispatch import main; main()'.format(entry_point)]
+
+    @staticmethod
+    def _cmd_result(output, prefix):
+        for line in output.splitlines():
+            if line.startswith(prefix):
+                return line[len(prefix):].strip()
+        raise CmdProcessingError(output)
+
+    @classmethod
+    def _timed_runs(cls, op, runs):
+        ''' Runs an operation a number of times, returning its latency metrics
+        '''
+        latencies, failures = [], 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            try:
+                op()
+            except (CmdProcessingError, OSError):
+                failures += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+        metrics = OrderedDict([('runs', runs), ('failures', failures)])
+        latencies.sort()
+        if latencies:
+            metrics['min_ms'] = round(latencies[0] * 1000, 1)
+            metrics['mean_ms'] = round(sum(latencies) / len(latencies) * 1000, 1)
+            for percentile in cls.PERCENTILES:
+                idx = int(round(percentile / 100 * (len(latencies) - 1)))
+                metrics['p{}_ms'.format(percentile)] = round(latencies[idx] * 1000, 1)
+        return metrics
@@ -0,0 +1,122 @@
+# coding=utf8
+## Copyright (c) 2015 Arseniy Kuznetsov
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation; either version 2
+## of the License, or (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import os, re, errno, select, threading
+from collections import namedtuple
+
+
+''' Mount table
+'''
+
+class MountTable:
+    ''' Index of the mounted filesystems, read from /proc/self/mountinfo
+        Mount checks are dictionary lookups, and never stat into the mount points,
+        so that they do not hang on unresponsive FUSE mounts.
+        The index is re-read whenever the kernel signals a mount table change,
+        or on demand. Where mountinfo is not available, falls back to os.path.ismount
+    '''
+    MountEntry = namedtuple('MountEntry', ['mount_point', 'fstype', 'source', 'options', 'super_options'])
+
+    MOUNTINFO_PATH = '/proc/self/mountinfo'
+
+    _lock = threading.Lock()
+    _entries = None
+    _mountinfo_file = None
+    _mountinfo_poll = None
+
+    @classmethod
+    def available(cls):
+        return os.path.exists(cls.MOUNTINFO_PATH)
+
+    @classmethod
+    def refresh(cls):
+        ''' Re-reads the mount table
+        '''
+        with cls._lock:
+            cls._read()
+
+    @classmethod
+    def entries(cls, refresh = False):
+        ''' Mount point -> MountEntry index of the mounted filesystems
+        '''
+        with cls._lock:
+            if refresh or cls._entries is None or cls._changed():
+                cls._read()
+            return cls._entries
+
+    @classmethod
+    def entry(cls, path, refresh = False):
+        ''' MountEntry for a mount point, or None if not mounted
+        '''
+        return cls.entries(refresh = refresh).get(os.path.abspath(path))
+
+    @classmethod
+    def is_mount(cls, path, refresh = False):
+        ''' Checks if a path is a mount point
+        '''
+        if not cls.available():
+            if os.path.ismount(path):
+                return True
+            try:
+                os.lstat(path)
+            except OSError as e:
+                # stale FUSE mounts are still mounted
+                return e.errno == errno.ENOTCONN
+            return False
+        return cls.entry(path, refresh = refresh) is not None
+
+    @classmethod
+    def mount_point(cls, path, refresh = False):
+        ''' The mount point portion of a path, or None for the root filesystem
+        '''
+        path = os.path.abspath(path)
+        while path != os.path.sep:
+            if cls.is_mount(path, refresh = refresh):
+                return path
+            path = os.path.dirname(path)
+            refresh = False
+        return None
+
+    # Helpers
+    @classmethod
+    def _read(cls):
+        entries = {}
+        with open(cls.MOUNTINFO_PATH, encoding = 'utf-8', errors = 'surrogateescape') as mountinfo:
+            for line in mountinfo:
+                # id parent_id major:minor root mount_point options [optional fields] - fstype source super_options
+                fields, _, fs_fields = line.rstrip('\n').partition(' - ')
+                fields, fs_fields = fields.split(' '), fs_fields.split(' ')
+                if len(fields) < 6 or len(fs_fields) < 3:
+                    continue
+                mount_point = cls._unescape(fields[4])
+                entries[mount_point] = cls.MountEntry(mount_point, fs_fields[0], cls._unescape(fs_fields[1]),
+                                                                fields[5].split(','), fs_fields[2].split(','))
+        cls._entries = entries
+
+        if cls._mountinfo_poll is None and hasattr(select, 'poll'):
+            # the kernel flags mount table changes as an exceptional condition on an open mountinfo,
+            # once per change
+            cls._mountinfo_file = open(cls.MOUNTINFO_PATH, 'rb')
+            cls._mountinfo_poll = select.poll()
+            cls._mountinfo_poll.register(cls._mountinfo_file, select.POLLERR | select.POLLPRI)
+
+    @classmethod
+    def _changed(cls):
+        if cls._mountinfo_poll is None:
+            return True
+        return bool(cls._mountinfo_poll.poll(0))
+
+    @staticmethod
+    def _unescape(field):
+        # spaces, tabs, newlines and backslashes come octal-escaped
+        return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), field)
@@ -11,20 +11,21 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os, sys, shlex, tempfile, shutil, re
-import subprocess, hashlib
-import keyring, getpass
-from collections import Iterable
+import os, sys, time, shlex, tempfile, shutil, re, signal
+import subprocess, hashlib, threading
+import getpass
+from collections import Iterable, deque
 from contextlib import contextmanager
+from efst.utils.efst_mounts import MountTable
 
 ''' Utilities / Helpers
 '''
 
 @contextmanager
-def temp_dir(quiet = True):
+def temp_dir(quiet = True, dir = None):
     ''' Temp dir context manager
     '''
-    tmp_dir = tempfile.mkdtemp()
+    tmp_dir = tempfile.mkdtemp(dir = dir)
     try:
         yield tmp_dir
     finally:
@@ -38,18 +39,176 @@ def temp_dir(quiet = True):
 class CmdProcessingError(Exception):
     pass
 
-def run_cmd(cmd, shell = False):
+class CmdTimeoutError(CmdProcessingError):
+    pass
+
+class CmdCancelledError(CmdProcessingError):
+    pass
+
+class CmdWatchdog:
+    ''' Kills a running command along with its process group,
+        once it runs out of time or gets cancelled via a threading.Event
+        Touching the watchdog pushes the deadline back, e.g. on command output,
+        and pausing it stops the deadline until the next touch, e.g. while the command waits for input
+    '''
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, pid, timeout = None, cancel = None):
+        self.pid, self.timeout, self.cancel = pid, timeout, cancel
+        self.expired = self.cancelled = False
+        self._deadline = time.time() + timeout if timeout else None
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.timeout or self.cancel:
+            self._thread = threading.Thread(target = self._watch, daemon = True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._done.set()
+        if self._thread:
+            self._thread.join()
+
+    def touch(self):
+        if self.timeout:
+            self._deadline = time.time() + self.timeout
+
+    def pause(self):
+        self._deadline = None
+
+    def check(self):
+        ''' Raises if the command was killed by the watchdog
+        '''
+        if self.cancelled:
+            raise CmdCancelledError('Cancelled')
+        if self.expired:
+            raise CmdTimeoutError('Timed out after {}s'.format(self.timeout))
+
+    def _watch(self):
+        while True:
+            deadline = self._deadline
+            wait_time = self.POLL_INTERVAL if self.cancel or not deadline else deadline - time.time()
+            if self._done.wait(max(0, wait_time)):
+                return
+            deadline = self._deadline
+            if self.cancel and self.cancel.is_set():
+                self.cancelled = True
+            elif deadline and time.time() >= deadline:
+                self.expired = True
+            else:
+                continue
+            kill_process_group(self.pid)
+            return
+
+def kill_process_group(pid):
+    ''' Kills a process started in a new session, along with its children
+    '''
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+def run_cmd(cmd, shell = False, timeout = None, env = None, input = None, cancel = None):
     ''' Runs shell commands in a separate process
+        Without a shell, the command can also be given as an argv list.
+        The input string, if any, is fed to the process via stdin.
+        With a timeout or a cancel event, the process is killed once it runs out of time
+        or gets cancelled, raising CmdTimeoutError / CmdCancelledError
     '''
-    if not shell:
+    if not shell and isinstance(cmd, str):
         cmd = shlex.split(cmd)
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell = shell)
-    output = proc.communicate()[0].decode('utf-8')
+    proc = subprocess.Popen(cmd, stdin = subprocess.PIPE if input is not None else None,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell = shell, env = env,
+                                                                    start_new_session = bool(timeout or cancel))
+    # with a shell, the watchdog makes sure its children go as well
+    with CmdWatchdog(proc.pid, timeout = timeout, cancel = cancel) as watchdog:
+        output = proc.communicate(input = input.encode('utf-8') if input is not None else None)[0].decode('utf-8')
+    watchdog.check()
     if proc.returncode != 0:
         raise CmdProcessingError(output)
     return output
 
-def get_last_digit_from_shell_cmd(cmd):
+def run_cmd_lines(cmd, lines, shell = False, env = None, timeout = None, cancel = None):
+    ''' Runs a line-oriented filter command in a separate process,
+        feeding it input lines via stdin and yielding (input line, output line) pairs
+        as soon as the results are available
+        With a timeout, the process is killed once it produces no output for that long
+        while input lines are pending. Waiting for the next input line does not count
+    '''
+    if not shell and isinstance(cmd, str):
+        cmd = shlex.split(cmd)
+    with tempfile.TemporaryFile() as errors:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errors,
+                                        shell = shell, env = env, start_new_session = bool(timeout or cancel))
+
+        with CmdWatchdog(proc.pid, timeout = timeout, cancel = cancel) as watchdog:
+            # the pending input lines, matched against the output in FIFO order
+            # the deadline only runs while there are any
+            pending, pending_lock, fed = deque(), threading.Lock(), threading.Event()
+            watchdog.pause()
+            def feed_lines():
+                try:
+                    for line in lines:
+                        with pending_lock:
+                            pending.append(line)
+                            watchdog.touch()
+                        proc.stdin.write('{}\n'.format(line).encode('utf-8'))
+                        proc.stdin.flush()
+                except BrokenPipeError:
+                    pass
+                finally:
+                    try:
+                        proc.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                    # all fed, the command should be done in time
+                    with pending_lock:
+                        fed.set()
+                        watchdog.touch()
+            feeder = threading.Thread(target = feed_lines, daemon = True)
+            feeder.start()
+
+            try:
+                for output_line in proc.stdout:
+                    with pending_lock:
+                        if not pending:
+                            break
+                        line = pending.popleft()
+                        if pending or fed.is_set():
+                            watchdog.touch()
+                        else:
+                            watchdog.pause()
+                    yield line, output_line.decode('utf-8').rstrip('\n')
+            except GeneratorExit:
+                # the caller is done, no need to wait for the rest
+                proc.kill()
+                raise
+            finally:
+                proc.stdout.close()
+                proc.wait()
+
+        watchdog.check()
+        if proc.returncode != 0:
+            errors.seek(0)
+            raise CmdProcessingError(errors.read().decode('utf-8'))
+
+def strtobool(value):
+    ''' Converts a truth value string to 1 / 0, raising ValueError for anything else
+        (same as distutils.util.strtobool, without importing distutils)
+    '''
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    elif value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    raise ValueError('invalid truth value {!r}'.format(value))
+
+def get_last_digit_from_shell_cmd(cmd, quiet = False):
     try:
         cmd_output = run_cmd(cmd, shell = True)
     except CmdProcessingError as e:
@@ -67,9 +226,27 @@ def get_last_digit(str_to_search):
     else:
         return -1
 
-def encfs_version():
+def encfs_version(quiet = False):
     cmd = 'encfs --version'
-    return get_last_digit_from_shell_cmd(cmd)
+    return get_last_digit_from_shell_cmd(cmd, quiet = quiet)
+
+def efst_version():
+    ''' Installed EFST version, or None if EFST is not installed
+        Only reads the EFST distribution metadata, without resolving any requirements
+    '''
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution('efst').version
+        except pkg_resources.DistributionNotFound:
+            return None
+    try:
+        return version('efst')
+    except PackageNotFoundError:
+        return None
 
 
 class FSHelper:
@@ -83,7 +260,9 @@ class FSHelper:
             path = os.path.expanduser(path)
             path = os.path.expandvars(path)
             path = os.path.abspath(path)
-            path = os.path.realpath(path)
+            # mount table paths are already real, no need to stat into a (possibly hung) mount
+            if not MountTable.is_mount(path):
+                path = os.path.realpath(path)
 
         # for files, check that the parent dir exists
         if check_parent_path:
@@ -97,12 +276,7 @@ class FSHelper:
     def mountpoint(path):
         ''' The mount point portion of a path
         '''
-        path = FSHelper.full_path(path)
-        while path != os.path.sep:
-            if os.path.ismount(path):
-                return path
-            path = os.path.realpath(os.path.join(path, os.pardir))
-        return path if path != os.path.sep else None
+        return MountTable.mount_point(FSHelper.full_path(path))
 
     @staticmethod
     def move_FS_entry(orig_path, target_path,
@@ -200,7 +374,7 @@ class PasswordHandler:
         new_pwd = False
 
         if pwd_entry_name:
-            pwd = keyring.get_password(pwd_entry_name, getpass.getuser())
+            pwd = cls.stored_pwd(pwd_entry_name)
 
         if not pwd:
             pwd = cls.get_pwd_input(confirm = confirm)
@@ -208,12 +382,20 @@ class PasswordHandler:
 
         return pwd, new_pwd
 
+    @staticmethod
+    def stored_pwd(pwd_entry_name):
+        ''' Gets password from an OS-specific keyring, or None if not there
+        '''
+        import keyring
+        return keyring.get_password(pwd_entry_name, getpass.getuser())
+
     @staticmethod
     def store_pwd(pwd, pwd_entry_name):
         ''' Store password into an OS-specific keyring
         '''
         if not (pwd and pwd_entry_name):
             return
+        import keyring
         keyring.set_password(pwd_entry_name, getpass.getuser(), pwd)
 
     @staticmethod
@@ -221,6 +403,7 @@ class PasswordHandler:
         ''' Deletes password from an OS-specific keyring
         '''
         if pwd_entry_name:
+            import keyring
             pwd = keyring.get_password(pwd_entry_name, getpass.getuser())
             if pwd:
                 keyring.delete_password(pwd_entry_name, getpass.getuser())
@@ -45,6 +45,11 @@ setup(
 
     install_requires = ['configobj>=5.0.6', 'keyring>=5.3', 'pexpect>=3.3'],
 
+    extras_require = {
+        # in-process EncFS filename coding
+        'codec': ['cryptography>=2.0'],
+    },
+
     test_suite = 'tests.efst_test_suite',
 
     entry_points={'console_scripts': [
@@ -15,7 +15,7 @@ import shutil, pexpect
 from efst.utils.efst_utils import FSHelper
 from efst.config.efst_config import config_handler, EFSTConfigHandler, EFSTConfigKeys
 from efst.config.efst_config import ConfigEntries, EntryTypes
-from efst.encfs.encfs_handler import EncFSHandler
+from efst.encfs.encfs_cfg import EncFSCFG
 
 class EFSTTest(unittest.TestCase):
     src_dir = bckp_dir = None
@@ -30,13 +30,17 @@ class EFSTTest(unittest.TestCase):
         if not os.path.exists(cls.src_dir):
             os.makedirs(cls.src_dir)
         cls.resetDataFromBackup()
-        cls.encfs_config_backup = EncFSHandler._encfs6_config_backup_and_reset(cls.test_encfs_config)
+        cls.encfs_config_backup = os.environ.get(EncFSCFG.ENCFS_CONFIG)
+        os.environ[EncFSCFG.ENCFS_CONFIG] = cls.test_encfs_config
 
     @classmethod
     def tearDownClass(cls):
         if cls.encfs_config_backup:
             print('will be restoring the ENCFS6_CONFIG env. var to its initial value:\n\t{}'.format(cls.encfs_config_backup))
-        EncFSHandler._encfs6_config_restore(cls.encfs_config_backup)
+        if cls.encfs_config_backup:
+            os.environ[EncFSCFG.ENCFS_CONFIG] = cls.encfs_config_backup
+        else:
+            os.environ.pop(EncFSCFG.ENCFS_CONFIG, None)
 
     @classmethod
     def resetDataFromBackup(cls, quiet = False):
@@ -12,11 +12,17 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os
+import os, tempfile
 from .test_efsb_base import EFSBTest
 from efst.utils.efst_utils import run_cmd, CmdProcessingError
-from efst.encfs.encfs_cfg import EncFSCFG
+from efst.encfs.encfs_cfg import EncFSCFG, EncFSCfgError
 from efst.encfs.encfs_handler import EncFSHandler
+from efst.encfs.encfs_codec import EncFSNameCodec, EncFSCipher, EncFSCodecError
+from efst.encfs.encfs_keygen import EncFSKeyGenerator
+from efst.encfs.encfs_cache import EncFSNameCache
+from efst.encfs.encfs_cmd import EncFSCommands
+from efst.encfs.encfs_session import EncFSSession
+from efst.encfs.encfs_agent_client import EncFSAgentClient, EncFSAgentCodec, EncFSAgentError
 from efst.config.efst_config import config_handler, EFSTConfigHandler, EntryTypes
 
 
@@ -62,6 +68,219 @@ class EFSBTests(EFSBTest):
 
         self._unregister_test_entry()
 
+    def test_encode_batch(self):
+        #return ##
+        self._register_test_entry()
+
+        names_path = os.path.join(self.src_dir, 'test_names.txt')
+        with open(names_path, 'w') as names_file:
+            names_file.write('{0}\n{0}\n'.format(self._decoded_name_string()))
+
+        cmd = 'efsb encode -en {0} -if {1}'.format(self.test_entry_name_shortcut, names_path)
+        output = run_cmd(cmd)
+        self.assertEqual(output.split().count(self._encoded_name_string()), 2)
+
+        self._unregister_test_entry()
+
+    def test_decode_batch(self):
+        #return ##
+        self._register_test_entry()
+
+        names_path = os.path.join(self.src_dir, 'test_names.txt')
+        with open(names_path, 'w') as names_file:
+            names_file.write('{0}\n{0}\n'.format(self._encoded_name_string()))
+
+        cmd = 'efsb decode -en {0} -if {1}'.format(self.test_entry_name_shortcut, names_path)
+        output = run_cmd(cmd)
+        self.assertEqual(output.split().count(self._decoded_name_string()), 2)
+
+        self._unregister_test_entry()
+
+    def test_ls(self):
+        #return ##
+        self._register_test_entry()
+
+        cmd = 'efsb ls -en {0} -wn 2'.format(self.test_entry_name_shortcut)
+        output = run_cmd(cmd)
+        self.assertIn('Listed 0 entries', output)
+
+        self._unregister_test_entry()
+
+    def test_index_locate(self):
+        #return ##
+        self._register_test_entry()
+
+        cmd = 'efsb index -en {0} -wn 2'.format(self.test_entry_name_shortcut)
+        output = run_cmd(cmd)
+        self.assertIn('Indexed 0 entries', output)
+
+        cmd = 'efsb locate -en {0} {1}'.format(self.test_entry_name_shortcut, self._decoded_name_string())
+        output = run_cmd(cmd)
+        self.assertEqual(output.strip(), '')
+
+        self._unregister_test_entry()
+
+    def test_cruft(self):
+        #return ##
+        self._register_test_entry()
+
+        cruft_path = os.path.join(self.src_dir, 'test_cruft.txt')
+        cmd = 'efsb cruft -en {0} -rs -cf {1}'.format(self.test_entry_name_shortcut, cruft_path)
+        output = run_cmd(cmd)
+        self.assertIn('Found 0 un-decodable entries', output)
+        self.assertTrue(os.path.exists(cruft_path))
+
+        # unchanged directories are not re-scanned
+        cmd = 'efsb cruft -en {0}'.format(self.test_entry_name_shortcut)
+        output = run_cmd(cmd)
+        self.assertIn('1 unchanged ones skipped', output)
+
+        self._unregister_test_entry()
+
+    def test_name_codec(self):
+        #return ##
+        if not EncFSNameCodec.available():
+            self.skipTest('in-process name codec not available')
+
+        codec = EncFSNameCodec(self.test_entry.encfs_config_path, self.test_password)
+        self.assertEqual(codec.encode(self._decoded_name_string()), self._encoded_name_string())
+        self.assertEqual(codec.decode(self._encoded_name_string()), self._decoded_name_string())
+
+        path = 'a_dir/{}'.format(self._decoded_name_string())
+        self.assertEqual(codec.decode(codec.encode(path)), path)
+
+        with self.assertRaises(EncFSCodecError):
+            EncFSNameCodec(self.test_entry.encfs_config_path, 'a_wrong_pwd')
+
+    def test_backend_cfg(self):
+        #return ##
+        backend_cfg = EncFSHandler.backend_cfg(encfs_dir_path = self.test_entry.encfs_dir_path,
+                                                enc_cfg_path = self.test_entry.encfs_config_path)
+        self.assertEqual(backend_cfg.cipher_name, 'ssl/aes')
+        self.assertEqual(backend_cfg.key_size, 256)
+        self.assertEqual(backend_cfg.block_size, 1024)
+        self.assertEqual(backend_cfg.name_alg, 'nameio/stream')
+        self.assertEqual(backend_cfg.kdf_iterations, 155666)
+        self.assertEqual(len(backend_cfg.salt), 20)
+        self.assertFalse(backend_cfg.chained_name_iv)
+
+        # parsed conf/key files are cached
+        self.assertIs(EncFSCFG.read_cfg_file(self.test_entry.encfs_config_path), backend_cfg)
+
+        # settings check for newly created conf/key files
+        cfg_entry = EncFSCFG.EncFSCfgEntry('1', '256', '1024', '4', 'n', 'n', '0', '0', 'y')
+        self.assertTrue(EncFSHandler._cfg_file_matches(self.test_entry.encfs_config_path, cfg_entry))
+        self.assertFalse(EncFSHandler._cfg_file_matches(self.test_entry.encfs_config_path,
+                                                                    cfg_entry._replace(nameAlg = '3')))
+
+        with tempfile.TemporaryDirectory() as cfg_dir:
+            # written conf/key files never replace existing ones
+            cfg_path = os.path.join(cfg_dir, EncFSCFG.DEFAULT_CFG_FNAME)
+            backend_cfg.write(cfg_path)
+            with open(cfg_path, 'rb') as cfg_file:
+                cfg_data = cfg_file.read()
+            with self.assertRaises(EncFSCfgError):
+                backend_cfg._replace(salt = os.urandom(20)).write(cfg_path)
+            with open(cfg_path, 'rb') as cfg_file:
+                self.assertEqual(cfg_file.read(), cfg_data)
+            self.assertEqual(os.listdir(cfg_dir), [EncFSCFG.DEFAULT_CFG_FNAME])
+
+    def test_key_generator(self):
+        #return ##
+        if not EncFSKeyGenerator.available():
+            self.skipTest('in-process conf/key generation not available')
+
+        # wrapping the unwrapped test volume key reproduces the test conf/key file key data
+        backend_cfg = EncFSCFG.read_cfg_file(self.test_entry.encfs_config_path)
+        cipher = EncFSCipher(backend_cfg.cipher_name, backend_cfg.key_size)
+        user_key = cipher.key_from_password(self.test_password, backend_cfg.salt, backend_cfg.kdf_iterations)
+        self.assertEqual(cipher.write_key(cipher.read_key(backend_cfg.encoded_key, user_key), user_key),
+                                                                                    backend_cfg.encoded_key)
+
+        with tempfile.TemporaryDirectory() as cfg_dir:
+            # written conf/key files read back the same
+            cfg_path = os.path.join(cfg_dir, 'rewritten.xml')
+            backend_cfg.write(cfg_path)
+            self.assertEqual(EncFSCFG.read_cfg_file(cfg_path), backend_cfg)
+
+            # generated conf/key files
+            cfg_entry = EncFSCFG.EncFSCfgEntry('1', '192', '2048', '1', 'y', 'n', 'n', '0', 'y')
+            EncFSKeyGenerator.create_cfg_file(cfg_entry, self.test_password, cfg_dir, kdf_iterations = 1000)
+            cfg_path = os.path.join(cfg_dir, EncFSCFG.DEFAULT_CFG_FNAME)
+            self.assertTrue(EncFSHandler._cfg_file_matches(cfg_path, cfg_entry))
+            self.assertTrue(EncFSCFG.read_cfg_file(cfg_path).chained_name_iv)
+
+            codec = EncFSNameCodec(cfg_path, self.test_password)
+            path = 'a_dir/{}'.format(self._decoded_name_string())
+            self.assertEqual(codec.decode(codec.encode(path)), path)
+            with self.assertRaises(EncFSCodecError):
+                EncFSNameCodec(cfg_path, 'a_wrong_pwd')
+
+            # PBKDF2 iterations get calibrated to the desired KDF duration
+            cfg_file = EncFSKeyGenerator.cfg_file(cfg_entry, self.test_password, kdf_duration = 50)
+            self.assertGreaterEqual(cfg_file.kdf_iterations, 1000)
+            self.assertEqual(cfg_file.desired_kdf_duration, 50)
+
+    def test_name_cache(self):
+        #return ##
+        with tempfile.TemporaryDirectory() as cache_dir:
+            name_cache = EncFSNameCache(cache_dir, self.test_entry.encfs_config_path, self.test_password)
+            name_cache.store(self._decoded_name_string(), self._encoded_name_string())
+            name_cache.save()
+
+            name_cache = EncFSNameCache(cache_dir, self.test_entry.encfs_config_path, self.test_password)
+            self.assertEqual(name_cache.encoded(self._decoded_name_string()), self._encoded_name_string())
+            self.assertEqual(name_cache.decoded(self._encoded_name_string()), self._decoded_name_string())
+            self.assertEqual(name_cache.stats.hits, 2)
+
+            # a wrong password can not read the cache
+            name_cache = EncFSNameCache(cache_dir, self.test_entry.encfs_config_path, 'a_wrong_pwd')
+            self.assertIsNone(name_cache.encoded(self._decoded_name_string()))
+
+    def test_session(self):
+        #return ##
+        session = EncFSSession(self.test_entry.encfs_dir_path, self.test_entry.encfs_config_path)
+        cmd = EncFSCommands.Cmd(['printenv', EncFSCFG.ENCFS_CONFIG], {}, None)
+        self.assertEqual(session.run_cmd(cmd).strip(), self.test_entry.encfs_config_path)
+
+        # passwords are not passed via the command line
+        cmd = EncFSCommands.build_ctl_encode_cmd(self.test_entry.encfs_dir_path,
+                                                    self.test_entry.encfs_config_path, None, self.test_password)
+        self.assertFalse(any(self.test_password in arg for arg in cmd.argv))
+        self.assertEqual(session.run_cmd(cmd._replace(argv = ['sh', '-c', EncFSCommands.EXTPASS_CMD])).strip(),
+                                                                                            self.test_password)
+
+        # no conf/key file path means the default one in the backend folder
+        session = EncFSSession(self.test_entry.encfs_dir_path)
+        self.assertNotIn(EncFSCFG.ENCFS_CONFIG, session.env)
+
+        # sessions leave the process environment alone
+        self.assertEqual(os.environ[EncFSCFG.ENCFS_CONFIG], self.test_encfs_config)
+
+    def test_agent(self):
+        #return ##
+        if not EncFSNameCodec.available():
+            self.skipTest('in-process name codec not available')
+
+        with tempfile.TemporaryDirectory() as agent_dir:
+            client = EncFSAgentClient(os.path.join(agent_dir, 'efst-agent.sock'))
+            self.assertFalse(client.running())
+
+            with self.assertRaises(EncFSAgentError):
+                client.unlock(self.test_entry_name, self.test_entry.encfs_dir_path,
+                                        self.test_entry.encfs_config_path, 'a_wrong_pwd')
+            client.unlock(self.test_entry_name, self.test_entry.encfs_dir_path,
+                                        self.test_entry.encfs_config_path, self.test_password)
+            self.assertTrue(client.unlocked(self.test_entry.encfs_dir_path, self.test_entry.encfs_config_path))
+
+            codec = EncFSAgentCodec(client, os.path.realpath(self.test_entry.encfs_config_path))
+            self.assertEqual(codec.encode(self._decoded_name_string()), self._encoded_name_string())
+            self.assertEqual(codec.decode(self._encoded_name_string()), self._decoded_name_string())
+
+            self.assertEqual(client.lock(), 1)
+            self.assertFalse(client.unlocked(self.test_entry.encfs_dir_path, self.test_entry.encfs_config_path))
+
+
 
     # Helpers
     @staticmethod
@@ -12,10 +12,13 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os
+import os, tempfile
 from .test_efsc_base import EFSCTest
 from efst.utils.efst_utils import run_cmd, CmdProcessingError
 from efst.encfs.encfs_cfg import EncFSCFG
+from efst.encfs.encfs_keygen import EncFSKeyGenerator
+from efst.utils.efst_bench import FSBenchmark
+from efst.encfs.encfs_advisor import EncFSBlockAdvisor
 from efst.config.efst_config import config_handler, EFSTConfigHandler
 
 
@@ -89,6 +92,74 @@ class EFSCTests(EFSCTest):
 
         self._unregister_test_cfg_entry()
 
+    def test_calibrate_entry(self):
+        #return ##
+        self._register_test_cfg_entry()
+
+        cmd = 'efsc calibrate -ce {} -tl 50 -dr'.format(self.test_cfg_entry_name_shortcut)
+        output = run_cmd(cmd)
+        self.assertIn('Proposed:', output)
+        config_handler.read_from_disk()
+        self.assertIsNone(config_handler.encfs_cfg_entry(self.test_cfg_entry_name).kdfIterations)
+
+        cmd = 'efsc calibrate -ce {} -tl 50'.format(self.test_cfg_entry_name_shortcut)
+        run_cmd(cmd)
+        config_handler.read_from_disk()
+        cfg_entry = config_handler.encfs_cfg_entry(self.test_cfg_entry_name)
+        self.assertGreaterEqual(int(cfg_entry.kdfIterations), EncFSKeyGenerator.MIN_KDF_ITERATIONS)
+        self.assertEqual(int(cfg_entry.kdfDuration), 50)
+
+        # new keys honour the stored number of iterations
+        if EncFSKeyGenerator.available():
+            self._remove_test_key()
+            cfg_file = EncFSKeyGenerator.create_cfg_file(cfg_entry, 'a_bogus_pwd', self.src_dir)
+            self.assertEqual(cfg_file.kdf_iterations, int(cfg_entry.kdfIterations))
+            self._remove_test_key()
+
+        self._unregister_test_cfg_entry()
+
+    def test_bench_workloads(self):
+        #return ##
+        with tempfile.TemporaryDirectory() as bench_dir:
+            results = FSBenchmark(bench_dir, file_size_mb = 2, small_files = 20, random_reads = 50).run()
+            self.assertEqual([result.workload for result in results], list(FSBenchmark.WORKLOADS))
+            self.assertEqual(os.listdir(bench_dir), [])
+
+        metrics = FSBenchmark.metrics(results[0])
+        self.assertEqual(results[0].size, 2 * 1024 * 1024)
+        self.assertGreater(metrics['mb_s'], 0)
+        self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+
+    def test_advise_entry(self):
+        #return ##
+        with tempfile.TemporaryDirectory() as target_dir:
+            for idx in range(20):
+                with open(os.path.join(target_dir, 'f{}'.format(idx)), 'wb') as target_file:
+                    target_file.write(os.urandom(idx * 100))
+            tree_sample = EncFSBlockAdvisor.sample_tree(target_dir)
+            self.assertEqual(tree_sample.files, 20)
+            self.assertEqual(tree_sample.total_size, sum(idx * 100 for idx in range(20)))
+            self.assertEqual(EncFSBlockAdvisor.access_pattern(tree_sample), EncFSBlockAdvisor.RANDOM)
+
+            candidates = EncFSBlockAdvisor.candidates(tree_sample, config_handler.encfs_cfg_entry())
+            self.assertEqual(max(candidate.score for candidate in candidates), candidates[0].score)
+            overheads = {(candidate.block_size, candidate.block_mac): candidate.storage_overhead
+                                                                                for candidate in candidates}
+            for (block_size, block_mac), overhead in overheads.items():
+                if block_mac:
+                    self.assertGreaterEqual(overhead, overheads[(block_size, False)])
+
+            cmd = 'efsc advise -tp {0} -bh off -ce {1}'.format(target_dir, self.test_cfg_entry_name)
+            output = run_cmd(cmd)
+            self.assertIn('Recommended:', output)
+
+        config_handler.read_from_disk()
+        cfg_entry = config_handler.encfs_cfg_entry(self.test_cfg_entry_name)
+        self.assertEqual(cfg_entry.blockMACBytes, 'n')
+        self.assertIn(int(cfg_entry.blockSize), EncFSBlockAdvisor.CANDIDATE_BLOCK_SIZES + (tree_sample.fs_block_size,))
+
+        self._unregister_test_cfg_entry()
+
     def test_unregister_entry(self):
         #return ##
         self._register_test_cfg_entry()
@@ -12,12 +12,14 @@
 ## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 ## GNU General Public License for more details.
 
-import os
+import os, json, time, threading
 from .test_efsm_base import EFSMTest
-from efst.utils.efst_utils import run_cmd, CmdProcessingError
+from efst.utils.efst_utils import run_cmd, run_cmd_lines, CmdProcessingError, CmdTimeoutError, CmdCancelledError
 from efst.encfs.encfs_cfg import EncFSCFG
 from efst.encfs.encfs_handler import EncFSHandler
-from efst.config.efst_config import config_handler, EntryTypes, EFSTConfigKeys
+from efst.utils.efst_mounts import MountTable
+from efst.utils.efst_clibench import CLIBenchmark
+from efst.config.efst_config import config_handler, EntryTypes, EFSTConfigKeys, CmdTimeouts
 
 
 class EFSMTests(EFSMTest):
@@ -52,6 +54,30 @@ class EFSMTests(EFSMTest):
         config_handler.read_from_disk()
         self._unregister_test_entry()
 
+    def test_create_manifest(self):
+        #return ##
+        entry_names = ['{0}_{1}'.format(self.test_entry_name, idx) for idx in range(3)]
+        manifest_path = os.path.join(self.src_dir, 'manifest.json')
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump({'entries': [{'entry_name': entry_name,
+                                    'backend_path': os.path.join('created', entry_name),
+                                    'reverse': True,
+                                    'pwd_source': 'env:EFST_TEST_PWD'} for entry_name in entry_names] +
+                                  [{'entry_name': entry_names[0], 'backend_path': 'a_duplicate'}]}, manifest_file)
+
+        output = run_cmd('efsm create -mf {}'.format(manifest_path),
+                                        env = dict(os.environ, EFST_TEST_PWD = self.test_password))
+        self.assertIn('Created 3 of 4 entries', output)
+
+        # all registered at once
+        config_handler.read_from_disk()
+        for entry_name in entry_names:
+            entry = config_handler.entry(entry_name)
+            self.assertEqual(entry.entry_type, EntryTypes.ReversedCipherText)
+            self.assertEqual(entry.encfs_dir_path, os.path.join(self.src_dir, 'created', entry_name))
+            self.assertTrue(os.path.exists(entry.encfs_config_path))
+            config_handler.unregister_entry(entry_name, quiet = True)
+
     def test_register(self):
         #return ##
         self._unregister_test_entry()
@@ -105,6 +131,65 @@ class EFSMTests(EFSMTest):
         self._umount_test_entry()
         self._unregister_test_entry()
 
+    def test_status(self):
+        #return ##
+        self._register_test_entry()
+
+        cmd = 'efsm status -js'
+        output = run_cmd(cmd)
+        statuses = {status['entry_name']: status for status in json.loads(output)}
+        self.assertIn(self.test_entry_name, statuses)
+        self.assertFalse(statuses[self.test_entry_name]['mounted'])
+        self.assertEqual(statuses[self.test_entry_name]['mount_dir_path'], self.test_entry.mount_dir_path)
+
+        self._unregister_test_entry()
+
+    def test_probe_mounts(self):
+        #return ##
+        results = {result.name: result for result in EncFSHandler.probe_mounts(
+                                                    [('root', os.path.sep), ('missing', self.test_entry.mount_dir_path)],
+                                                                                        slow_threshold = 60)}
+        self.assertEqual(results['root'].state, EncFSHandler.PROBE_HEALTHY)
+        self.assertEqual(results['missing'].state, EncFSHandler.PROBE_STALE)
+
+    def test_cmd_timeouts(self):
+        #return ##
+        start = time.time()
+        with self.assertRaises(CmdTimeoutError):
+            run_cmd(['sleep', '10'], timeout = 0.5)
+        cancel = threading.Event()
+        threading.Timer(0.5, cancel.set).start()
+        with self.assertRaises(CmdCancelledError):
+            run_cmd(['sleep', '10'], cancel = cancel)
+        self.assertLess(time.time() - start, 5)
+
+        self.assertEqual(config_handler.cmd_timeout(CmdTimeouts.UMOUNT, 3), 3)
+        self.assertIsNone(config_handler.cmd_timeout(CmdTimeouts.UMOUNT, 0))
+        self.assertTrue(config_handler.cmd_timeout(CmdTimeouts.UMOUNT))
+
+    def test_cmd_lines_timeouts(self):
+        #return ##
+        def slow_lines():
+            # pauses for longer than the timeout, waiting for input should not count
+            yield 'first'
+            time.sleep(1.5)
+            yield 'second'
+        self.assertEqual(list(run_cmd_lines(['cat'], slow_lines(), timeout = 0.5)),
+                                                                [('first', 'first'), ('second', 'second')])
+
+        with self.assertRaises(CmdTimeoutError):
+            list(run_cmd_lines(['sh', '-c', 'read line; echo $line; sleep 10'], ['first', 'second'], timeout = 0.5))
+
+    def test_mount_table(self):
+        #return ##
+        if not MountTable.available():
+            self.skipTest('mountinfo not available')
+
+        self.assertTrue(MountTable.is_mount(os.path.sep))
+        self.assertEqual(MountTable.entry(os.path.sep).mount_point, os.path.sep)
+        self.assertFalse(MountTable.is_mount(self.test_entry.mount_dir_path))
+        self.assertEqual(MountTable._unescape(r'a\040dir'), 'a dir')
+
     def test_umount(self):
         #return ##
         self._register_test_entry()
@@ -127,6 +212,26 @@ class EFSMTests(EFSMTest):
                                         and not os.path.ismount(self.test_entry.mount_dir_path))
         self._unregister_test_entry()
 
+    def test_cli_bench(self):
+        #return ##
+        cold, warm = CLIBenchmark(runs = 2).startup('efsm', ['-h'])
+        self.assertEqual((cold['runs'], cold['failures']), (1, 0))
+        self.assertEqual((warm['runs'], warm['failures']), (2, 0))
+        self.assertLessEqual(warm['min_ms'], warm['p95_ms'])
+
+    def test_cli_bench_regressions(self):
+        #return ##
+        results = {'startup.efsm.help.warm': {'runs': 10, 'failures': 0, 'p50_ms': 120.0},
+                   'startup.efsm.version.warm': {'runs': 10, 'failures': 0, 'p50_ms': 100.0},
+                   'encode.test': {'runs': 10, 'failures': 10}}
+        baseline = {'startup.efsm.help.warm': {'p50_ms': 60.0},
+                    'startup.efsm.version.warm': {'p50_ms': 95.0},
+                    'encode.test': {'p50_ms': 10.0},
+                    'unknown': {'p50_ms': 1.0}}
+        self.assertEqual(CLIBenchmark.regressions(results, baseline, threshold = 20),
+                                                        [('startup.efsm.help.warm', 60.0, 120.0, 100.0)])
+        self.assertEqual(CLIBenchmark.regressions(results, baseline, threshold = 200), [])
+
 
 
     # Helpers